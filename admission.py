@@ -0,0 +1,122 @@
+# admission.py
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+class AdmissionRejected(Exception):
+    """포화 상태라 요청을 받지 않음 (429: 대기열 가득 참, 503: 대기 시간 초과)"""
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    동시 실행 한도 + 유한 대기열.
+    한도는 관측 지연으로 AIMD 조정: 목표 지연 이내로 끝나면 +1/limit, 넘거나 실패하면 ×backoff
+    (감소는 목표 지연 간격당 최대 1회라 한 번의 폭주에 한도가 바닥까지 떨어지지 않는다).
+    """
+    def __init__(self, name: str, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 max_queue: int = 32, queue_timeout: float = 5.0, target_latency: Optional[float] = None,
+                 backoff: float = 0.9):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.backoff = backoff
+
+        self.inflight = 0
+        self._waiters: deque = deque()
+        self._last_decrease = 0.0
+        self._avg_latency = target_latency or 1.0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def _retry_after(self) -> int:
+        """대기열이 빠지는 데 걸릴 대략의 시간(초)"""
+        waves = (len(self._waiters) + 1) / max(1.0, self.limit)
+        return max(1, math.ceil(self._avg_latency * waves))
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if fut.done():  # 타임아웃/취소된 대기자
+                continue
+            self.inflight += 1
+            fut.set_result(None)
+
+    async def acquire(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, self._retry_after(), f"{self.name}: 대기열이 가득 찼습니다.")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        granted = False
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+            granted = True
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise AdmissionRejected(503, self._retry_after(), f"{self.name}: 대기 시간이 초과되었습니다.")
+        finally:
+            if not granted:
+                if fut.done() and not fut.cancelled():
+                    # 슬롯을 넘겨받은 직후 취소됨 → 반납
+                    self.inflight -= 1
+                    self._wake()
+                else:
+                    try:
+                        self._waiters.remove(fut)
+                    except ValueError:
+                        pass
+        self.admitted += 1
+
+    def release(self, latency: float, ok: bool = True):
+        self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+        if self.target_latency is not None:
+            now = time.monotonic()
+            if not ok or latency > self.target_latency:
+                if now - self._last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self.inflight -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.release(time.monotonic() - start, ok)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_latency_ms": round(self._avg_latency * 1000, 1),
+        }
@@ -0,0 +1,206 @@
+# bench_vector_store.py
+"""
+numpy 백엔드와 FAISS 백엔드 비교 벤치마크 (임베딩 모델 없이 무작위 정규화 벡터 사용).
+
+  python bench_vector_store.py                          # 기본 크기들
+  python bench_vector_store.py --sizes 1000 10000 100000 --dim 512
+
+항목: import 시간(새 프로세스), 적재 시간, 검색 지연(p50, 스토어 API 기준 top-k), 저장/로드 시간,
+로드 후 벡터가 차지하는 메모리(memmap은 페이지 캐시라 제외).
+numpy는 float32 검색 사본(NUMPY_STORE_F32_CACHE=1) 사용 여부에 따라 "numpy"/"numpy_f16" 두 가지를 잰다.
+교차점 두 가지를 출력한다:
+  - 검색: FAISS 검색 p50이 numpy보다 10% 이상 빨라지는 문서 수 (서버처럼 오래 떠 있는 경우)
+  - 콜드 스타트: import + 로드 + 첫 검색 합계가 FAISS 쪽이 더 짧아지는 문서 수 (CLI 1회 실행)
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import numpy_store
+from docstore import load_faiss, save_faiss
+from numpy_store import NumpyVectorStore
+
+BACKENDS = ("numpy", "numpy_f16", "faiss")
+
+IMPORTS = {
+    "numpy": "from numpy_store import NumpyVectorStore",
+    "faiss": "from langchain_community.vectorstores import FAISS; import faiss",
+}
+
+
+class _NoEmbeddings(Embeddings):
+    """벤치마크는 벡터를 직접 넣으므로 임베딩 모델이 필요 없다"""
+    def embed_query(self, text):
+        raise RuntimeError("벤치마크에서는 임베딩을 쓰지 않습니다.")
+
+    def embed_documents(self, texts):
+        raise RuntimeError("벤치마크에서는 임베딩을 쓰지 않습니다.")
+
+
+def import_time(statement: str, repeat: int = 3) -> float:
+    """새 프로세스에서 import에 걸린 시간(ms)의 최솟값"""
+    code = f"import time; t = time.perf_counter(); {statement}; print((time.perf_counter() - t) * 1000)"
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+def random_unit_vectors(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    v = rng.standard_normal((n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _p50_ms(fn, queries: np.ndarray) -> float:
+    fn(queries[0])  # 워밍업
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def _dir_size_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6
+
+
+def _vector_ram_mb(store) -> float:
+    """검색용으로 힙에 올라 있는 벡터 크기 (numpy: float32 사본 + memmap이 아닌 행렬, FAISS: 인덱스)"""
+    if isinstance(store, NumpyVectorStore):
+        arrays = [store._cache, None if isinstance(store._vectors, np.memmap) else store._vectors]
+        return sum(a.nbytes for a in arrays if a is not None) / 1e6
+    return store.index.ntotal * store.index.d * 4 / 1e6
+
+
+def bench_size(n: int, dim: int, n_queries: int, k: int, batch: int, rng: np.random.Generator) -> Dict[str, Dict]:
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    vectors = random_unit_vectors(n, dim, rng)
+    queries = random_unit_vectors(n_queries, dim, rng)
+    texts = [f"doc {i}" for i in range(n)]
+    ids = [f"d{i}" for i in range(n)]
+    results = {}
+    f32_cache = numpy_store.F32_CACHE
+
+    for backend in BACKENDS:
+        numpy_store.F32_CACHE = backend == "numpy"
+        is_numpy = backend.startswith("numpy")
+        tmp = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+        try:
+            # 사연 추가처럼 batch개씩 나눠 적재
+            start = time.perf_counter()
+            if is_numpy:
+                store = NumpyVectorStore(_NoEmbeddings())
+            else:
+                store = FAISS.from_embeddings([(texts[0], vectors[0].tolist())], _NoEmbeddings(), ids=[ids[0]],
+                                              distance_strategy=DistanceStrategy.COSINE)
+            first = 0 if is_numpy else 1
+            for i in range(first, n, batch):
+                j = min(n, i + batch)
+                store.add_embeddings(list(zip(texts[i:j], vectors[i:j].tolist())), ids=ids[i:j])
+            add_s = time.perf_counter() - start
+
+            search_ms = _p50_ms(lambda q: store.similarity_search_with_score_by_vector(q.tolist(), k=k), queries)
+
+            start = time.perf_counter()
+            if is_numpy:
+                store.save_local(tmp)
+            else:
+                save_faiss(store, tmp)  # 서빙과 같은 형식 (index.<N>.faiss + docs.sqlite)
+            save_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if is_numpy:
+                loaded = NumpyVectorStore.load_local(tmp, _NoEmbeddings())
+            else:
+                loaded = load_faiss(tmp, _NoEmbeddings(), DistanceStrategy.COSINE)
+            load_s = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded.similarity_search_with_score_by_vector(queries[0].tolist(), k=k)  # float32 사본 생성 포함
+            first_query_ms = (time.perf_counter() - start) * 1000
+            loaded_ms = _p50_ms(lambda q: loaded.similarity_search_with_score_by_vector(q.tolist(), k=k), queries)
+
+            results[backend] = {
+                "add_s": round(add_s, 3),
+                "search_p50_ms": round(search_ms, 3),
+                "search_after_load_p50_ms": round(loaded_ms, 3),
+                "save_s": round(save_s, 3),
+                "load_s": round(load_s, 3),
+                "first_query_ms": round(first_query_ms, 3),
+                "disk_mb": round(_dir_size_mb(tmp), 2),
+                "vector_ram_mb": round(_vector_ram_mb(loaded), 2),
+            }
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    numpy_store.F32_CACHE = f32_cache
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="numpy / FAISS 벡터 백엔드 벤치마크")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 50000, 100000])
+    parser.add_argument("--dim", type=int, default=512, help="임베딩 차원 (distiluse-base-multilingual-cased-v2 = 512)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=8, help="검색 개수 (리트리버 기본 k*prefetch = 8)")
+    parser.add_argument("--batch", type=int, default=1000, help="add_embeddings 1회당 벡터 수")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    report = {
+        "import_ms": {backend: round(import_time(stmt), 1) for backend, stmt in IMPORTS.items()},
+        "dim": args.dim,
+        "k": args.k,
+        "sizes": {},
+    }
+    for n in args.sizes:
+        report["sizes"][n] = bench_size(n, args.dim, args.queries, args.k, args.batch, rng)
+    imp = report["import_ms"]
+    for r in report["sizes"].values():
+        for backend in BACKENDS:
+            stats = r[backend]
+            stats["cold_start_ms"] = round(imp["faiss" if backend == "faiss" else "numpy"]
+                                           + stats["load_s"] * 1000 + stats["first_query_ms"], 1)
+    search_cross: List[int] = [n for n, r in report["sizes"].items()
+                               if r["faiss"]["search_p50_ms"] * 1.1 < r["numpy"]["search_p50_ms"]]
+    cold_cross: List[int] = [n for n, r in report["sizes"].items()
+                             if r["faiss"]["cold_start_ms"] < r["numpy"]["cold_start_ms"]]
+    report["crossover_search_n"] = search_cross[0] if search_cross else None
+    report["crossover_cold_start_n"] = cold_cross[0] if cold_cross else None
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print("--------------------------------------------------")
+    print(f"import: numpy {imp['numpy']:.0f}ms | faiss {imp['faiss']:.0f}ms   (dim={args.dim}, k={args.k})")
+    print("검색 p50: numpy(float32 사본) / numpy_f16(memmap 직접) / faiss")
+    for n, r in report["sizes"].items():
+        a, h, b = r["numpy"], r["numpy_f16"], r["faiss"]
+        print(f"{n:>7}개 | 검색 {a['search_p50_ms']:>7.2f} / {h['search_p50_ms']:>7.2f} / {b['search_p50_ms']:>7.2f}ms"
+              f" | 적재 {a['add_s']:.2f} / {b['add_s']:.2f}s | 로드 {a['load_s']:.3f} / {b['load_s']:.3f}s"
+              f" | 디스크 {a['disk_mb']:.1f} / {b['disk_mb']:.1f}MB"
+              f" | 벡터 메모리 {a['vector_ram_mb']:.1f} / {h['vector_ram_mb']:.1f} / {b['vector_ram_mb']:.1f}MB"
+              f" | 콜드 스타트 {a['cold_start_ms']:.0f} / {b['cold_start_ms']:.0f}ms")
+    for key, label in (("crossover_search_n", "검색"), ("crossover_cold_start_n", "콜드 스타트")):
+        n = report[key]
+        print(f"교차점({label}): " + (f"문서 {n}개부터 FAISS가 유리" if n else "측정 범위에서는 numpy가 같거나 유리"))
+    print("--------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,60 +2,191 @@
 import google.generativeai as genai
 from typing import List, Dict, Any, Optional
 import os
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from prompts import SYSTEM_PROMPT, CONDENSE_QUESTION_PROMPT, QA_PROMPT
 from retriever import get_retriever_with_threshold
 from memory import get_memory
+from singleflight import SingleFlight, normalize_key
+from llm_client import GeminiClient
+from deadline import Deadline, StageBudgets
 
-class ConversationChain:
-    def __init__(self, vector_store=None):
-        # gemini 설정
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY 환경 변수가 설정되지 않았습니다.")
-        genai.configure(api_key=api_key, transport="rest")
-        
-        # Set up the model
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 1,
-            "top_k": 1,
-            "max_output_tokens": 2048,
-        }
-        
-        # safety_settings = [
-        #     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        #     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        #     {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        #     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        # ]
-        
+# 사용자에게 돌려주는 오류 응답 (부하 테스트 등에서 오류 판정에도 사용)
+GENERATION_ERROR_MESSAGE = "죄송합니다. 응답을 생성하는 중에 오류가 발생했습니다."
+CHAIN_ERROR_MESSAGE = "대화 처리 중에 오류가 발생했습니다. 다시 시도해 주세요."
+GENERATION_TIMEOUT_MESSAGE = "죄송합니다. 응답이 늦어지고 있어요. 잠시 후 다시 시도해 주세요."
+
+# 질문 변환과 동시에 원본 질문으로 미리 검색 (변환된 질문 임베딩이 충분히 가까우면 그 결과 재사용)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+SPECULATIVE_REUSE_SIMILARITY = float(os.getenv("SPECULATIVE_REUSE_SIMILARITY", "0.9"))
+
+# generate_content는 동기(블로킹) 호출 → 이벤트 루프를 막지 않도록 전용 스레드풀에서 실행
+_llm_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_MAX_WORKERS", "32")),
+    thread_name_prefix="llm",
+)
+
+
+def _create_gemini_model():
+    """
+    기본은 연결 풀/재시도/헤지를 갖춘 GeminiClient,
+    LLM_CLIENT=sdk면 기존 google-generativeai SDK(REST transport) 사용.
+    """
+    # gemini 설정
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY 환경 변수가 설정되지 않았습니다.")
+    
+    # Set up the model
+    generation_config = {
+        "temperature": 0.7,
+        "top_p": 1,
+        "top_k": 1,
+        "max_output_tokens": 2048,
+    }
+
+    if os.getenv("LLM_CLIENT", "pooled") != "sdk":
+        return GeminiClient(api_key, model_name="gemini-2.0-flash", generation_config=generation_config)
+
+    genai.configure(api_key=api_key, transport="rest")
+    
+    # safety_settings = [
+    #     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    #     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    #     {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    #     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    # ]
+    
+    try:
+        return genai.GenerativeModel(
+            model_name="gemini-2.0-flash",
+            generation_config=generation_config,
+            # safety_settings=safety_settings
+        )
+    except Exception as e:
+        print(f"Gemini 모델 초기화 중 오류 발생: {e}")
+        print("사용 가능한 모델 목록을 확인합니다...")
         try:
-            self.model = genai.GenerativeModel(
-                model_name="gemini-2.0-flash",
-                generation_config=generation_config,
-                # safety_settings=safety_settings
-            )
-        except Exception as e:
-            print(f"Gemini 모델 초기화 중 오류 발생: {e}")
-            print("사용 가능한 모델 목록을 확인합니다...")
-            try:
-                models = genai.list_models()
-                print("사용 가능한 모델:")
-                for model in models:
-                    print(f"- {model.name}")
-            except Exception as e2:
-                print(f"모델 목록 조회 중 오류 발생: {e2}")
-            raise
+            models = genai.list_models()
+            print("사용 가능한 모델:")
+            for model in models:
+                print(f"- {model.name}")
+        except Exception as e2:
+            print(f"모델 목록 조회 중 오류 발생: {e2}")
+        raise
+
+
+def _cosine_similarity(a, b) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    if a.shape != b.shape:  # 인덱스 전환 직후 다른 모델로 만든 임베딩끼리는 비교 불가 → 다시 검색
+        return 0.0
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / denom if denom > 0 else 0.0
+
+
+class ConversationChain:
+    def __init__(self, vector_store=None, model=None, retriever=None, budgets: Optional[StageBudgets] = None):
+        """
+        model / retriever를 넘기면 그대로 사용 (부하 테스트용 스텁 등).
+        budgets: 요청 마감/단계별 시간 예산 (기본은 환경 변수)
+        """
+        self.model = model if model is not None else _create_gemini_model()
+        self.budgets = budgets or StageBudgets.from_env()
         
         # self.chat = self.model.start_chat(history=[])
         self.memory = get_memory()
+        # 단계별 single-flight: 동일한 요청이 동시에 몰리면 진행 중인 실행 결과를 공유
+        self.llm_flight = SingleFlight("llm")
+        self.retrieval_flight = SingleFlight("retrieval")
+        self.speculation = {"started": 0, "reused_exact": 0, "reused_similar": 0, "rerun": 0, "failed": 0}
+        if retriever is not None:
+            self.retriever = retriever
+            return
         if vector_store is None:
             raise ValueError("Vector store가 초기화되지 않았습니다.")
         self.retriever = get_retriever_with_threshold(vector_store)
+
+    async def _generate(self, prompt: str, timeout: Optional[float] = None):
+        """
+        LLM 호출 (같은 프롬프트가 진행 중이면 그 결과를 공유).
+        timeout은 처음 실행을 시작한 요청의 남은 시간으로, 그 뒤로는 재시도하지 않는다.
+        """
+        if hasattr(self.model, "agenerate_content"):
+            # GeminiClient: 자체 스레드풀 + 재시도 + 헤지
+            call = lambda: self.model.agenerate_content(prompt, timeout=timeout)
+        else:
+            loop = asyncio.get_running_loop()
+            call = lambda: loop.run_in_executor(_llm_executor, self.model.generate_content, prompt)
+        return await self.llm_flight.do(normalize_key(prompt), call)
+
+    async def _retrieve(self, standalone_query: str):
+        """검색 (같은 독립 질문이 진행 중이면 그 결과를 공유)"""
+        return await self.retrieval_flight.do(
+            normalize_key(standalone_query),
+            lambda: self.retriever.ainvoke(standalone_query),
+        )
+
+    def _can_speculate(self) -> bool:
+        """임베딩/벡터 검색을 따로 호출할 수 있는 리트리버에서만 추측 검색"""
+        return (SPECULATIVE_RETRIEVAL
+                and hasattr(self.retriever, "aembed_query")
+                and hasattr(self.retriever, "asearch_by_vector"))
+
+    async def _retrieve_by_vector(self, text: str, embedding: List[float]):
+        """이미 계산한 임베딩으로 검색 (single-flight 키는 _retrieve와 같은 질문 텍스트)"""
+        return await self.retrieval_flight.do(
+            normalize_key(text),
+            lambda: self.retriever.asearch_by_vector(embedding),
+        )
+
+    async def _speculate(self, query: str):
+        """원본 질문으로 미리 검색 → (원본 질문 임베딩, 문서)"""
+        self.speculation["started"] += 1
+        embedding = await self.retriever.aembed_query(query)
+        docs = await self._retrieve_by_vector(query, embedding)
+        return embedding, docs
+
+    async def _resolve_speculation(self, query: str, standalone_query: str, speculation: asyncio.Future):
+        """변환된 질문이 원본과 같거나 임베딩이 충분히 가까우면 추측 검색 결과 재사용, 아니면 다시 검색"""
+        if normalize_key(standalone_query) == normalize_key(query):
+            _, docs = await speculation
+            self.speculation["reused_exact"] += 1
+            return docs
+
+        condensed_embedding, (raw_embedding, docs) = await asyncio.gather(
+            self.retriever.aembed_query(standalone_query), speculation)
+        similarity = _cosine_similarity(raw_embedding, condensed_embedding)
+        if similarity >= SPECULATIVE_REUSE_SIMILARITY:
+            self.speculation["reused_similar"] += 1
+            return docs
+        print(f"🔁 변환된 질문과 원본의 유사도 {similarity:.3f} → 다시 검색")
+        self.speculation["rerun"] += 1
+        return await self._retrieve_by_vector(standalone_query, condensed_embedding)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """단계별 single-flight 합류 수 및 검색 통계"""
+        stats = {"singleflight": {"llm": self.llm_flight.stats(), "retrieval": self.retrieval_flight.stats()}}
+        if hasattr(self.retriever, "get_stats"):
+            retriever_stats = self.retriever.get_stats()
+            stats["singleflight"]["embedding"] = retriever_stats.pop("embedding_singleflight", None)
+            stats["retriever"] = retriever_stats
+        if self._can_speculate():
+            stats["speculation"] = dict(self.speculation)
+        if hasattr(self.model, "stats"):
+            stats["llm_client"] = self.model.stats()
+        return stats
     
-    async def _get_relevant_documents(self, query: str) -> List[str]:
-        """검색을 위한 독립적인 질문으로 변환하고 관련 문서를 검색합니다."""
-        # 독립적인 질문으로 변환
+    async def _condense_question(self, query: str, deadline: Deadline, degraded: List[str]) -> str:
+        """이전 대화를 반영한 독립적인 질문. 시간이 부족하거나 초과하면 원본 질문 사용."""
+        # 답변 생성 몫을 남기고도 시간이 있을 때만 변환
+        timeout = deadline.cap(self.budgets.condense_ms, reserve_ms=self.budgets.generation_reserve_ms)
+        if timeout is None:
+            print("⏱️ 시간 예산 부족 → 질문 변환 생략")
+            degraded.append("condense")
+            return query
+
         chat_history = self.memory.load_memory_variables().get("chat_history", [])
         chat_history_str = "\n".join(f"{m.role}: {m.content}" for m in chat_history) if chat_history else ""
         standalone_query_prompt = CONDENSE_QUESTION_PROMPT.format(
@@ -63,27 +194,95 @@ class ConversationChain:
             question=query,
         )
         try:
-            response = self.model.generate_content(standalone_query_prompt)
+            # 프롬프트에 이전 대화 + 질문이 모두 들어가므로 키가 같으면 결과도 같다
+            response = await asyncio.wait_for(self._generate(standalone_query_prompt, timeout), timeout)
             standalone_query = response.text.strip() if hasattr(response, 'text') else str(response).strip()
             if not standalone_query:
                 standalone_query = query
+        except asyncio.TimeoutError:
+            print(f"⏱️ 질문 변환 시간 초과({timeout * 1000:.0f}ms), 원본 질문 사용")
+            degraded.append("condense")
+            standalone_query = query
         except Exception as e:
             print(f"⚠️ 독립적 질문 변환 실패: {e}, 원본 질문 사용")
             standalone_query = query 
-        
-        # 독립적인 질문으로 문서 검색
-        docs = await self.retriever.ainvoke(standalone_query)
+        return standalone_query
+
+    async def _retrieve_fallback(self, standalone_query: str, deadline: Deadline, degraded: List[str]):
+        """리트리버 ainvoke(자체 폴백 포함)로 검색. 남은 시간이 없거나 실패하면 컨텍스트 없이."""
+        timeout = deadline.cap(self.budgets.retrieval_ms)
+        if timeout is None:
+            degraded.append("retrieval")
+            return []
+        try:
+            return await asyncio.wait_for(self._retrieve(standalone_query), timeout)
+        except asyncio.TimeoutError:
+            print(f"⏱️ 검색 시간 초과({timeout * 1000:.0f}ms) → 컨텍스트 없이 진행")
+            degraded.append("retrieval")
+        except Exception as e:
+            print(f"⚠️ 검색 실패: {e} → 컨텍스트 없이 진행")
+        return []
+
+    async def _get_relevant_documents(self, query: str, deadline: Optional[Deadline] = None,
+                                      degraded: Optional[List[str]] = None) -> List[str]:
+        """검색을 위한 독립적인 질문으로 변환하고 관련 문서를 검색합니다."""
+        deadline = deadline or Deadline(self.budgets.total_ms)
+        degraded = degraded if degraded is not None else []
+
+        # 변환을 기다리는 동안 원본 질문으로 미리 검색
+        speculation = None
+        if self._can_speculate():
+            speculation = asyncio.ensure_future(self._speculate(query))
+            # 결과를 쓰지 않고 끝나도 "exception was never retrieved" 경고가 나지 않도록
+            speculation.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        try:
+            # 독립적인 질문으로 변환
+            standalone_query = await self._condense_question(query, deadline, degraded)
+
+            # 독립적인 질문으로 문서 검색 (상한을 넘기면 컨텍스트 없이 진행)
+            timeout = deadline.cap(self.budgets.retrieval_ms)
+            if timeout is None:
+                degraded.append("retrieval")
+                return []
+            if speculation is not None:
+                fetch = self._resolve_speculation(query, standalone_query, speculation)
+            else:
+                fetch = self._retrieve(standalone_query)
+            try:
+                docs = await asyncio.wait_for(fetch, timeout)
+            except asyncio.TimeoutError:
+                print(f"⏱️ 검색 시간 초과({timeout * 1000:.0f}ms) → 컨텍스트 없이 진행")
+                degraded.append("retrieval")
+                return []
+            except Exception as e:
+                if speculation is None:
+                    print(f"⚠️ 검색 실패: {e} → 컨텍스트 없이 진행")
+                    return []
+                # 추측 경로는 임베딩/벡터 검색을 직접 불러 리트리버의 폴백을 거치지 않으므로 일반 검색으로 다시
+                print(f"⚠️ 추측 검색 실패: {e} → 일반 검색으로 재시도")
+                self.speculation["failed"] += 1
+                docs = await self._retrieve_fallback(standalone_query, deadline, degraded)
+        finally:
+            if speculation is not None and not speculation.done():
+                speculation.cancel()
         return [getattr(doc, "page_content", str(doc)) for doc in docs]
 
     
     async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
-        """대화형 체인을 실행합니다."""
+        """
+        대화형 체인을 실행합니다.
+        inputs["deadline_ms"]로 요청 마감을 덮어쓸 수 있고,
+        결과의 "degraded"에 시간 예산 때문에 생략/축소된 단계가 담깁니다.
+        """
         try:
             query = inputs["input"]
+            deadline = Deadline(inputs.get("deadline_ms") or self.budgets.total_ms)
+            degraded: List[str] = []
             chat_history = self.memory.load_memory_variables().get("chat_history", [])
             
             # 관련 문서 검색 및 더미 문서 제외
-            relevant_docs = await self._get_relevant_documents(query)
+            relevant_docs = await self._get_relevant_documents(query, deadline, degraded)
             relevant_docs = [d for d in relevant_docs if "__DUMMY__INITIAL__ENTRY__" not in d]
             context = "\n".join(relevant_docs) if relevant_docs else ""
             
@@ -99,16 +298,23 @@ class ConversationChain:
             )
             full_prompt = SYSTEM_PROMPT+ "\n\n" + qa_body
 
-            # Gemini로 응답 생성
+            # Gemini로 응답 생성 (남은 시간 전부)
             try:
-                response = self.model.generate_content(full_prompt)
+                timeout = deadline.remaining()
+                if timeout <= 0:
+                    raise asyncio.TimeoutError
+                response = await asyncio.wait_for(self._generate(full_prompt, timeout), timeout)
                 if hasattr(response, 'text'):
                     ai_message = response.text
                 else:
                     ai_message = str(response)
+            except asyncio.TimeoutError:
+                print("⏱️ 답변 생성 시간 초과")
+                degraded.append("generation")
+                ai_message = GENERATION_TIMEOUT_MESSAGE
             except Exception as e:
                 print(f"Error generating content: {str(e)}")
-                ai_message = "죄송합니다. 응답을 생성하는 중에 오류가 발생했습니다."
+                ai_message = GENERATION_ERROR_MESSAGE
             
             # 메모리에 대화 저장
             self.memory.save_context(
@@ -118,15 +324,16 @@ class ConversationChain:
             
             return {
                 "output": ai_message,
-                "source_documents": relevant_docs
+                "source_documents": relevant_docs,
+                "degraded": degraded,
             }
             
         except Exception as e:
             print(f"Error in conversation chain: {str(e)}")
-            return {"output": "대화 처리 중에 오류가 발생했습니다. 다시 시도해 주세요."}
+            return {"output": CHAIN_ERROR_MESSAGE}
 
-def get_conversational_chain(vector_store=None):
+def get_conversational_chain(vector_store=None, model=None):
     """대화형 체인을 초기화하고 반환합니다."""
-    chain = ConversationChain(vector_store=vector_store)
+    chain = ConversationChain(vector_store=vector_store, model=model)
     print("대화 체인이 초기화되었습니다.")
     return chain
@@ -0,0 +1,112 @@
+# chunking.py
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List
+
+from langchain_core.documents import Document
+
+# ---- 설정 ----
+STORY_CHUNKING = os.getenv("STORY_CHUNKING", "1") == "1"
+CHUNK_WINDOW = int(os.getenv("CHUNK_WINDOW", "3"))  # 패시지당 문장 수
+CHUNK_STRIDE = int(os.getenv("CHUNK_STRIDE", "2"))  # 패시지 시작 간격 (window보다 작으면 겹침)
+CHUNK_NEIGHBORS = int(os.getenv("CHUNK_NEIGHBORS", "1"))  # 매칭 패시지 앞뒤로 붙일 패시지 수
+CHUNK_MAX_CONTEXT_CHARS = int(os.getenv("CHUNK_MAX_CONTEXT_CHARS", "1200"))  # 사연 1개당 컨텍스트 상한
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?。…])\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """문장부호/줄바꿈 기준 문장 분리"""
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s and s.strip()]
+
+
+def passage_doc_id(story_id: str, passage_idx: int) -> str:
+    """패시지 docstore ID (이웃 패시지를 ID로 바로 찾기 위해 결정적으로 생성)"""
+    return f"{story_id}#p{passage_idx}"
+
+
+def build_passages(text: str, window: int = CHUNK_WINDOW, stride: int = CHUNK_STRIDE) -> List[Dict]:
+    """
+    문장 윈도우 패시지 목록.
+    각 항목: {"text", "sent_start", "sent_end"} (sent_end는 미포함)
+    패시지 안의 문장은 줄바꿈으로 이어 붙여, 다시 split_sentences 하면 같은 문장으로 돌아온다.
+    """
+    sentences = split_sentences(text) or [text.strip()]
+    window = max(1, window)
+    stride = max(1, min(stride, window))
+
+    passages = []
+    start = 0
+    while True:
+        end = min(start + window, len(sentences))
+        passages.append({"text": "\n".join(sentences[start:end]), "sent_start": start, "sent_end": end})
+        if end >= len(sentences):
+            break
+        start += stride
+    return passages
+
+
+def parent_key(doc: Document):
+    """패시지 → 부모 사연 키 (story_id가 없는 예전 문서는 문서 자체)"""
+    return doc.metadata.get("story_id") or id(doc)
+
+
+def _merge_sentences(passages: List[Document]) -> str:
+    """겹치는 패시지를 문장 단위로 합치고, 끊긴 구간은 … 으로 표시"""
+    sentences = {}
+    for p in passages:
+        start = p.metadata.get("sent_start", 0)
+        for offset, sent in enumerate(split_sentences(p.page_content)):
+            sentences.setdefault(start + offset, sent)
+
+    parts, prev = [], None
+    for idx in sorted(sentences):
+        if prev is not None and idx != prev + 1:
+            parts.append("…")
+        parts.append(sentences[idx])
+        prev = idx
+    return " ".join(parts)
+
+
+def expand_passages(hits: List[Document], docstore, neighbors: int = CHUNK_NEIGHBORS,
+                    max_chars: int = CHUNK_MAX_CONTEXT_CHARS) -> List[Document]:
+    """
+    relevance 순으로 정렬된 패시지 히트를 부모 사연별로 묶고,
+    매칭 패시지 + 앞뒤 neighbors개 패시지만 이어 붙인 Document를 사연당 1개씩 반환.
+    패시지가 아닌 예전(사연 통째) 문서는 그대로 통과.
+    """
+    groups: "OrderedDict[object, List[Document]]" = OrderedDict()
+    for doc in hits:
+        groups.setdefault(parent_key(doc), []).append(doc)
+
+    results = []
+    for docs in groups.values():
+        head = docs[0]
+        if "passage_idx" not in head.metadata:
+            results.append(head)
+            continue
+
+        story_id = head.metadata["story_id"]
+        count = head.metadata.get("passage_count", 1)
+        matched = sorted({d.metadata["passage_idx"] for d in docs})
+        wanted = sorted({j for i in matched
+                         for j in range(max(0, i - neighbors), min(count, i + neighbors + 1))})
+
+        by_idx = {d.metadata["passage_idx"]: d for d in docs}
+        passages = []
+        for j in wanted:
+            p = by_idx.get(j)
+            if p is None and docstore is not None:
+                p = docstore.search(passage_doc_id(story_id, j))
+            if isinstance(p, Document):
+                passages.append(p)
+
+        content = _merge_sentences(passages)
+        if len(content) > max_chars:
+            content = content[:max_chars].rstrip() + "…"
+        metadata = {k: v for k, v in head.metadata.items()
+                    if k not in ("passage_idx", "sent_start", "sent_end")}
+        metadata["matched_passages"] = matched
+        results.append(Document(page_content=content, metadata=metadata))
+    return results
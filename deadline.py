@@ -0,0 +1,42 @@
+# deadline.py
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class StageBudgets:
+    """요청 1건의 전체 시간 예산과 단계별 상한 (ms)"""
+    total_ms: float = 15000            # 요청 전체 마감
+    condense_ms: float = 2500          # 질문 변환 상한
+    retrieval_ms: float = 100          # 임베딩+검색 상한 (넘으면 컨텍스트 없이 진행)
+    generation_reserve_ms: float = 5000  # 답변 생성용으로 남겨둘 최소 시간 (이보다 적게 남으면 변환 생략)
+
+    @classmethod
+    def from_env(cls) -> "StageBudgets":
+        return cls(
+            total_ms=float(os.getenv("CHAIN_DEADLINE_MS", cls.total_ms)),
+            condense_ms=float(os.getenv("CONDENSE_BUDGET_MS", cls.condense_ms)),
+            retrieval_ms=float(os.getenv("RETRIEVAL_BUDGET_MS", cls.retrieval_ms)),
+            generation_reserve_ms=float(os.getenv("GENERATION_RESERVE_MS", cls.generation_reserve_ms)),
+        )
+
+
+class Deadline:
+    """단조 시계 기준 마감 시각"""
+    def __init__(self, budget_ms: float):
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+
+    def remaining(self) -> float:
+        """남은 시간(초)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cap(self, stage_ms: float, reserve_ms: float = 0.0) -> Optional[float]:
+        """
+        단계 타임아웃(초) = min(단계 상한, 남은 시간 - 뒤 단계 예약분).
+        쓸 수 있는 시간이 없으면 None.
+        """
+        available = self.remaining() - reserve_ms / 1000.0
+        timeout = min(stage_ms / 1000.0, available)
+        return timeout if timeout > 0 else None
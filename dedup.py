@@ -0,0 +1,339 @@
+# dedup.py
+import os
+import re
+import math
+import hashlib
+import argparse
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retriever import _relevance_from_scores, _is_dummy
+from chunking import parent_key, passage_doc_id
+
+# ---- 설정 ----
+DEDUP_MODE = os.getenv("DEDUP_MODE", "reject")  # reject | merge | off
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.95"))  # 임베딩 relevance 기준
+DEDUP_SIMHASH_DISTANCE = int(os.getenv("DEDUP_SIMHASH_DISTANCE", "3"))  # 64비트 중 허용 해밍 거리
+DEDUP_CANDIDATES = 5  # 텍스트 서명을 비교할 임베딩 이웃 수
+DEDUP_PASSAGE_RATIO = float(os.getenv("DEDUP_PASSAGE_RATIO", "0.8"))  # 패시지 중 이 비율 이상이 같은 사연과 겹치면 중복
+
+
+class DuplicateStoryError(ValueError):
+    """이미 비슷한 사연이 있을 때 (DEDUP_MODE=reject)"""
+    def __init__(self, duplicate_of: str, similarity: float):
+        super().__init__(f"이미 비슷한 사연이 있습니다. (ID: {duplicate_of}, similarity={similarity:.3f})")
+        self.duplicate_of = duplicate_of
+        self.similarity = similarity
+
+
+def _normalize_text(text: str) -> str:
+    """띄어쓰기/문장부호 차이는 무시"""
+    return re.sub(r"[^\w]", "", text.lower())
+
+
+def simhash(text: str, ngram: int = 3) -> int:
+    """문자 n-gram 기반 64비트 SimHash (한국어는 단어보다 문자 단위가 안정적)"""
+    norm = _normalize_text(text)
+    if len(norm) < ngram:
+        shingles = Counter([norm])
+    else:
+        shingles = Counter(norm[i:i + ngram] for i in range(len(norm) - ngram + 1))
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big") for sh in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    counts = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    weights = ((bits.astype(np.int64) * 2 - 1) * counts[:, None]).sum(axis=0)
+    return sum(1 << int(i) for i in np.flatnonzero(weights > 0))
+
+
+def text_simhash(text: str) -> Optional[int]:
+    """사연 서명. 정규화하면 비는 텍스트(공백/문장부호뿐)는 모두 같은 서명이 되므로 None"""
+    return simhash(text) if _normalize_text(text) else None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _doc_simhash(doc: Document) -> Optional[int]:
+    # 패시지 메타데이터의 simhash는 부모 사연 전체 텍스트의 서명
+    sig = doc.metadata.get("simhash")
+    return int(sig, 16) if sig else text_simhash(doc.page_content)
+
+
+def _store_size(vector_store) -> int:
+    return vector_store.ntotal if hasattr(vector_store, "ntotal") else int(vector_store.index.ntotal)
+
+
+class SimHashIndex:
+    """
+    스토어 전체 사연의 SimHash 서명 (임베딩 이웃 밖에 있는 거의 같은 사연도 찾기 위해).
+    64비트를 max_distance+1개 밴드로 나누면, 해밍 거리가 max_distance 이하인 두 서명은 적어도 한 밴드가 같다.
+    """
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        bands = min(max_distance + 1, 64)
+        self._bounds = [(64 * b // bands, 64 * (b + 1) // bands) for b in range(bands)]
+        self._buckets: List[Dict[int, List[object]]] = [{} for _ in range(bands)]
+        self._sigs: Dict[object, Tuple[str, int]] = {}  # 사연 키 → (docstore ID, 서명)
+        self.size: Optional[int] = None  # 색인에 반영된 스토어 벡터 수 (스토어와 다르면 다시 만든다)
+
+    def _bands(self, sig: int) -> List[int]:
+        return [(sig >> lo) & ((1 << (hi - lo)) - 1) for lo, hi in self._bounds]
+
+    def add(self, key, doc_id: str, sig: int):
+        if key in self._sigs:
+            return
+        self._sigs[key] = (doc_id, sig)
+        for bucket, band in zip(self._buckets, self._bands(sig)):
+            bucket.setdefault(band, []).append(key)
+
+    def find(self, sig: int) -> List[Tuple[int, object, str]]:
+        """해밍 거리 max_distance 이하 사연의 (거리, 사연 키, docstore ID), 가까운 순"""
+        found, seen = [], set()
+        for bucket, band in zip(self._buckets, self._bands(sig)):
+            for key in bucket.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                doc_id, other = self._sigs[key]
+                distance = hamming_distance(sig, other)
+                if distance <= self.max_distance:
+                    found.append((distance, key, doc_id))
+        return sorted(found, key=lambda f: f[0])
+
+
+def _simhash_index(vector_store, max_distance: int) -> SimHashIndex:
+    """스토어에 붙여 둔 SimHash 색인 (처음 쓰거나 스토어가 다른 경로로 바뀌었으면 docstore에서 다시 만든다)"""
+    from vector_store import iter_documents
+
+    index = getattr(vector_store, "_simhash_index", None)
+    size = _store_size(vector_store)
+    if index is None or index.max_distance != max_distance or index.size != size:
+        index = SimHashIndex(max_distance)
+        for doc_id, doc in iter_documents(vector_store):
+            if not isinstance(doc, Document) or _is_dummy(doc):
+                continue
+            sig = _doc_simhash(doc)
+            if sig is not None:
+                index.add(doc.metadata.get("story_id") or doc_id, doc_id, sig)
+        index.size = size
+        vector_store._simhash_index = index
+    return index
+
+
+def remember_story(vector_store, doc_id: str, metadata: dict, n_added: int):
+    """방금 추가한 사연의 서명을 색인에 반영 (색인이 없거나 이미 어긋났으면 다음 조회 때 다시 만든다)"""
+    index = getattr(vector_store, "_simhash_index", None)
+    if index is None or index.size is None:
+        return
+    if index.size + n_added != _store_size(vector_store):
+        vector_store._simhash_index = None
+        return
+    sig = metadata.get("simhash")
+    if sig:
+        index.add(metadata.get("story_id") or doc_id, doc_id, int(sig, 16))
+    index.size += n_added
+
+
+def find_near_duplicate(vector_store, text: str, embeddings: List[List[float]],
+                        threshold: Optional[float] = None,
+                        max_distance: Optional[int] = None) -> Optional[Tuple[Document, float]]:
+    """
+    새 사연(패시지별 임베딩)의 이웃 후보를 찾고 사연 단위로 중복 판정.
+    - SimHash가 가까운 사연이 스토어 어디에든 있으면 중복 (정규화하면 빈 텍스트는 서명 비교를 하지 않음)
+    - 패시지 중 DEDUP_PASSAGE_RATIO 이상이 같은 사연의 패시지와 relevance ≥ threshold면 중복
+    중복이면 (기존 문서, relevance), 아니면 None.
+    SimHash로 찾은 사연이 임베딩 이웃에 없으면 relevance 대신 서명 유사도(1 - 해밍 거리/64)를 돌려준다.
+    """
+    threshold = DEDUP_SIMILARITY if threshold is None else threshold
+    max_distance = DEDUP_SIMHASH_DISTANCE if max_distance is None else max_distance
+
+    sig = text_simhash(text)
+    near = _simhash_index(vector_store, max_distance).find(sig) if sig is not None else []
+    near_keys = {key for _, key, _ in near}
+    votes: Counter = Counter()
+    best = {}
+    for embedding in embeddings:
+        pairs = vector_store.similarity_search_with_score_by_vector(embedding, k=DEDUP_CANDIDATES)
+        if not pairs:
+            continue
+        rel = _relevance_from_scores([raw for _, raw in pairs])
+        voted = set()
+        for (doc, _), r in zip(pairs, rel):
+            if _is_dummy(doc):
+                continue
+            key = parent_key(doc)
+            if key in near_keys:
+                return doc, float(r)
+            if r >= threshold and key not in voted:
+                voted.add(key)
+                votes[key] += 1
+                if r > best.get(key, (None, -1.0))[1]:
+                    best[key] = (doc, float(r))
+
+    if votes:
+        key, count = votes.most_common(1)[0]
+        if count >= math.ceil(len(embeddings) * DEDUP_PASSAGE_RATIO):
+            return best[key]
+    for distance, _, doc_id in near:
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            return doc, 1.0 - distance / 64
+    return None
+
+
+def _story_documents(existing: Document, docstore) -> List[Tuple[Optional[str], Document]]:
+    """기존 문서가 속한 사연의 패시지 전체 (docstore ID, 문서). 패시지로 나누지 않은 사연은 문서 자신만"""
+    story_id = existing.metadata.get("story_id")
+    count = existing.metadata.get("passage_count")
+    if docstore is None or not story_id or not count:
+        return [(getattr(existing, "id", None), existing)]
+    docs = []
+    for j in range(count):
+        doc_id = passage_doc_id(story_id, j)
+        doc = existing if j == existing.metadata.get("passage_idx") else docstore.search(doc_id)
+        if isinstance(doc, Document):
+            docs.append((doc_id, doc))
+    return docs
+
+
+def merge_duplicate(existing: Document, story_id: str, docstore=None):
+    """
+    중복 사연은 새로 넣지 않고 기존 사연의 모든 패시지 메타데이터에 ID만 기록
+    (어느 패시지가 검색되거나 사연 단위로 합쳐도 링크가 보이게). docstore를 주면 SQLite docstore에도 반영.
+    """
+    from docstore import update_document  # langchain_community를 불러오므로 병합할 때만
+    for doc_id, doc in _story_documents(existing, docstore):
+        merged = doc.metadata.setdefault("duplicate_ids", [])
+        if story_id not in merged:
+            merged.append(story_id)
+            update_document(docstore, doc, doc_id)
+
+
+class _KeptVectors:
+    """오프라인 중복 제거에서 남긴 사연의 벡터 (FAISS IndexFlatL2와 같은 제곱 L2 정확 검색, NumPy만 사용)"""
+    def __init__(self, dim: int):
+        self._rows = np.empty((1024, dim), dtype=np.float32)
+        self._norms = np.empty(1024, dtype=np.float32)
+        self.ntotal = 0
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        end = self.ntotal + len(vectors)
+        if end > len(self._rows):
+            capacity = max(end, len(self._rows) * 2)
+            self._rows = np.resize(self._rows, (capacity, self._rows.shape[1]))
+            self._norms = np.resize(self._norms, capacity)
+        self._rows[self.ntotal:end] = vectors
+        self._norms[self.ntotal:end] = (vectors * vectors).sum(axis=1)
+        self.ntotal = end
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(distances, labels) 각 행 거리 오름차순 k개"""
+        queries = np.asarray(queries, dtype=np.float32)
+        rows = self._rows[:self.ntotal]
+        dist = (queries * queries).sum(axis=1)[:, None] + self._norms[:self.ntotal][None, :] - 2 * queries @ rows.T
+        np.maximum(dist, 0, out=dist)
+        labels = np.argpartition(dist, k - 1, axis=1)[:, :k] if k < self.ntotal else np.tile(
+            np.arange(self.ntotal), (len(queries), 1))
+        top = np.take_along_axis(dist, labels, axis=1)
+        order = np.argsort(top, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(labels, order, axis=1)
+
+
+def dedupe_vector_store(vector_store, threshold: Optional[float] = None,
+                        max_distance: Optional[int] = None, dry_run: bool = False) -> List[str]:
+    """
+    기존 인덱스 오프라인 중복 제거 (사연 단위).
+    인덱스 순서대로 사연을 훑으며 먼저 들어온 사연을 남기고, 나중 사연이 중복이면
+    그 사연의 패시지를 모두 삭제(기존 사연에 ID 병합).
+    재임베딩 없이 인덱스에서 벡터를 복원해 비교한다.
+    반환: 삭제된(삭제될) docstore ID 목록
+    """
+    threshold = DEDUP_SIMILARITY if threshold is None else threshold
+    max_distance = DEDUP_SIMHASH_DISTANCE if max_distance is None else max_distance
+
+    if hasattr(vector_store, "stored_vectors"):  # numpy / sharded 백엔드
+        doc_ids, vectors = vector_store.stored_vectors()
+    else:
+        index = vector_store.index
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+        doc_ids = [vector_store.index_to_docstore_id[i] for i in range(index.ntotal)]
+    if not doc_ids:
+        return []
+
+    # 사연별 (docstore ID, 문서, 행 번호)
+    stories: "OrderedDict[object, List[Tuple[str, Document, int]]]" = OrderedDict()
+    for i, doc_id in enumerate(doc_ids):
+        doc = vector_store.docstore.search(doc_id)
+        if not isinstance(doc, Document) or _is_dummy(doc):
+            continue
+        stories.setdefault(parent_key(doc), []).append((doc_id, doc, i))
+
+    kept = _KeptVectors(vectors.shape[1])
+    kept_owner: List[int] = []  # kept 인덱스 행 → 남긴 사연 번호
+    kept_heads: List[Document] = []
+    kept_sigs: List[int] = []
+    to_delete: List[str] = []
+    for rows in stories.values():
+        head = rows[0][1]
+        sig = _doc_simhash(head)
+
+        dup = None if sig is None else next(
+            (j for j, s in enumerate(kept_sigs) if s is not None and hamming_distance(sig, s) <= max_distance), None)
+        if dup is None and kept.ntotal:
+            rows_idx = [i for _, _, i in rows]
+            distances, labels = kept.search(vectors[rows_idx], min(DEDUP_CANDIDATES, kept.ntotal))
+            rel = _relevance_from_scores(distances)
+            votes = Counter()
+            for row_labels, row_rel in zip(labels, rel):
+                votes.update({kept_owner[j] for j, r in zip(row_labels, row_rel) if j >= 0 and r >= threshold})
+            if votes:
+                owner, count = votes.most_common(1)[0]
+                if count >= math.ceil(len(rows) * DEDUP_PASSAGE_RATIO):
+                    dup = owner
+
+        if dup is None:
+            owner = len(kept_heads)
+            kept.add(vectors[[i for _, _, i in rows]])
+            kept_owner.extend([owner] * len(rows))
+            kept_heads.append(head)
+            kept_sigs.append(sig)
+        else:
+            target = kept_heads[dup]
+            to_delete.extend(doc_id for doc_id, _, _ in rows)
+            print(f"🔁 중복: {head.metadata.get('story_id')} → {target.metadata.get('story_id')}")
+            if not dry_run:
+                for merged_id in [head.metadata.get("story_id", rows[0][0])] + head.metadata.get("duplicate_ids", []):
+                    merge_duplicate(target, merged_id, vector_store.docstore)
+
+    if to_delete and not dry_run:
+        vector_store.delete(to_delete)
+    return to_delete
+
+
+def main():
+    from vector_store import initialize_vector_store, save_vector_store
+
+    parser = argparse.ArgumentParser(description="벡터 인덱스 오프라인 중복 제거")
+    parser.add_argument("--threshold", type=float, default=None, help="임베딩 relevance 기준 (기본 DEDUP_SIMILARITY)")
+    parser.add_argument("--max-distance", type=int, default=None, help="SimHash 해밍 거리 기준")
+    parser.add_argument("--dry-run", action="store_true", help="삭제하지 않고 목록만 출력")
+    args = parser.parse_args()
+
+    vs = initialize_vector_store()
+    removed = dedupe_vector_store(vs, args.threshold, args.max_distance, dry_run=args.dry_run)
+    if removed and not args.dry_run:
+        save_vector_store(vs)
+    print(f"중복 {len(removed)}건 {'발견' if args.dry_run else '제거'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# docstore.py
+"""
+FAISS 인덱스용 SQLite docstore (index.pkl 대체).
+
+FAISS.load_local은 index.pkl을 풀어 모든 사연 본문을 메모리에 올린다. 검색 한 번에 필요한 문서는 k개뿐이라
+본문/메타데이터는 SQLite에 두고 ID로 필요할 때만 읽는다 (자주 읽는 문서는 작은 LRU에 보관).
+
+  <버전 디렉터리>/
+    docs.sqlite        # docs(본문, 메타데이터) + id_map(행 번호 → docstore ID) + meta(generation, index_file)
+    index.<N>.faiss    # N = generation. 새 파일을 다 쓴 뒤 SQLite 커밋으로 가리키는 파일을 바꾼다
+
+저장은 "새 index 파일 쓰기 → docs/id_map/generation 한 트랜잭션 커밋 → 이전 index 파일 삭제" 순서라
+중간에 죽어도 커밋된 generation의 인덱스와 문서가 항상 짝이 맞는다.
+저장 사이의 추가/삭제는 커밋 전까지 같은 연결에서만 보인다 (예전처럼 저장하지 않으면 디스크에 남지 않음).
+
+  python docstore.py migrate            # CURRENT 버전의 index.pkl → docs.sqlite
+  python docstore.py migrate <버전> ...
+  python docstore.py stats
+"""
+import os
+import json
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+# ---- 설정 ----
+DOCSTORE_CACHE_SIZE = int(os.getenv("DOCSTORE_CACHE_SIZE", "1024"))  # LRU에 보관할 문서 수
+
+DOCS_DB = "docs.sqlite"
+LEGACY_PICKLE_FILE = "index.pkl"
+_IN_CHUNK = 500  # IN (...) 한 번에 넣을 ID 수 (SQLite 변수 개수 제한)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS id_map (row INTEGER PRIMARY KEY, doc_id TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _chunks(ids: List[str]):
+    for i in range(0, len(ids), _IN_CHUNK):
+        yield ids[i:i + _IN_CHUNK]
+
+
+def has_sqlite_docstore(path: str) -> bool:
+    return os.path.exists(os.path.join(path, DOCS_DB))
+
+
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    docstore ID → Document. InMemoryDocstore와 같은 search/add/delete 규약.
+    반환한 Document는 LRU에 있는 동안 같은 객체라, 메타데이터를 제자리에서 바꿨다면 update()로 반영해야 한다.
+    """
+    def __init__(self, path: str, cache_size: int = DOCSTORE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._cache: "OrderedDict[str, Document]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._id_map_dirty = False  # 삭제로 FAISS 행 번호가 당겨졌으면 id_map 전체를 다시 쓴다
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_documents(cls, path: str, items: Iterable[Tuple[str, Document]],
+                       cache_size: int = DOCSTORE_CACHE_SIZE) -> "SqliteDocstore":
+        """문서들로 새 DB를 만든다 (tmp 파일에 쓴 뒤 교체)"""
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        conn = sqlite3.connect(tmp)
+        conn.executescript(_SCHEMA)
+        conn.executemany("INSERT INTO docs (id, page_content, metadata) VALUES (?, ?, ?)",
+                         ((k, d.page_content, json.dumps(d.metadata, ensure_ascii=False)) for k, d in items))
+        conn.commit()
+        conn.close()
+        for suffix in ("-wal", "-shm"):  # 이전 DB의 WAL이 새 파일에 적용되지 않게
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.replace(tmp, path)
+        return cls(path, cache_size)
+
+    def __getstate__(self):
+        raise TypeError("SqliteDocstore는 pickle로 저장하지 않습니다. save_faiss()를 사용하세요.")
+
+    # ---- 조회 ----
+    def _to_document(self, doc_id: str, page_content: str, metadata: str) -> Document:
+        return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+    def _remember(self, doc_id: str, doc: Document):
+        self._cache[doc_id] = doc
+        self._cache.move_to_end(doc_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            doc = self._cache.get(search)
+            if doc is not None:
+                self._cache.move_to_end(search)
+                self.hits += 1
+                return doc
+            self.misses += 1
+            row = self._conn.execute("SELECT page_content, metadata FROM docs WHERE id = ?", (search,)).fetchone()
+            if row is None:
+                return f"ID {search} not found."
+            doc = self._to_document(search, *row)
+            self._remember(search, doc)
+            return doc
+
+    def items(self) -> List[Tuple[str, Document]]:
+        """전체 문서 (마이그레이션/중복 제거용 — 검색 경로에서는 쓰지 않는다)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, page_content, metadata FROM docs ORDER BY rowid").fetchall()
+            return [(k, self._cache.get(k) or self._to_document(k, c, m)) for k, c, m in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def __contains__(self, doc_id: str) -> bool:
+        return not isinstance(self.search(doc_id), str)
+
+    def _existing(self, ids: List[str]) -> List[str]:
+        found = []
+        for chunk in _chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            found.extend(r[0] for r in self._conn.execute(f"SELECT id FROM docs WHERE id IN ({marks})", chunk))
+        return found
+
+    # ---- 변경 (save_faiss의 commit 전까지는 디스크에 확정되지 않음) ----
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            overlapping = self._existing(list(texts))
+            if overlapping:
+                raise ValueError(f"Tried to add ids that already exist: {set(overlapping)}")
+            self._conn.executemany(
+                "INSERT INTO docs (id, page_content, metadata) VALUES (?, ?, ?)",
+                [(k, d.page_content, json.dumps(d.metadata, ensure_ascii=False)) for k, d in texts.items()])
+
+    def update(self, texts: Dict[str, Document]) -> None:
+        """기존 문서의 본문/메타데이터 교체 (중복 병합 기록 등)"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE docs SET page_content = ?, metadata = ? WHERE id = ?",
+                [(d.page_content, json.dumps(d.metadata, ensure_ascii=False), k) for k, d in texts.items()])
+            for k, d in texts.items():
+                if k in self._cache:
+                    self._cache[k] = d
+
+    def delete(self, ids: List) -> None:
+        ids = list(ids)
+        with self._lock:
+            if not self._existing(ids):
+                raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+            for chunk in _chunks(ids):
+                marks = ",".join("?" * len(chunk))
+                self._conn.execute(f"DELETE FROM docs WHERE id IN ({marks})", chunk)
+            for k in ids:
+                self._cache.pop(k, None)
+            self._id_map_dirty = True
+
+    # ---- 인덱스 짝 정보 ----
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def generation(self) -> int:
+        with self._lock:
+            return int(self._meta("generation") or 0)
+
+    @property
+    def index_file(self) -> Optional[str]:
+        with self._lock:
+            return self._meta("index_file")
+
+    def id_map(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT doc_id FROM id_map ORDER BY row")]
+
+    def commit(self, index_file: str, generation: int, id_map: List[str]):
+        """문서 변경 + id_map + 가리킬 index 파일을 한 트랜잭션으로 확정"""
+        with self._lock:
+            saved = self._conn.execute("SELECT COUNT(*) FROM id_map").fetchone()[0]
+            if self._id_map_dirty or saved > len(id_map):
+                self._conn.execute("DELETE FROM id_map")
+                saved = 0
+            # 추가만 있었다면 뒤에 붙은 행만 쓴다
+            self._conn.executemany("INSERT INTO id_map (row, doc_id) VALUES (?, ?)",
+                                   ((i, id_map[i]) for i in range(saved, len(id_map))))
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   [("generation", str(generation)), ("index_file", index_file)])
+            self._conn.commit()
+            self._id_map_dirty = False
+
+    def stats(self) -> Dict[str, object]:
+        total = self.hits + self.misses
+        return {
+            "cached": len(self._cache),
+            "cache_size": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def update_document(docstore, doc: Document, doc_id: Optional[str] = None):
+    """제자리에서 바꾼 문서를 docstore에 반영 (InMemoryDocstore/NumpyDocstore는 같은 객체라 할 일 없음)"""
+    doc_id = doc_id or getattr(doc, "id", None)
+    if hasattr(docstore, "update") and doc_id:
+        docstore.update({doc_id: doc})
+
+
+def _same_file(a: str, b: str) -> bool:
+    return os.path.abspath(a) == os.path.abspath(b)
+
+
+def save_faiss(vector_store, path: str):
+    """
+    FAISS 스토어를 path에 저장 (index.pkl 없이).
+    docstore가 아직 메모리(InMemoryDocstore)거나 다른 디렉터리의 DB면 여기서 docs.sqlite로 옮기고 교체한다.
+    """
+    import faiss
+
+    os.makedirs(path, exist_ok=True)
+    db_path = os.path.join(path, DOCS_DB)
+    docstore = vector_store.docstore
+    if not (isinstance(docstore, SqliteDocstore) and _same_file(docstore.path, db_path)):
+        items = docstore.items() if hasattr(docstore, "items") else docstore._dict.items()
+        docstore = SqliteDocstore.from_documents(db_path, items)
+        vector_store.docstore = docstore
+        print(f"🗄️ docstore → {db_path} ({len(docstore)}개 문서)")
+
+    generation = docstore.generation + 1
+    index_file = f"index.{generation}.faiss"
+    faiss.write_index(vector_store.index, os.path.join(path, index_file))
+    id_map = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+    docstore.commit(index_file, generation, id_map)
+
+    # 커밋 뒤에는 이전 generation / 예전 형식(index.faiss, index.pkl) 파일이 필요 없다
+    for name in os.listdir(path):
+        if name.startswith("index.") and name.endswith(".faiss") and name != index_file:
+            os.remove(os.path.join(path, name))
+    pickle_path = os.path.join(path, LEGACY_PICKLE_FILE)
+    if os.path.exists(pickle_path):
+        os.replace(pickle_path, pickle_path + ".bak")
+        print(f"🗄️ index.pkl은 더 이상 읽지 않습니다 (백업: {pickle_path}.bak)")
+
+
+def load_faiss(path: str, embeddings, distance_strategy):
+    """docs.sqlite가 가리키는 index 파일과 id_map으로 FAISS 스토어 구성 (문서 본문은 읽지 않음)"""
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    docstore = SqliteDocstore(os.path.join(path, DOCS_DB))
+    index_file = docstore.index_file
+    if not index_file:
+        raise ValueError(f"docs.sqlite에 인덱스 정보가 없습니다: {path}")
+    index = faiss.read_index(os.path.join(path, index_file))
+    id_map = docstore.id_map()
+    if len(id_map) != index.ntotal:
+        raise ValueError(f"id_map({len(id_map)})과 인덱스 벡터 수({index.ntotal})가 다릅니다: {path}")
+    return FAISS(embeddings, index, docstore, dict(enumerate(id_map)), distance_strategy=distance_strategy)
+
+
+def main():
+    from index_versions import current_version, list_versions, read_manifest, version_dir
+    from vector_store import initialize_vector_store, save_vector_store
+
+    parser = argparse.ArgumentParser(description="FAISS docstore 관리 (index.pkl → docs.sqlite)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="pickle docstore를 SQLite로 변환")
+    migrate.add_argument("versions", nargs="*", help="버전 (기본: CURRENT)")
+    sub.add_parser("stats", help="버전별 docstore 형식")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        current = current_version()
+        for version in list_versions():
+            path = version_dir(version)
+            backend = read_manifest(version).get("backend", "faiss")
+            if backend == "sharded":
+                kind = read_manifest(version).get("docstore", "sqlite") + " (샤드별)"
+            else:
+                kind = "sqlite" if has_sqlite_docstore(path) else ("jsonl" if backend == "numpy" else "pickle")
+            print(f"{'*' if version == current else ' '} {version}: backend={backend}, docstore={kind}")
+        return
+
+    for version in args.versions or [current_version()]:
+        if version is None:
+            raise SystemExit("변환할 인덱스가 없습니다.")
+        if read_manifest(version).get("backend", "faiss") != "faiss":
+            print(f"건너뜀 (FAISS 인덱스 아님): {version}")
+            continue
+        if has_sqlite_docstore(version_dir(version)):
+            print(f"건너뜀 (이미 SQLite): {version}")
+            continue
+        save_vector_store(initialize_vector_store(version))  # pickle은 여기서 마지막으로 한 번 읽는다
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# index_versions.py
+"""
+버전별 인덱스 디렉터리와 매니페스트.
+
+  data/faiss_index/
+    CURRENT                  # 서빙 중인 버전 이름 (os.replace로 원자적 교체)
+    versions/<버전>/
+      index.<N>.faiss, docs.sqlite   # FAISS (예전 형식: index.faiss, index.pkl)
+      manifest.json          # backend, docstore, model, dim, distance, doc_count, built_at
+
+CURRENT가 없는데 data/faiss_index/에 인덱스가 있으면 예전 단일 디렉터리 형식("legacy")으로 읽는다.
+"""
+import os
+import re
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from numpy_store import has_numpy_index
+
+# ---- 설정 ----
+PERSIST_DIR = os.getenv("FAISS_PERSIST_DIR", "data/faiss_index")  # 디스크 저장 경로
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/distiluse-base-multilingual-cased-v2"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)  # 새 인덱스를 만들 때 쓸 모델
+
+LEGACY_VERSION = "legacy"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+VERSIONS_DIR = "versions"
+
+
+def new_version_name(model_name: str) -> str:
+    """예: 20250101-120000-distiluse-base-multilingual-cased-v2"""
+    slug = re.sub(r"[^0-9A-Za-z]+", "-", model_name.split("/")[-1]).strip("-").lower()
+    base = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}"
+    name, n = base, 1
+    while os.path.exists(version_dir(name)):  # 같은 초에 같은 모델로 빌드한 경우
+        n += 1
+        name = f"{base}-{n}"
+    return name
+
+
+def version_dir(version: str) -> str:
+    if version == LEGACY_VERSION:
+        return PERSIST_DIR
+    return os.path.join(PERSIST_DIR, VERSIONS_DIR, version)
+
+
+def _has_index(path: str) -> bool:
+    # faiss: docs.sqlite (예전 형식 index.faiss), numpy: ids[.<N>].npy, sharded: shards.json
+    return has_numpy_index(path) or any(os.path.exists(os.path.join(path, name))
+                                        for name in ("docs.sqlite", "index.faiss", "shards.json"))
+
+
+def current_version() -> Optional[str]:
+    """CURRENT가 가리키는 버전. 없으면 legacy 인덱스 유무로 판단, 둘 다 없으면 None."""
+    pointer = os.path.join(PERSIST_DIR, CURRENT_FILE)
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if version:
+            return version
+    if _has_index(PERSIST_DIR):
+        return LEGACY_VERSION
+    return None
+
+
+def list_versions() -> List[str]:
+    root = os.path.join(PERSIST_DIR, VERSIONS_DIR)
+    versions = sorted(v for v in os.listdir(root) if _has_index(os.path.join(root, v))) if os.path.isdir(root) else []
+    if _has_index(PERSIST_DIR):
+        versions.insert(0, LEGACY_VERSION)
+    return versions
+
+
+def read_manifest(version: str) -> Dict[str, Any]:
+    """매니페스트. legacy 인덱스에 매니페스트가 없으면 예전 고정 모델로 간주."""
+    path = os.path.join(version_dir(version), MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if version == LEGACY_VERSION:
+        return {"version": LEGACY_VERSION, "backend": "faiss", "model": DEFAULT_EMBEDDING_MODEL, "distance": "cosine"}
+    return {}
+
+
+def write_manifest(version: str, model: str, dim: Optional[int], distance: str, doc_count: int,
+                   backend: str = "faiss", docstore: Optional[str] = None) -> Dict[str, Any]:
+    """매니페스트 갱신 (최초 빌드 시각은 유지). tmp 파일에 쓴 뒤 교체."""
+    now = datetime.now().isoformat(timespec="seconds")
+    previous = read_manifest(version)
+    manifest = {
+        "version": version,
+        "backend": backend,
+        "docstore": docstore,
+        "model": model,
+        "dim": dim,
+        "distance": distance,
+        "doc_count": doc_count,
+        "built_at": previous.get("built_at") or now,
+        "updated_at": now,
+    }
+    path = os.path.join(version_dir(version), MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return manifest
+
+
+def switch_current(version: str):
+    """CURRENT를 원자적으로 교체 (읽는 쪽은 항상 이전 또는 새 버전 중 하나만 본다)"""
+    if not _has_index(version_dir(version)):
+        raise ValueError(f"인덱스가 없는 버전입니다: {version}")
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    pointer = os.path.join(PERSIST_DIR, CURRENT_FILE)
+    tmp = pointer + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+    print(f"🔀 CURRENT → {version}")
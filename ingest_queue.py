@@ -0,0 +1,268 @@
+# ingest_queue.py
+"""
+사연 비동기 적재 대기열.
+
+/add-story는 사연을 대기열에 넣고 job_id를 바로 돌려준다(202). 워커 하나가 대기열을 배치로 꺼내
+  - 배치의 모든 패시지를 임베딩 한 번으로 계산하고
+  - 인덱스에 추가한 뒤 (이때부터 검색됨 = searchable)
+  - 저장은 INGEST_PERSIST_INTERVAL초에 한 번, 또는 대기열이 비었을 때 몰아서 한다 (done)
+무거운 작업은 스레드에서 실행해 이벤트 루프(채팅)를 막지 않는다.
+
+인덱스 쓰기(사연 추가/저장, 컷오버, 롤백)는 write_lock으로 직렬화한다.
+"""
+import os
+import math
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from admission import AdmissionRejected
+from dedup import DuplicateStoryError
+from vector_store import add_stories_to_vector_store, save_vector_store
+
+# ---- 설정 ----
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "16"))                # 한 번에 임베딩할 사연 수
+INGEST_BATCH_WAIT = float(os.getenv("INGEST_BATCH_WAIT", "0.05"))            # 첫 사연 도착 후 배치를 모으는 시간(초)
+INGEST_PERSIST_INTERVAL = float(os.getenv("INGEST_PERSIST_INTERVAL", "2"))   # 저장 최소 간격(초), 대기열이 비면 즉시
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "256"))             # 넘으면 429
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))            # 상태 조회용으로 보관할 작업 수
+INGEST_PERSIST_RETRY_MAX = float(os.getenv("INGEST_PERSIST_RETRY_MAX", "60"))  # 저장 실패 시 재시도 간격 상한(초)
+
+FINISHED = ("done", "duplicate", "failed")
+
+
+class IngestJob:
+    """
+    status: queued → embedding → searchable(인덱스에 추가, 아직 저장 전) → done(디스크 저장)
+    중복 거절은 duplicate, 오류는 failed.
+    """
+    def __init__(self, content: str):
+        self.id = uuid.uuid4().hex
+        self.story_id = str(uuid.uuid4())
+        self.content = content
+        self.status = "queued"
+        self.stored_id: Optional[str] = None  # 병합 시 기존 사연 ID
+        self.duplicate_of: Optional[str] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.searchable_at: Optional[float] = None
+        self.persisted_at: Optional[float] = None
+
+    def message(self) -> str:
+        """프론트에 그대로 보여줄 문구 (예전 /add-story 응답과 같은 문구)"""
+        if self.status == "duplicate":
+            return f"이미 비슷한 사연이 등록되어 있어요. 🙏\n(ID: {self.duplicate_of[:8]}...)"
+        if self.status == "failed":
+            return "사연을 추가하지 못했습니다. 다시 시도해주세요. 🙏"
+        if self.status in ("searchable", "done"):
+            if self.stored_id != self.story_id:
+                return f"비슷한 사연이 이미 있어 기존 사연에 합쳤습니다. 🙌\n(ID: {self.stored_id[:8]}...)"
+            return f"사연이 성공적으로 추가되었습니다! 🎉\n(ID: {self.story_id[:8]}...)"
+        return f"사연을 접수했어요. 곧 검색에 반영됩니다. ⏳\n(ID: {self.story_id[:8]}...)"
+
+    def to_dict(self) -> Dict[str, Any]:
+        def since_submit(t):
+            return round((t - self.submitted_at) * 1000, 1) if t else None
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "story_id": self.stored_id or self.story_id,
+            "merged": self.stored_id is not None and self.stored_id != self.story_id,
+            "duplicate_of": self.duplicate_of,
+            "error": self.error,
+            "message": self.message(),
+            "time_to_searchable_ms": since_submit(self.searchable_at),
+            "time_to_persisted_ms": since_submit(self.persisted_at),
+        }
+
+
+class IngestQueue:
+    """
+    get_store: 현재 서빙 중인 벡터 스토어를 돌려주는 함수 (컷오버 후에는 새 스토어에 쓴다).
+    """
+    def __init__(self, get_store: Callable[[], Any], batch_size: int = INGEST_BATCH_SIZE,
+                 batch_wait: float = INGEST_BATCH_WAIT, persist_interval: float = INGEST_PERSIST_INTERVAL, max_pending: int = INGEST_MAX_PENDING,
+                 history: int = INGEST_JOB_HISTORY):
+        self.get_store = get_store
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.persist_interval = persist_interval
+        self.max_pending = max_pending
+        self.history = history
+        self.write_lock = threading.Lock()
+
+        self._pending: Deque[IngestJob] = deque()
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._unsaved: List[IngestJob] = []  # searchable이지만 아직 저장 전
+        self._unsaved_store = None
+        self._last_persist = time.monotonic()
+        self._persist_failures = 0         # 연속 저장 실패 수 (재시도 간격을 늘린다)
+        self._retry_persist_at = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._avg_batch_s = 0.5
+        self.batches = 0
+        self.persists = 0
+        self.rejected = 0
+        self._searchable_ms: Deque[float] = deque(maxlen=200)
+
+    # ---- 접수/조회 (이벤트 루프) ----
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(len(self._pending) / self.batch_size * self._avg_batch_s))
+
+    def submit(self, content: str) -> IngestJob:
+        if len(self._pending) >= self.max_pending:
+            self.rejected += 1
+            raise AdmissionRejected(429, self._retry_after(), "add-story: 적재 대기열이 가득 찼습니다.")
+        job = IngestJob(content)
+        self._pending.append(job)
+        self._remember(job)
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def _remember(self, job: IngestJob):
+        self._jobs[job.id] = job
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        # 끝난 작업부터 오래된 순으로 지운다 (저장이 계속 실패해 searchable로 남은 작업이 앞을 막아도)
+        finished = [k for k, j in self._jobs.items() if j.status in FINISHED][:excess]
+        for k in finished:
+            del self._jobs[k]
+        # 그래도 넘치면 상태와 무관하게 오래된 것부터 (조회만 안 될 뿐 적재/저장은 계속된다)
+        while len(self._jobs) > self.history:
+            self._jobs.popitem(last=False)
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    # ---- 워커 ----
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                wait = self._retry_persist_at - time.monotonic()
+                if self._unsaved and wait <= 0:
+                    await loop.run_in_executor(None, self._persist)
+                    continue
+                # 저장 실패 후에는 백오프 동안 기다리되, 새 사연이 오면 깨어나 적재는 계속한다
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait if self._unsaved else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # 조금 기다려 동시에 들어온 사연을 한 배치로 모은다
+            if len(self._pending) < self.batch_size and self.batch_wait > 0:
+                await asyncio.sleep(self.batch_wait)
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            start = time.monotonic()
+            await self._process_safely(batch)
+            self._avg_batch_s = 0.8 * self._avg_batch_s + 0.2 * (time.monotonic() - start)
+            now = time.monotonic()
+            if self._unsaved and now - self._last_persist >= self.persist_interval and now >= self._retry_persist_at:
+                await loop.run_in_executor(None, self._persist)
+
+    async def _process_safely(self, batch: List[IngestJob]):
+        """배치 하나를 처리하고, 실패하면 그 배치에서 아직 결과가 없는 작업만 failed로 표시"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._process, batch)
+        except Exception as e:
+            print(f"⚠️ 사연 적재 실패 ({len(batch)}건): {e}")
+            for job in batch:
+                if job.status not in ("searchable",) + FINISHED:
+                    job.status, job.error = "failed", str(e)
+
+    def _process(self, batch: List[IngestJob]):
+        """배치 임베딩 + 인덱스 추가 (스레드). 저장은 _persist에서 몰아서."""
+        for job in batch:
+            job.status = "embedding"
+        with self.write_lock:
+            store = self.get_store()
+            if self._unsaved and store is not self._unsaved_store:
+                self._persist_locked()  # 컷오버 등으로 스토어가 바뀌었으면 이전 스토어 분량부터 저장
+            results = add_stories_to_vector_store(store, [(j.content, j.story_id) for j in batch], persist=False)
+            now = time.time()
+            for job, result in zip(batch, results):
+                job.content = ""  # 인덱스에 들어갔으니 본문은 더 들고 있지 않는다
+                if isinstance(result, DuplicateStoryError):
+                    job.status, job.duplicate_of = "duplicate", result.duplicate_of
+                    continue
+                if isinstance(result, Exception):
+                    job.status, job.error = "failed", str(result)  # 이 사연만 실패, 나머지는 저장 대상
+                    continue
+                job.status, job.stored_id, job.searchable_at = "searchable", result, now
+                self._searchable_ms.append((now - job.submitted_at) * 1000)
+                self._unsaved.append(job)
+            if self._unsaved:
+                self._unsaved_store = store
+        self.batches += 1
+        print(f"📥 사연 배치 적재 {len(batch)}건 (대기 {len(self._pending)}건)")
+
+    def _persist(self):
+        with self.write_lock:
+            self._persist_locked()
+
+    def _persist_locked(self):
+        if not self._unsaved:
+            return
+        jobs, self._unsaved = self._unsaved, []
+        try:
+            save_vector_store(self._unsaved_store)
+        except Exception as e:
+            # 인덱스에는 들어가 있으므로 다음 저장에 다시 시도 (디스크 부족 등은 바로 풀리지 않으니 간격을 늘려가며)
+            self._unsaved = jobs + self._unsaved
+            self._persist_failures += 1
+            delay = min(INGEST_PERSIST_RETRY_MAX, max(1.0, self.persist_interval) * 2 ** (self._persist_failures - 1))
+            self._retry_persist_at = time.monotonic() + delay
+            print(f"⚠️ 벡터 스토어 저장 실패 ({delay:.0f}초 후 재시도): {e}")
+            return
+        self._persist_failures = 0
+        self._retry_persist_at = 0.0
+        now = time.time()
+        for job in jobs:
+            job.status, job.persisted_at = "done", now
+        self._last_persist = time.monotonic()
+        self.persists += 1
+
+    # ---- 인덱스 쓰기와 겹치면 안 되는 작업 ----
+    async def run_exclusive(self, fn: Callable, *args):
+        """진행 중인 배치/저장이 끝난 뒤 fn을 스레드에서 실행 (컷오버/롤백용). 저장 전 분량은 먼저 저장."""
+        def locked():
+            with self.write_lock:
+                self._persist_locked()
+                return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, locked)
+
+    async def flush(self):
+        """종료 시: 워커를 멈추고 남은 대기열을 처리해 저장"""
+        loop = asyncio.get_running_loop()
+        if self._worker is not None:
+            self._worker.cancel()  # 실행 중인 배치는 스레드에서 끝까지 돌고, 아래 작업은 write_lock에서 기다린다
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            await self._process_safely(batch)  # 한 배치가 실패해도 나머지 배치와 마지막 저장은 진행
+        await loop.run_in_executor(None, self._persist)
+
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self._searchable_ms)
+        return {
+            "pending": len(self._pending),
+            "unsaved": len(self._unsaved),
+            "batches": self.batches,
+            "persists": self.persists,
+            "persist_failures": self._persist_failures,
+            "rejected": self.rejected,
+            "avg_batch_ms": round(self._avg_batch_s * 1000, 1),
+            "time_to_searchable_p50_ms": round(samples[len(samples) // 2], 1) if samples else None,
+            "time_to_searchable_max_ms": round(samples[-1], 1) if samples else None,
+        }
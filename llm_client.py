@@ -0,0 +1,299 @@
+# llm_client.py
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import threading
+import http.client
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from queue import LifoQueue, Empty, Full
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+# ---- 설정 ----
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))            # keep-alive 연결 수
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))               # 요청 1회 타임아웃(초)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))          # 일시적 오류 재시도 횟수
+LLM_BACKOFF_BASE_MS = float(os.getenv("LLM_BACKOFF_BASE_MS", "200"))
+LLM_BACKOFF_MAX_MS = float(os.getenv("LLM_BACKOFF_MAX_MS", "4000"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"                    # p95 지연 후 중복 요청
+LLM_HEDGE_MIN_SAMPLES = 20                                        # p95 추정에 필요한 최소 표본
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "300"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(RuntimeError):
+    """재시도해도 소용없는 오류 (4xx, 응답 차단 등)"""
+
+
+class TransientLLMError(LLMError):
+    """재시도 가능한 오류 (429/5xx, 연결 끊김, 타임아웃)"""
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class GeminiResponse:
+    """genai 응답과 같은 .text 인터페이스"""
+    text: str
+    raw: Dict[str, Any]
+
+
+class ConnectionPool:
+    """한 호스트에 대한 keep-alive HTTP(S) 연결 풀 (스레드 안전)"""
+    def __init__(self, base_url: str, size: int = LLM_POOL_SIZE, timeout: float = LLM_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._idle: LifoQueue = LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _new_connection(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        with self._lock:
+            self.created += 1
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            return self._new_connection(), False
+        with self._lock:
+            self.reused += 1
+        return conn, True
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def request(self, method: str, path: str, body: bytes, headers: Dict[str, str]):
+        """(status, headers, body) 반환. 재사용한 연결이 서버 쪽에서 닫혀 있었으면 새 연결로 1회 재시도."""
+        conn, reused = self._acquire()
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers)
+            res = conn.getresponse()
+            data = res.read()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            conn.close()
+            if not reused:
+                raise
+            conn = self._new_connection()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                res = conn.getresponse()
+                data = res.read()
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        if res.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        return res.status, dict(res.getheaders()), data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+
+def percentile(values, p: float) -> float:
+    """nearest-rank 백분위수 (값이 없으면 0)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 헤더 → 초. 초 단위 숫자와 HTTP-date 둘 다 허용, 해석할 수 없으면 None (무시)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class GeminiClient:
+    """
+    Gemini REST(generateContent) 클라이언트.
+    - keep-alive 연결 풀 재사용
+    - 일시적 오류(429/5xx/연결 오류)는 full-jitter 지수 백오프로 재시도 (Retry-After 존중)
+    - agenerate_content: 최근 p95 지연이 지나도 응답이 없으면 같은 요청을 한 번 더 보내 먼저 온 결과 사용
+    """
+    def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash",
+                 generation_config: Optional[Dict[str, Any]] = None, base_url: str = GEMINI_API_BASE,
+                 pool_size: int = LLM_POOL_SIZE, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, hedge: bool = LLM_HEDGE):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.pool = ConnectionPool(base_url, size=pool_size, timeout=timeout)
+        self.max_retries = max_retries
+        self.hedge = hedge
+        # 헤지 요청까지 동시에 돌 수 있도록 연결 수의 2배
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix="gemini")
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "retries": 0, "failures": 0, "hedges_sent": 0, "hedges_won": 0}
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _post_once(self, prompt: str) -> GeminiResponse:
+        config = {
+            "temperature": self.generation_config.get("temperature"),
+            "topP": self.generation_config.get("top_p"),
+            "topK": self.generation_config.get("top_k"),
+            "maxOutputTokens": self.generation_config.get("max_output_tokens"),
+        }
+        body = json.dumps({
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {k: v for k, v in config.items() if v is not None},
+        }).encode("utf-8")
+        headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
+        try:
+            status, res_headers, data = self.pool.request(
+                "POST", f"/v1beta/models/{self.model_name}:generateContent", body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            raise TransientLLMError(f"연결 오류: {e}") from e
+
+        if status in RETRYABLE_STATUS:
+            retry_after = res_headers.get("Retry-After") or res_headers.get("retry-after")
+            raise TransientLLMError(f"HTTP {status}: {data[:200]!r}",
+                                    retry_after=parse_retry_after(retry_after))
+        if status != 200:
+            raise LLMError(f"HTTP {status}: {data[:200]!r}")
+
+        payload = json.loads(data.decode("utf-8"))
+        candidates = payload.get("candidates") or []
+        if not candidates:
+            raise LLMError(f"응답 후보 없음: {payload.get('promptFeedback')}")
+        finish_reason = candidates[0].get("finishReason", "STOP")
+        parts = candidates[0].get("content", {}).get("parts", [])
+        text = "".join(p.get("text", "") for p in parts)
+        # SAFETY/RECITATION 등으로 막힌 응답은 빈 답변이 아니라 오류 (체인의 오류 문구로)
+        if finish_reason not in ("STOP", "MAX_TOKENS") or not text:
+            raise LLMError(f"응답 차단 또는 빈 응답 (finishReason={finish_reason})")
+        return GeminiResponse(text=text, raw=payload)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """full jitter: U(0, min(max, base * 2^attempt)), Retry-After가 더 길면 그쪽을 따름"""
+        cap = min(LLM_BACKOFF_MAX_MS, LLM_BACKOFF_BASE_MS * (2 ** attempt)) / 1000.0
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, LLM_BACKOFF_MAX_MS / 1000.0))
+        return delay
+
+    def generate_content(self, prompt: str, deadline: Optional[float] = None,
+                         cancel: Optional[threading.Event] = None) -> GeminiResponse:
+        """
+        동기 호출 (재시도 포함).
+        deadline(time.monotonic 기준)까지 재시도를 끝낼 수 없거나 cancel이 설정되면 더 보내지 않고 실패.
+        """
+        self._count("requests")
+        cancel = cancel or threading.Event()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self._post_once(prompt)
+            except TransientLLMError as e:
+                delay = self._backoff(attempt, e.retry_after)
+                expired = deadline is not None and time.monotonic() + delay >= deadline
+                if attempt >= self.max_retries or expired or cancel.is_set():
+                    self._count("failures")
+                    raise
+                print(f"⚠️ Gemini 일시 오류, {delay * 1000:.0f}ms 후 재시도 ({attempt + 1}/{self.max_retries}): {e}")
+                self._count("retries")
+                if cancel.wait(delay):
+                    # 기다리던 호출자가 사라졌으면 쿼터/스레드를 더 쓰지 않는다
+                    self._count("failures")
+                    raise
+                attempt += 1
+                continue
+            except LLMError:
+                self._count("failures")
+                raise
+            with self._lock:
+                self._latencies.append(time.perf_counter() - start)
+            return response
+
+    def hedge_delay(self) -> Optional[float]:
+        """헤지 요청을 보낼 대기 시간(초). 표본이 부족하면 None."""
+        with self._lock:
+            if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            p95 = percentile(self._latencies, 95)
+        return max(p95, LLM_HEDGE_MIN_DELAY_MS / 1000.0)
+
+    async def agenerate_content(self, prompt: str, timeout: Optional[float] = None) -> GeminiResponse:
+        """
+        비동기 호출. hedge가 켜져 있으면 p95 지연 후 중복 요청을 보내 먼저 끝난 결과 사용.
+        timeout(초)이 지나거나 이 코루틴이 취소되거나 끝나면 스레드에 남은 요청은 재시도하지 않는다.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        cancel = threading.Event()
+        try:
+            primary = loop.run_in_executor(self._executor, self.generate_content, prompt, deadline, cancel)
+            delay = self.hedge_delay() if self.hedge else None
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            self._count("hedges_sent")
+            hedged = loop.run_in_executor(self._executor, self.generate_content, prompt, deadline, cancel)
+            pending = {primary, hedged}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    if fut.exception() is None:
+                        if fut is hedged:
+                            self._count("hedges_won")
+                        # 남은 요청은 지금 보낸 1회만 끝나고 결과는 버린다
+                        return fut.result()
+                    error = fut.exception()
+            raise error
+        finally:
+            cancel.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["p95_ms"] = percentile(self._latencies, 95) * 1000 if self._latencies else None
+        stats["connections_created"] = self.pool.created
+        stats["connections_reused"] = self.pool.reused
+        return stats
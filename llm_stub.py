@@ -0,0 +1,166 @@
+# llm_stub.py
+"""
+로컬 Gemini 스텁.
+- StubModel: generate_content 인터페이스 (프로세스 내)
+- serve: generateContent REST 엔드포인트를 흉내내는 HTTP 서버
+
+  python llm_stub.py --port 8089 --error-rate 0.05
+  GEMINI_API_BASE=http://127.0.0.1:8089 python web_app.py
+"""
+import re
+import json
+import math
+import argparse
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---- 기본 지연 분포 (실측 Gemini 2.0 Flash 응답 시간을 대략 흉내) ----
+CONDENSE_MEDIAN_MS = 350.0   # 질문 변환(짧은 출력)
+ANSWER_MEDIAN_MS = 1400.0    # 답변 생성(긴 출력)
+LATENCY_SIGMA = 0.35         # 로그정규 분산
+TAIL_PROB = 0.02             # 가끔 발생하는 느린 응답 비율
+TAIL_FACTOR = 4.0            # 느린 응답 배수
+
+_NEW_QUESTION = re.compile(r"<new_question>\s*(.*?)\s*</new_question>", re.S)
+
+
+@dataclass
+class StubResponse:
+    text: str
+
+
+class StubModel:
+    """
+    genai.GenerativeModel의 generate_content만 흉내내는 로컬 스텁.
+    지연은 로그정규분포 + 드문 꼬리 지연, error_rate 비율로 예외 발생.
+    faults: HTTP 서버가 들어온 순서대로 한 번씩 적용할 응답 (테스트용), 예:
+      {"status": 429, "retry_after": "1"}, {"delay_s": 2.0}, {"finish_reason": "SAFETY"}
+    """
+    def __init__(self, condense_median_ms: float = CONDENSE_MEDIAN_MS, answer_median_ms: float = ANSWER_MEDIAN_MS,
+                 sigma: float = LATENCY_SIGMA, tail_prob: float = TAIL_PROB, tail_factor: float = TAIL_FACTOR,
+                 error_rate: float = 0.0, seed=None, faults=None):
+        self.condense_median_ms = condense_median_ms
+        self.answer_median_ms = answer_median_ms
+        self.sigma = sigma
+        self.tail_prob = tail_prob
+        self.tail_factor = tail_factor
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.faults = deque(faults or [])
+        self.served = 0  # HTTP 서버가 받은 요청 수
+
+    def next_fault(self) -> dict:
+        with self._lock:
+            self.served += 1
+            return self.faults.popleft() if self.faults else {}
+
+    @staticmethod
+    def _is_condense(prompt: str) -> bool:
+        return "<new_question>" in prompt
+
+    def sample_latency(self, prompt: str):
+        """프롬프트 종류별 (지연 초, 실패 여부)"""
+        median = self.condense_median_ms if self._is_condense(prompt) else self.answer_median_ms
+        with self._lock:
+            latency = median * math.exp(self.sigma * self._rng.gauss(0.0, 1.0))
+            if self._rng.random() < self.tail_prob:
+                latency *= self.tail_factor
+            failed = self._rng.random() < self.error_rate
+        return latency / 1000.0, failed
+
+    def respond(self, prompt: str) -> str:
+        if self._is_condense(prompt):
+            m = _NEW_QUESTION.search(prompt)
+            return m.group(1) if m else prompt[-200:]
+        return "1) 한줄요약: (stub) 상황을 정리해 볼게요.\n\n2) 핵심 조언\n- 솔직한 마음을 차분히 전해 보세요."
+
+    def generate_content(self, prompt: str) -> StubResponse:
+        latency, failed = self.sample_latency(prompt)
+        time.sleep(latency)
+        if failed:
+            raise RuntimeError("stub: simulated upstream error (503)")
+        return StubResponse(text=self.respond(prompt))
+
+
+def _make_handler(model: StubModel):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def _send_json(self, status: int, payload: dict, headers: dict = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": {"code": 400, "message": "invalid JSON"}})
+                return
+            if not self.path.endswith(":generateContent"):
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+                return
+
+            prompt = "".join(p.get("text", "") for c in request.get("contents", []) for p in c.get("parts", []))
+            fault = model.next_fault()
+            latency, failed = model.sample_latency(prompt)
+            time.sleep(fault.get("delay_s", latency))
+            status = fault.get("status", 503 if failed else 200)
+            if status != 200:
+                self._send_json(status, {"error": {"code": status, "message": "stub: simulated overload"}},
+                                headers={"Retry-After": fault.get("retry_after", "0")})
+                return
+            if fault.get("finish_reason"):
+                # 안전 필터 등으로 막힌 후보: content 없이 finishReason만
+                self._send_json(200, {"candidates": [{"finishReason": fault["finish_reason"]}]})
+                return
+            self._send_json(200, {"candidates": [{"content": {"role": "model", "parts": [{"text": model.respond(prompt)}]},
+                                                  "finishReason": "STOP"}]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8089, model: StubModel = None) -> ThreadingHTTPServer:
+    """스텁 서버 생성 (serve_forever는 호출측에서)"""
+    server = ThreadingHTTPServer((host, port), _make_handler(model or StubModel()))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 Gemini generateContent 스텁 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--condense-ms", type=float, default=CONDENSE_MEDIAN_MS, help="질문 변환 지연 중앙값")
+    parser.add_argument("--answer-ms", type=float, default=ANSWER_MEDIAN_MS, help="답변 생성 지연 중앙값")
+    parser.add_argument("--tail-prob", type=float, default=TAIL_PROB)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    model = StubModel(condense_median_ms=args.condense_ms, answer_median_ms=args.answer_ms,
+                      tail_prob=args.tail_prob, error_rate=args.error_rate, seed=args.seed)
+    server = serve(args.host, args.port, model)
+    print(f"🧪 Gemini 스텁 서버 → http://{args.host}:{args.port} (GEMINI_API_BASE로 지정)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# loadtest.py
+"""
+logs/chat_log.json의 실제 사용자 입력을 기록된 도착 간격대로 재생하는 open-loop 부하 생성기.
+
+  # 체인 직접 호출 (스텁 Gemini, 실제 FAISS 검색)
+  python loadtest.py --rate 5
+
+  # 실행 중인 서버의 /chat 호출
+  python loadtest.py --url http://localhost:8000/chat --rate 2
+"""
+import os
+import json
+import asyncio
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Tuple
+
+from chain import GENERATION_ERROR_MESSAGE, CHAIN_ERROR_MESSAGE, GENERATION_TIMEOUT_MESSAGE
+from llm_client import percentile
+
+CHAT_LOG_FILE = os.path.join("logs", "chat_log.json")
+ERROR_REPLIES = (GENERATION_ERROR_MESSAGE, CHAIN_ERROR_MESSAGE, GENERATION_TIMEOUT_MESSAGE)
+
+
+def load_arrivals(path: str, rate: float, max_gap: float) -> List[Tuple[float, str]]:
+    """
+    로그 → (상대 도착 시각 초, 사용자 입력) 목록.
+    rate 배속으로 압축하고, 세션 사이의 긴 공백은 max_gap초로 자른다.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    entries = [e for e in entries if e.get("user_input") and e.get("timestamp")]
+    entries.sort(key=lambda e: e["timestamp"])
+
+    arrivals, offset, prev = [], 0.0, None
+    for e in entries:
+        ts = datetime.fromisoformat(e["timestamp"]).timestamp()
+        if prev is not None:
+            offset += min(ts - prev, max_gap) / rate
+        prev = ts
+        arrivals.append((offset, e["user_input"]))
+    return arrivals
+
+
+class StubRetriever:
+    """임베딩/검색 없이 고정 지연만 주는 리트리버 (FAISS 없는 환경용)"""
+    def __init__(self, latency_ms: float = 20.0):
+        self.latency = latency_ms / 1000.0
+
+    async def ainvoke(self, query: str):
+        await asyncio.sleep(self.latency)
+        return []
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01):
+    """sleep(interval)이 늦게 깨어난 만큼을 이벤트 루프 지연으로 기록"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+def build_direct_target(args):
+    """
+    ConversationChain.ainvoke를 직접 호출하는 타깃 (스텁 Gemini).
+    StubModel.generate_content는 time.sleep으로 지연을 흉내내는 동기 호출이라, 체인이 이를 스레드에서 실행해야
+    루프 지연/처리량 수치가 의미 있다 (루프에서 바로 부르면 요청이 직렬화되고 루프 지연이 응답 시간만큼 튄다).
+    """
+    from chain import ConversationChain
+    from llm_stub import ANSWER_MEDIAN_MS, CONDENSE_MEDIAN_MS, StubModel
+
+    model = StubModel(condense_median_ms=args.stub_condense_ms or CONDENSE_MEDIAN_MS,
+                      answer_median_ms=args.stub_answer_ms or ANSWER_MEDIAN_MS,
+                      error_rate=args.stub_error_rate, seed=args.seed)
+    if args.stub_retriever:
+        chain = ConversationChain(model=model, retriever=StubRetriever())
+    else:
+        from vector_store import initialize_vector_store
+        chain = ConversationChain(vector_store=initialize_vector_store(), model=model)
+
+    async def call(message: str) -> bool:
+        result = await chain.ainvoke({"input": message})
+        return result.get("output") not in ERROR_REPLIES
+    return call
+
+
+def build_http_target(args):
+    """/chat 엔드포인트를 호출하는 타깃. 요청은 스레드풀에서 보내 클라이언트가 병목이 되지 않게 한다."""
+    executor = ThreadPoolExecutor(max_workers=args.max_inflight)
+
+    def post(message: str) -> bool:
+        body = json.dumps({"message": message}).encode("utf-8")
+        req = urllib.request.Request(args.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=args.timeout) as res:
+                payload = json.loads(res.read().decode("utf-8"))
+            return res.status == 200 and payload.get("response") not in ERROR_REPLIES
+        except Exception:
+            return False
+
+    async def call(message: str) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, post, message)
+    return call
+
+
+async def run(args) -> dict:
+    arrivals = load_arrivals(args.log, args.rate, args.max_gap)
+    if args.limit:
+        arrivals = arrivals[: args.limit]
+    if not arrivals:
+        raise SystemExit(f"재생할 요청이 없습니다: {args.log}")
+
+    call = build_http_target(args) if args.url else build_direct_target(args)
+
+    latencies: List[float] = []
+    lags: List[float] = []
+    errors = 0
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lags, stop))
+    loop = asyncio.get_running_loop()
+
+    async def fire(scheduled: float, message: str):
+        nonlocal errors
+        try:
+            ok = await call(message)
+        except Exception:
+            ok = False
+        # 예정 시각 기준으로 재서 coordinated omission을 피한다
+        latencies.append(loop.time() - scheduled)
+        if not ok:
+            errors += 1
+
+    start = loop.time()
+    tasks = []
+    for offset, message in arrivals:
+        scheduled = start + offset
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(scheduled, message)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+
+    stop.set()
+    await lag_task
+
+    total = len(arrivals)
+    return {
+        "target": args.url or "ConversationChain.ainvoke (stub Gemini)",
+        "requests": total,
+        # 요청 n개 사이의 간격은 n-1개
+        "offered_rps": (total - 1) / arrivals[-1][0] if arrivals[-1][0] > 0 else float(total),
+        "throughput_rps": total / elapsed if elapsed > 0 else 0.0,
+        "error_rate": errors / total,
+        "latency_ms": {f"p{p}": percentile(latencies, p) * 1000 for p in (50, 95, 99)},
+        "loop_lag_ms": {"p99": percentile(lags, 99) * 1000, "max": max(lags, default=0.0) * 1000},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chat_log.json 기반 트래픽 재생 부하 테스트")
+    parser.add_argument("--log", default=CHAT_LOG_FILE, help="재생할 대화 로그")
+    parser.add_argument("--rate", type=float, default=1.0, help="기록된 도착률의 배수 (2 = 두 배 빠르게)")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="기록상 요청 간격 상한(초), 세션 사이 공백 압축")
+    parser.add_argument("--limit", type=int, default=0, help="재생할 최대 요청 수 (0 = 전부)")
+    parser.add_argument("--url", default="", help="지정하면 HTTP로 /chat 호출, 없으면 체인 직접 호출")
+    parser.add_argument("--timeout", type=float, default=60.0, help="HTTP 요청 타임아웃(초)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="HTTP 모드 동시 요청 스레드 수")
+    parser.add_argument("--stub-retriever", action="store_true", help="FAISS 대신 고정 지연 리트리버 사용")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="스텁 Gemini 오류 비율")
+    parser.add_argument("--stub-condense-ms", type=float, default=0.0, help="스텁 질문 변환 지연 중앙값 (0 = 기본값)")
+    parser.add_argument("--stub-answer-ms", type=float, default=0.0, help="스텁 답변 생성 지연 중앙값 (0 = 기본값)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    lat, lag = report["latency_ms"], report["loop_lag_ms"]
+    print("--------------------------------------------------")
+    print(f"대상: {report['target']}")
+    print(f"요청 {report['requests']}건 | 제공 부하 {report['offered_rps']:.2f} rps | 처리량 {report['throughput_rps']:.2f} rps")
+    print(f"지연 p50 {lat['p50']:.0f}ms | p95 {lat['p95']:.0f}ms | p99 {lat['p99']:.0f}ms")
+    print(f"오류율 {report['error_rate'] * 100:.1f}%")
+    print(f"이벤트 루프 지연 p99 {lag['p99']:.1f}ms | max {lag['max']:.1f}ms")
+    print("--------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
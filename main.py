@@ -7,6 +7,7 @@ from datetime import datetime
 from dotenv import load_dotenv
 
 from vector_store import initialize_vector_store, add_story_to_vector_store
+from dedup import DuplicateStoryError
 from chain import get_conversational_chain
 
 # Load environment variables
@@ -63,8 +64,15 @@ async def add_story_cli(story_content: str):
         await initialize_application() # Ensure vector store is initialized
 
     story_id = str(uuid.uuid4()) # Generate a unique ID for the story
-    add_story_to_vector_store(vector_store, story_content, story_id, persist=True)
-    print(f"사연이 성공적으로 추가되었습니다. (ID: {story_id})")
+    try:
+        stored_id = add_story_to_vector_store(vector_store, story_content, story_id, persist=True)
+    except DuplicateStoryError as e:
+        print(f"이미 비슷한 사연이 있어 추가하지 않았습니다. (ID: {e.duplicate_of})")
+        return
+    if stored_id != story_id:
+        print(f"비슷한 사연이 있어 기존 사연에 병합되었습니다. (ID: {stored_id})")
+    else:
+        print(f"사연이 성공적으로 추가되었습니다. (ID: {story_id})")
 
 async def chat_cli(question: str):
     if not conversation_chain:
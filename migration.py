@@ -0,0 +1,257 @@
+# migration.py
+"""
+임베딩 모델 무중단 교체.
+
+  1) MigrationJob: 서빙 중인 인덱스의 문서를 새 모델(/백엔드)로 다시 임베딩해 새 버전 디렉터리에 빌드 (백그라운드 스레드)
+  2) DualReader: 컷오버 전 같은 질문을 두 인덱스로 검색해 story_id 겹침 비교
+  3) cutover: 빌드 중 추가/삭제된 문서를 마저 반영하고 CURRENT를 원자적으로 교체
+
+  python migration.py status
+  python migration.py build --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 --compare 20 --switch
+  python migration.py switch <버전>     # 롤백 포함
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from chunking import parent_key
+from docstore import update_document
+from index_versions import EMBEDDING_MODEL, current_version, list_versions, new_version_name, read_manifest, switch_current
+from sharded_store import ShardedVectorStore
+from vector_store import (
+    VECTOR_BACKEND, VECTOR_BACKENDS, _get_embeddings, _remove_dummy_if_exists, _tag, create_empty_vector_store,
+    initialize_vector_store, iter_documents, save_vector_store,
+)
+
+# ---- 설정 ----
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "64"))  # 한 번에 임베딩할 문서 수
+INDEX_DUAL_READ = os.getenv("INDEX_DUAL_READ", "0") == "1"             # 컷오버 전 실시간 질문으로 두 인덱스 비교
+
+
+def _snapshot(vector_store) -> Dict[str, Any]:
+    """docstore id → Document (더미 제외). 서빙 스레드가 쓰는 중이어도 복사본으로 작업."""
+    return {k: d for k, d in iter_documents(vector_store) if not getattr(d, "metadata", {}).get("is_dummy")}
+
+
+class MigrationJob:
+    """
+    source(서빙 중인 스토어)의 모든 패시지를 model_name으로 다시 임베딩해 backend로 새 버전을 만든다.
+    status: pending → building → ready → switched (실패 시 failed)
+    """
+    def __init__(self, source, model_name: str = EMBEDDING_MODEL, batch_size: int = MIGRATION_BATCH_SIZE,
+                 backend: str = VECTOR_BACKEND):
+        self.source = source
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.version = new_version_name(model_name)
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.total = 0
+        self.embedded = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.target = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MigrationJob":
+        """백그라운드 스레드에서 빌드 (서빙은 그대로 기존 인덱스 사용)"""
+        self._thread = threading.Thread(target=self.run, name=f"migration-{self.version}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _copy(self, docs: Dict[str, Any]):
+        """문서를 배치로 임베딩해 target에 같은 id/metadata로 추가"""
+        emb = _get_embeddings(self.model_name)
+        items = list(docs.items())
+        for i in range(0, len(items), self.batch_size):
+            batch = items[i:i + self.batch_size]
+            texts = [d.page_content for _, d in batch]
+            vectors = emb.embed_documents(texts)
+            pairs = list(zip(texts, vectors))
+            metadatas = [dict(d.metadata) for _, d in batch]
+            ids = [k for k, _ in batch]
+            self.target.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+            self.embedded += len(batch)
+
+    def run(self):
+        self.status = "building"
+        self.started_at = time.time()
+        print(f"🏗️ 인덱스 재빌드 시작 → {self.version} (backend={self.backend}, model={self.model_name})")
+        try:
+            docs = _snapshot(self.source)
+            self.total = len(docs)
+            with self._lock:
+                # FAISS는 더미와 함께 생성 → catch_up에서 제거
+                self.target = _tag(create_empty_vector_store(self.model_name, self.backend),
+                                   self.version, self.model_name)
+                if isinstance(self.target, ShardedVectorStore) and self.target.partition == "time":
+                    missing = sum(1 for d in docs.values() if not d.metadata.get("added_at"))
+                    if missing:
+                        # 추가 시각을 알 수 없는 사연을 지금 시각 샤드 하나에 몰아넣지 않는다
+                        raise ValueError(f"added_at이 없는 문서 {missing}개는 time 분할로 옮길 수 없습니다 "
+                                         f"(SHARD_PARTITION=hash로 빌드)")
+                self._copy(docs)
+            self.catch_up()
+            save_vector_store(self.target)
+            self.status = "ready"
+            print(f"✅ 인덱스 재빌드 완료 → {self.version} ({self.embedded}개 임베딩)")
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print(f"⚠️ 인덱스 재빌드 실패: {e}")
+        finally:
+            self.finished_at = time.time()
+
+    def catch_up(self) -> int:
+        """빌드 중 서빙 인덱스에 생긴 추가/삭제/메타데이터(병합 기록) 변경을 target에 반영. 반영한 문서 수."""
+        with self._lock:
+            source = _snapshot(self.source)
+            target_ids = set(_snapshot(self.target))
+            added = {k: d for k, d in source.items() if k not in target_ids}
+            removed = [k for k in target_ids if k not in source]
+            if added:
+                self._copy(added)
+                self.total += len(added)
+            if removed:
+                self.target.delete(removed)
+            for k, doc in source.items():
+                copied = self.target.docstore.search(k)
+                if copied is not None and not isinstance(copied, str) and copied.metadata != doc.metadata:
+                    copied.metadata = dict(doc.metadata)
+                    update_document(self.target.docstore, copied, k)
+            if source:
+                _remove_dummy_if_exists(self.target)
+        return len(added) + len(removed)
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "model": self.model_name,
+            "backend": self.backend,
+            "status": self.status,
+            "error": self.error,
+            "embedded": self.embedded,
+            "total": self.total,
+            "elapsed_s": round((self.finished_at or time.time()) - self.started_at, 1) if self.started_at else None,
+        }
+
+
+def cutover(job: MigrationJob):
+    """
+    마지막 차이를 반영해 저장하고 CURRENT를 새 버전으로 교체. 새 스토어 반환.
+    서빙 쪽 사연 추가와 겹치지 않는 곳(이벤트 루프 스레드 등)에서 호출.
+    """
+    if job.status != "ready":
+        raise ValueError(f"전환할 수 없는 상태입니다: {job.status}")
+    synced = job.catch_up()
+    save_vector_store(job.target)
+    switch_current(job.version)
+    job.status = "switched"
+    print(f"🔀 인덱스 전환 완료 → {job.version} (컷오버 중 반영 {synced}개)")
+    return job.target
+
+
+def story_ids(docs) -> List[str]:
+    """검색 결과의 부모 사연 id (순서 유지, 중복 제거)"""
+    seen = []
+    for d in docs:
+        key = str(parent_key(d))
+        if key not in seen:
+            seen.append(key)
+    return seen
+
+
+def overlap(a: List[str], b: List[str]) -> float:
+    """overlap@k = |A∩B| / max(|A|, |B|). 둘 다 비어 있으면 1."""
+    if not a and not b:
+        return 1.0
+    return len(set(a) & set(b)) / max(len(a), len(b))
+
+
+class DualReader:
+    """같은 질문을 서빙(primary)/후보(candidate) 리트리버로 함께 검색해 story_id 겹침을 기록"""
+    def __init__(self, primary, candidate, max_samples: int = 500):
+        self.primary = primary
+        self.candidate = candidate
+        self._samples = deque(maxlen=max_samples)
+
+    async def compare(self, query: str) -> Dict[str, Any]:
+        primary_docs, candidate_docs = await asyncio.gather(
+            self.primary.ainvoke(query), self.candidate.ainvoke(query))
+        a, b = story_ids(primary_docs), story_ids(candidate_docs)
+        result = {"query": query, "primary": a, "candidate": b, "overlap": overlap(a, b)}
+        self._samples.append(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        samples = list(self._samples)
+        if not samples:
+            return {"samples": 0}
+        return {
+            "samples": len(samples),
+            "mean_overlap": round(sum(s["overlap"] for s in samples) / len(samples), 3),
+            "identical_rate": round(sum(1 for s in samples if s["primary"] == s["candidate"]) / len(samples), 3),
+            "recent": samples[-5:],
+        }
+
+
+def recent_queries(limit: int = 20, path: str = os.path.join("logs", "chat_log.json")) -> List[str]:
+    """비교용 질문: 대화 로그의 최근 사용자 입력"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    return [e["user_input"] for e in entries if e.get("user_input")][-limit:]
+
+
+def main():
+    from retriever import get_retriever_with_threshold
+
+    parser = argparse.ArgumentParser(description="인덱스 버전 관리 / 임베딩 모델 마이그레이션")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="버전 목록과 매니페스트")
+    build = sub.add_parser("build", help="현재 인덱스를 새 모델로 재빌드")
+    build.add_argument("--model", default=EMBEDDING_MODEL)
+    build.add_argument("--backend", default=VECTOR_BACKEND, choices=VECTOR_BACKENDS)
+    build.add_argument("--compare", type=int, default=0, help="최근 질문 N개로 기존/새 인덱스 비교")
+    build.add_argument("--switch", action="store_true", help="빌드 후 CURRENT 전환")
+    switch = sub.add_parser("switch", help="CURRENT를 지정 버전으로 (롤백)")
+    switch.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        current = current_version()
+        for version in list_versions():
+            mark = "*" if version == current else " "
+            print(f"{mark} {version}: {json.dumps(read_manifest(version), ensure_ascii=False)}")
+        return
+    if args.command == "switch":
+        switch_current(args.version)
+        return
+
+    job = MigrationJob(initialize_vector_store(), args.model, backend=args.backend)
+    job.run()
+    if job.status != "ready":
+        raise SystemExit(1)
+    if args.compare:
+        reader = DualReader(get_retriever_with_threshold(job.source), get_retriever_with_threshold(job.target))
+
+        async def compare_all(queries):
+            for q in queries:
+                r = await reader.compare(q)
+                print(f"overlap={r['overlap']:.2f} | {q[:40]}")
+        asyncio.run(compare_all(recent_queries(args.compare)))
+        print(json.dumps({k: v for k, v in reader.stats().items() if k != "recent"}, ensure_ascii=False))
+    if args.switch:
+        cutover(job)
+
+
+if __name__ == "__main__":
+    main()
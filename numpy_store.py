@@ -0,0 +1,346 @@
+# numpy_store.py
+"""
+FAISS / LangChain 벡터스토어 없이 NumPy만으로 동작하는 소규모용 벡터 저장소 (VECTOR_BACKEND=numpy).
+
+  <버전 디렉터리>/
+    vectors.<N>.npy   # 정규화 임베딩 float16 (capacity × dim, memmap) — 앞의 len(ids)행만 유효
+    ids.<N>.npy       # 행 번호 → docstore ID (세대 N의 커밋 지점, 저장 때 마지막에 씀)
+    docs.jsonl        # ID, 본문, 메타데이터
+  (세대 0은 예전 이름 vectors.npy / ids.npy)
+
+추가는 현재 세대 파일의 빈 행에 쓰므로 앞쪽 행이 그대로지만, 삭제는 행이 당겨지므로 새 세대 파일에 쓴다.
+로드는 ids 파일이 있는 가장 높은 세대를 읽어, 저장 도중 중단돼도 ID와 행이 어긋나지 않는다.
+
+검색은 행렬-벡터 곱 1번 + argpartition. 점수는 FAISS(IndexFlatL2, 정규화 벡터)와 같은
+제곱 L2 거리(= 2 - 2·cos)라 retriever/dedup의 relevance 변환을 그대로 쓴다.
+기본은 memmap을 블록 단위로 float32로 바꿔 가며 검색해 벡터가 RAM을 차지하지 않는다.
+NUMPY_STORE_F32_CACHE=1이면 float32 사본을 메모리에 두고 검색한다 (벡터 메모리가 float16의 2배, 검색은 훨씬 빠름).
+"""
+import os
+import re
+import json
+import uuid
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+DOCS_FILE = "docs.jsonl"
+MIN_CAPACITY = 1024          # 최초 할당 행 수 (이후 가득 차면 2배씩)
+SEARCH_BLOCK_ROWS = 65536    # float16 → float32 변환 단위 (검색 중 임시 메모리 상한)
+F32_CACHE = os.getenv("NUMPY_STORE_F32_CACHE", "0") == "1"  # 검색용 float32 사본 (메모리 2배, 검색 ~10배 빠름)
+_GENERATION_FILE = re.compile(r"^(vectors|ids)(?:\.(\d+))?\.npy$")
+
+
+def _generation_file(kind: str, generation: int) -> str:
+    """kind: vectors | ids. 세대 0은 예전 파일 이름"""
+    return f"{kind}.npy" if generation == 0 else f"{kind}.{generation}.npy"
+
+
+def _generations(path: str, kind: str) -> List[int]:
+    if not os.path.isdir(path):
+        return []
+    found = []
+    for name in os.listdir(path):
+        m = _GENERATION_FILE.match(name)
+        if m and m.group(1) == kind:
+            found.append(int(m.group(2) or 0))
+    return sorted(found)
+
+
+def has_numpy_index(path: str) -> bool:
+    """numpy 백엔드로 저장된 디렉터리인지 (커밋된 ids 파일 존재)"""
+    return bool(_generations(path, "ids"))
+
+
+def _normalize(vectors) -> np.ndarray:
+    v = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(v, axis=1, keepdims=True)
+    return v / np.where(norms > 0, norms, 1.0)
+
+
+class NumpyDocstore:
+    """docstore ID → Document (InMemoryDocstore와 같은 search 반환 규약)"""
+    def __init__(self, docs: Optional[Dict[str, Document]] = None):
+        self._docs: Dict[str, Document] = dict(docs or {})
+
+    def search(self, doc_id: str):
+        doc = self._docs.get(doc_id)
+        return doc if doc is not None else f"ID {doc_id} not found."
+
+    def add(self, docs: Dict[str, Document]):
+        self._docs.update(docs)
+
+    def delete(self, ids: Iterable[str]):
+        for doc_id in ids:
+            self._docs.pop(doc_id, None)
+
+    def items(self) -> List[Tuple[str, Document]]:
+        return list(self._docs.items())
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+class _NumpyRetriever:
+    """as_retriever()용 top-k 리트리버 (ThresholdWrapperRetriever의 폴백 경로)"""
+    def __init__(self, store: "NumpyVectorStore", k: int = 4):
+        self.store = store
+        self.k = k
+
+    def invoke(self, query: str) -> List[Document]:
+        pairs = self.store.similarity_search_with_score_by_vector(self.store._embed_query(query), k=self.k)
+        return [doc for doc, _ in pairs]
+
+
+class NumpyVectorStore:
+    """
+    FAISS 래퍼에서 이 프로젝트가 쓰는 부분만 같은 이름으로 제공
+    (add_embeddings / delete / similarity_search_with_score_by_vector / docstore.search / as_retriever / save_local / load_local).
+    추가는 memmap 뒤쪽 빈 행에 쓰고 행 수만 늘리며, 용량 확장·삭제는 새 파일을 만들어 교체한다
+    (검색 중인 스레드는 이전 배열을 그대로 읽는다).
+    """
+    distance = "cosine"
+
+    def __init__(self, embedding_function, path: Optional[str] = None):
+        self.embedding_function = embedding_function
+        self.docstore = NumpyDocstore()
+        self.dim: Optional[int] = None
+        self._path = path
+        self._vectors: Optional[np.ndarray] = None  # capacity × dim float16 (저장용)
+        self._cache: Optional[np.ndarray] = None    # capacity × dim float32 (검색용, F32_CACHE일 때)
+        self._ids: List[str] = []
+        self._generation = 0            # 지금 쓰고 있는 vectors 파일 세대
+        self._saved_generation = 0      # ids 파일까지 저장된 세대
+        self._lock = threading.Lock()
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._ids)
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _embed_query(self, text: str) -> List[float]:
+        return self.embedding_function.embed_query(text)
+
+    # ---- 저장 공간 ----
+    def _write_matrix(self, rows: np.ndarray, capacity: int):
+        """rows를 앞에 담은 capacity × dim 행렬을 새로 만들어 교체 (경로가 있으면 memmap 파일)"""
+        if self._path:
+            os.makedirs(self._path, exist_ok=True)
+            final = os.path.join(self._path, _generation_file("vectors", self._generation))
+            tmp = final + ".tmp"
+            matrix = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float16, shape=(capacity, self.dim))
+            matrix[:len(rows)] = rows
+            matrix.flush()
+            os.replace(tmp, final)
+        else:
+            matrix = np.zeros((capacity, self.dim), dtype=np.float16)
+            matrix[:len(rows)] = rows
+        self._vectors = matrix
+        self._cache = None
+        if F32_CACHE:
+            self._build_cache(len(rows))
+
+    def _build_cache(self, n: int):
+        cache = np.zeros(self._vectors.shape, dtype=np.float32)
+        cache[:n] = self._vectors[:n]
+        self._cache = cache
+
+    def _reserve(self, n_new: int):
+        n = len(self._ids)
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if n + n_new <= capacity:
+            return
+        new_capacity = max(MIN_CAPACITY, capacity * 2, n + n_new)
+        rows = self._vectors[:n] if self._vectors is not None else np.empty((0, self.dim), dtype=np.float16)
+        self._write_matrix(rows, new_capacity)
+
+    # ---- 쓰기 ----
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]],
+                       metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None,
+                       **kwargs: Any) -> List[str]:
+        pairs = list(text_embeddings)
+        if not pairs:
+            return []
+        texts = [t for t, _ in pairs]
+        vectors = _normalize([e for _, e in pairs])
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"임베딩 차원({vectors.shape[1]})이 인덱스 차원({self.dim})과 다릅니다.")
+            duplicates = [i for i in ids if not isinstance(self.docstore.search(i), str)]
+            if duplicates:
+                raise ValueError(f"Tried to add ids that already exist: {set(duplicates)}")
+
+            self._reserve(len(ids))
+            n = len(self._ids)
+            self._vectors[n:n + len(ids)] = vectors
+            if self._cache is not None:
+                self._cache[n:n + len(ids)] = self._vectors[n:n + len(ids)]  # float16로 반올림된 값과 일치
+            self.docstore.add({i: Document(page_content=t, metadata=m) for i, t, m in zip(ids, texts, metadatas)})
+            # 행을 먼저 쓰고 ID를 늘려야 검색 스레드가 덜 쓴 행을 보지 않는다
+            self._ids.extend(ids)
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self.embedding_function.embed_documents(texts)), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> bool:
+        """
+        지정한 ID의 행을 빼고 새 행렬로 교체. 행이 당겨지므로 저장된 세대 파일은 건드리지 않고
+        다음 세대 파일에 쓴다 (save_local에서 ids와 함께 커밋).
+        """
+        drop = set(ids or [])
+        with self._lock:
+            keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in drop]
+            if len(keep) == len(self._ids):
+                return False
+            capacity = self._vectors.shape[0]
+            if self._generation == self._saved_generation:
+                self._generation += 1
+            self._write_matrix(np.asarray(self._vectors[keep]), capacity)
+            self._ids = [self._ids[i] for i in keep]
+            self.docstore.delete(drop)
+        return True
+
+    # ---- 검색 ----
+    def _similarities(self, embedding: List[float]) -> Tuple[np.ndarray, List[str]]:
+        """코사인 유사도 (float32 사본 또는 블록 단위로 변환한 memmap과 행렬-벡터 곱)"""
+        with self._lock:
+            n = len(self._ids)
+            if F32_CACHE and self._cache is None and n:
+                self._build_cache(n)  # 로드 직후 첫 검색
+            vectors, cache, ids = self._vectors, self._cache, self._ids
+        if n == 0:
+            return np.empty(0, dtype=np.float32), ids
+        q = _normalize(embedding)[0]
+        if cache is not None:
+            return cache[:n] @ q, ids
+        sims = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            end = min(n, start + SEARCH_BLOCK_ROWS)
+            sims[start:end] = vectors[start:end].astype(np.float32) @ q
+        return sims, ids
+
+    def _pairs(self, sims: np.ndarray, ids: List[str], rows: np.ndarray) -> List[Tuple[Document, float]]:
+        pairs = []
+        for i in rows:
+            doc = self.docstore.search(ids[i])
+            if isinstance(doc, Document):
+                pairs.append((doc, float(max(0.0, 2.0 - 2.0 * sims[i]))))
+        return pairs
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """상위 k개 (문서, 제곱 L2 거리) 거리 오름차순"""
+        sims, ids = self._similarities(embedding)
+        n = len(sims)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        rows = np.argpartition(-sims, k - 1)[:k] if k < n else np.arange(n)
+        rows = rows[np.argsort(-sims[rows], kind="stable")]
+        return self._pairs(sims, ids, rows)
+
+    def range_search_by_vector(self, embedding: List[float], radius: float) -> List[Tuple[Document, float]]:
+        """제곱 L2 거리 ≤ radius인 전부 (거리 오름차순)"""
+        sims, ids = self._similarities(embedding)
+        rows = np.nonzero(sims >= 1.0 - radius / 2.0 - 1e-6)[0]
+        rows = rows[np.argsort(-sims[rows], kind="stable")]
+        return self._pairs(sims, ids, rows)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(self._embed_query(query), k=k)]
+
+    def as_retriever(self, search_type: str = "similarity", search_kwargs: Optional[dict] = None, **kwargs: Any):
+        return _NumpyRetriever(self, k=(search_kwargs or {}).get("k", 4))
+
+    def stored_vectors(self) -> Tuple[List[str], np.ndarray]:
+        """(행 순서의 docstore ID, float32 벡터) — 오프라인 중복 제거 등에서 재임베딩 없이 사용"""
+        with self._lock:
+            ids = list(self._ids)
+            dim = self.dim or 0
+            vectors = np.asarray(self._vectors[:len(ids)], dtype=np.float32) if ids else np.empty((0, dim), np.float32)
+        return ids, vectors
+
+    # ---- 저장/로드 ----
+    def save_local(self, folder_path: str):
+        """
+        벡터는 memmap에 이미 쓰여 있으므로 flush만, 문서/ID는 tmp 파일에 쓴 뒤 교체.
+        현재 세대의 ids 파일을 마지막에 써서 세대를 커밋하고, 그다음 이전 세대 파일을 지운다.
+        """
+        os.makedirs(folder_path, exist_ok=True)
+        with self._lock:
+            n = len(self._ids)
+            if not self._path or os.path.abspath(self._path) != os.path.abspath(folder_path):
+                # 다른 위치로 저장 → 그 위치의 memmap으로 옮겨 이후 추가도 거기에 쓴다
+                self._path = folder_path
+                self._generation = max(_generations(folder_path, "ids") + [self._generation - 1]) + 1
+                if self._vectors is not None:
+                    self._write_matrix(np.asarray(self._vectors[:n]), self._vectors.shape[0])
+            elif isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+            ids = list(self._ids)
+            docs = [(i, self.docstore.search(i)) for i in ids]
+            generation = self._generation
+
+        docs_path = os.path.join(folder_path, DOCS_FILE)
+        with open(docs_path + ".tmp", "w", encoding="utf-8") as f:
+            for doc_id, doc in docs:
+                f.write(json.dumps({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata},
+                                   ensure_ascii=False) + "\n")
+        os.replace(docs_path + ".tmp", docs_path)
+
+        ids_path = os.path.join(folder_path, _generation_file("ids", generation))
+        with open(ids_path + ".tmp", "wb") as f:
+            np.save(f, np.array(ids, dtype=str))
+        os.replace(ids_path + ".tmp", ids_path)
+        with self._lock:
+            self._saved_generation = generation
+
+        # 커밋된 세대 외의 파일 정리 (이전 세대, 저장 전에 중단된 세대)
+        for name in os.listdir(folder_path):
+            m = _GENERATION_FILE.match(name)
+            if m and int(m.group(2) or 0) != generation:
+                os.remove(os.path.join(folder_path, name))
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings) -> "NumpyVectorStore":
+        store = cls(embeddings, folder_path)
+        committed = _generations(folder_path, "ids")
+        generation = committed[-1] if committed else 0
+        store._generation = store._saved_generation = generation
+        vectors_path = os.path.join(folder_path, _generation_file("vectors", generation))
+        ids_path = os.path.join(folder_path, _generation_file("ids", generation))
+        docs_path = os.path.join(folder_path, DOCS_FILE)
+        if os.path.exists(vectors_path):
+            store._vectors = np.lib.format.open_memmap(vectors_path, mode="r+")
+            store.dim = int(store._vectors.shape[1])
+        ids = np.load(ids_path).tolist() if os.path.exists(ids_path) else []
+        if store._vectors is not None and len(ids) > store._vectors.shape[0]:
+            raise ValueError(f"{os.path.basename(ids_path)}({len(ids)})가 "
+                             f"{os.path.basename(vectors_path)} 행 수({store._vectors.shape[0]})보다 많습니다.")
+
+        valid = set(ids)
+        docs: Dict[str, Document] = {}
+        if os.path.exists(docs_path):
+            with open(docs_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry["id"] in valid:
+                        docs[entry["id"]] = Document(page_content=entry["page_content"], metadata=entry["metadata"])
+        store._ids = ids
+        store.docstore = NumpyDocstore(docs)
+        return store
@@ -0,0 +1,235 @@
+# profiler.py
+"""
+운영 중 켜고 끄는 샘플링 프로파일러 (재배포 없이 /admin/profile로 실행).
+
+  - 샘플러 스레드가 interval마다 sys._current_frames()로 이벤트 루프/실행기 스레드의 스택을 읽어
+    flamegraph용 collapsed 형식("스레드;바깥 함수;...;안쪽 함수 횟수")으로 센다.
+  - 이벤트 루프에 하트비트 태스크를 돌려, 하트비트가 stall_ms 이상 늦으면 그때 루프 스레드의 스택
+    (= 루프를 막고 있는 호출)을 잡아 기록한다.
+  - request_percent를 주면 /chat 요청 중 그 비율만 골라, 골라진 요청이 처리 중일 때만 샘플링한다.
+    이벤트 루프 스레드는 골라진 요청(과 그 요청이 만든 태스크)이 실행 중인 샘플만 센다.
+    실행기 스레드의 작업은 어느 요청 것인지 알 수 없어, 골라진 요청이 하나라도 처리 중이면 모두 센다.
+
+출력은 flamegraph.pl, speedscope(https://www.speedscope.app) 등에 그대로 넣을 수 있다.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+import contextvars
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# ---- 설정 ----
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))  # 한 번에 프로파일링할 최대 시간
+PROFILER_MAX_STALLS = 50   # 기록할 루프 정지 수
+MAX_STACK_DEPTH = 64
+MIN_HEARTBEAT_S = 0.001    # 하트비트가 이보다 잦으면 하트비트 자체가 루프를 점유한다
+PROFILE_FORMATS = ("json", "collapsed")
+
+# 할 일 없이 기다리는 스택의 가장 안쪽 프레임 (include_idle=False면 버림)
+IDLE_LEAVES = {
+    ("selectors.py", "select"),       # 이벤트 루프: I/O 대기
+    ("thread.py", "_worker"),          # ThreadPoolExecutor: 작업 대기
+    ("threading.py", "wait"),          # Condition/Event 대기
+    ("queue.py", "get"),
+}
+
+
+# 골라진 요청 안에서 만든 태스크도 그 요청으로 본다 (태스크는 만들 때의 컨텍스트를 복사)
+_chosen_request = contextvars.ContextVar("profiled_request", default=False)
+
+
+def _frame_name(code, lineno: Optional[int] = None) -> str:
+    name = f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+    if lineno is not None:
+        name += f":{lineno}"
+    return name.replace(";", ":")
+
+
+def _stack(frame, with_lines: bool = False) -> List[str]:
+    """바깥 → 안쪽 순서의 프레임 이름"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code, frame.f_lineno if with_lines else None))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+
+def _thread_label(name: str, ident: int, loop_ident: Optional[int]) -> str:
+    if ident == loop_ident:
+        return "event-loop"
+    # ThreadPoolExecutor-0_3 → ThreadPoolExecutor-0 (같은 풀의 스레드를 합쳐서 본다)
+    head, sep, tail = name.rpartition("_")
+    return head if sep and tail.isdigit() else name
+
+
+class SamplingProfiler:
+    """한 번에 한 세션만 실행. run()이 끝나면 결과(dict)를 돌려준다."""
+    def __init__(self):
+        self.running = False
+        self.active_requests = 0   # request_percent 모드에서 골라진 요청 수
+        self._request_rate: Optional[float] = None
+        self._chosen_tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self._stop = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_ident: Optional[int] = None
+        self._last_beat = 0.0
+
+    # ---- 요청 선택 (이벤트 루프) ----
+    @contextmanager
+    def track_request(self):
+        """request_percent 모드일 때 이 요청을 확률적으로 골라 처리 중에만 샘플링"""
+        chosen = self.running and self._request_rate is not None and random.random() < self._request_rate
+        if chosen:
+            self.active_requests += 1
+            task = asyncio.current_task()
+            if task is not None:
+                self._chosen_tasks.add(task)
+            token = _chosen_request.set(True)
+        try:
+            yield
+        finally:
+            if chosen:
+                self.active_requests -= 1
+                _chosen_request.reset(token)
+                self._chosen_tasks.discard(task)
+
+    def _task_factory(self, previous):
+        """골라진 요청이 만드는 태스크를 기록하는 태스크 팩토리 (기존 팩토리가 있으면 감싼다)"""
+        def factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+            if _chosen_request.get():
+                self._chosen_tasks.add(task)
+            return task
+        return factory
+
+    # ---- 하트비트 (이벤트 루프) ----
+    async def _heartbeat(self, interval: float):
+        self._loop_ident = threading.get_ident()
+        while not self._stop.is_set():
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(interval)
+
+    # ---- 샘플러 (별도 스레드) ----
+    def _sample(self, interval: float, stall_s: float, heartbeat: float, include_idle: bool,
+                counts: Counter, stalls: List[Dict[str, Any]], totals: Dict[str, int]):
+        me = threading.get_ident()
+        stall: Optional[Dict[str, Any]] = None
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            frames = sys._current_frames()
+            names = {t.ident: t.name for t in threading.enumerate()}
+
+            # 루프 정지: 하트비트가 예정보다 stall_s 넘게 늦음
+            lag = now - self._last_beat - heartbeat
+            if self._loop_ident is not None and lag >= stall_s:
+                if stall is None:
+                    loop_frame = frames.get(self._loop_ident)
+                    stall = {
+                        "at": time.time() - lag,
+                        "stack": _stack(loop_frame, with_lines=True) if loop_frame is not None else [],
+                        "samples": 0,
+                        "beat": self._last_beat,
+                    }
+                stall["samples"] += 1
+            elif stall is not None:
+                self._close_stall(stall, stalls, heartbeat)
+                stall = None
+
+            loop_chosen = True
+            if self._request_rate is not None:
+                if self.active_requests <= 0 and not self._chosen_tasks:
+                    continue
+                loop_chosen = asyncio.current_task(self._loop) in self._chosen_tasks
+            totals["samples"] += 1
+            for ident, frame in frames.items():
+                if ident == me or (ident == self._loop_ident and not loop_chosen):
+                    continue
+                if not include_idle and _is_idle(frame):
+                    totals["idle"] += 1
+                    continue
+                label = _thread_label(names.get(ident, str(ident)), ident, self._loop_ident)
+                counts[";".join([label] + _stack(frame))] += 1
+        if stall is not None:
+            self._close_stall(stall, stalls, heartbeat)
+
+    def _close_stall(self, stall: Dict[str, Any], stalls: List[Dict[str, Any]], heartbeat: float):
+        # 다음 하트비트가 찍힌 시각까지가 정지 구간
+        end = self._last_beat if self._last_beat > stall["beat"] else time.monotonic()
+        duration_ms = round(max(0.0, end - stall["beat"] - heartbeat) * 1000, 1)
+        print(f"🐢 이벤트 루프 정지 {duration_ms}ms: {stall['stack'][-1] if stall['stack'] else '?'}")
+        if len(stalls) < PROFILER_MAX_STALLS:
+            stalls.append({
+                "at": time.strftime("%H:%M:%S", time.localtime(stall["at"])),
+                "duration_ms": duration_ms,
+                "samples": stall["samples"],
+                "stack": stall["stack"],
+            })
+
+    async def run(self, seconds: float, interval_ms: float = 5.0, stall_ms: float = 100.0,
+                  request_percent: Optional[float] = None, include_idle: bool = False) -> Dict[str, Any]:
+        if self.running:
+            raise RuntimeError("이미 프로파일링 중입니다.")
+        if interval_ms <= 0 or stall_ms <= 0:
+            raise ValueError("interval_ms와 stall_ms는 0보다 커야 합니다.")
+        seconds = min(seconds, PROFILER_MAX_SECONDS)
+        interval = max(interval_ms, 1.0) / 1000
+        stall_s = stall_ms / 1000
+        heartbeat = max(MIN_HEARTBEAT_S, min(0.01, stall_s / 4))
+
+        counts: Counter = Counter()
+        stalls: List[Dict[str, Any]] = []
+        totals = {"samples": 0, "idle": 0}
+        self.running = True
+        self._request_rate = request_percent / 100 if request_percent is not None else None
+        self._stop.clear()
+        self._last_beat = time.monotonic()
+        self._loop = loop = asyncio.get_running_loop()
+        beat_task = asyncio.create_task(self._heartbeat(heartbeat))
+        previous_factory = loop.get_task_factory()
+        if self._request_rate is not None:
+            loop.set_task_factory(self._task_factory(previous_factory))
+        sampler = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True,
+                                   args=(interval, stall_s, heartbeat, include_idle, counts, stalls, totals))
+        print(f"🔬 프로파일링 시작 ({seconds}s, interval={interval * 1000:g}ms, stall≥{stall_ms}ms"
+              f"{f', 요청 {request_percent}%' if request_percent is not None else ''})")
+        started = time.monotonic()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._stop.set()
+            await loop.run_in_executor(None, sampler.join)
+            beat_task.cancel()
+            loop.set_task_factory(previous_factory)
+            self.running = False
+            self._request_rate = None
+            self._chosen_tasks = weakref.WeakSet()
+            self._loop = None
+            self._loop_ident = None
+
+        return {
+            "seconds": round(time.monotonic() - started, 2),
+            "interval_ms": interval * 1000,  # 실제 샘플링 간격 (1ms 미만 요청은 1ms)
+            "samples": totals["samples"],
+            "idle_samples_dropped": totals["idle"],
+            "stacks": len(counts),
+            "stalls": sorted(stalls, key=lambda s: -s["duration_ms"]),
+            "collapsed": collapsed(counts),
+        }
+
+
+def collapsed(counts: Counter) -> str:
+    """flamegraph collapsed 형식 (많은 순)"""
+    return "\n".join(f"{stack} {n}" for stack, n in counts.most_common())
@@ -1,88 +1,266 @@
 import asyncio
+import os
+import threading
+from dataclasses import dataclass
 from typing import List, Optional, Tuple
+
+import numpy as np
 from langchain_core.documents import Document
 
+from chunking import expand_passages, parent_key
+from singleflight import SingleFlight, normalize_key
+
+DUMMY_MARKER = "__DUMMY__INITIAL__ENTRY__"
+
+# fixed: 기존 방식(k * prefetch_factor 1회 조회)
+# adaptive: k개가 채워지거나 상한에 닿을 때까지 prefetch를 늘려가며 재조회
+# range: relevance 임계값을 FAISS 반경으로 변환해 range search (임계값 없으면 adaptive)
+SEARCH_MODES = ("fixed", "adaptive", "range")
+
+
+def _relevance_from_scores(raw: np.ndarray) -> np.ndarray:
+    """
+    원시 점수 배열 → relevance ∈ [0,1] (벡터화)
+    코사인 거리 dist ∈ [0,2]: relevance = 1 - dist/2
+    음수 거리(내적 점수)의 경우: tanh 정규화
+    """
+    raw = np.asarray(raw, dtype=np.float32)
+    return np.where(raw < 0, (np.tanh(raw) + 1.0) / 2.0, np.clip(1.0 - raw / 2.0, 0.0, 1.0))
+
+
+def _is_dummy(doc) -> bool:
+    if DUMMY_MARKER in getattr(doc, "page_content", ""):
+        return True
+    return getattr(doc, "metadata", {}).get("is_dummy") is True
+
+
+@dataclass
+class RetrievalStats:
+    """검색 통계 (과다 조회 비율 확인용)"""
+    queries: int = 0
+    rounds: int = 0
+    fetched: int = 0
+    returned: int = 0
+    empty: int = 0
+
+    def record(self, rounds: int, fetched: int, returned: int):
+        self.queries += 1
+        self.rounds += rounds
+        self.fetched += fetched
+        self.returned += returned
+        if returned == 0:
+            self.empty += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": self.queries,
+            "fetched": self.fetched,
+            "returned": self.returned,
+            "empty_results": self.empty,
+            "avg_rounds": self.rounds / self.queries if self.queries else 0.0,
+            "over_fetch_ratio": self.fetched / self.returned if self.returned else 0.0,
+        }
+
 
 class ThresholdWrapperRetriever:
     """
     Base retriever에서 문서를 넉넉히 받아온 뒤,
     (FAISS + COSINE 가정) 거리를 relevance로 변환하고 threshold/k로 필터링.
     """
-    def __init__(self, base_retriever, vector_store, k: int = 4, score_threshold: Optional[float] = 0.7, prefetch_factor: int = 2):
+    def __init__(self, base_retriever, vector_store, k: int = 4, score_threshold: Optional[float] = 0.7,
+                 prefetch_factor: int = 2, search_mode: str = "fixed", max_prefetch_factor: int = 16):
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"지원하지 않는 search_mode: {search_mode} (가능: {', '.join(SEARCH_MODES)})")
         self.base_retriever = base_retriever
         self.vector_store = vector_store
         self.k = k
         self.score_threshold = score_threshold
         self.prefetch = max(k, k * prefetch_factor)
+        self.max_prefetch = max(self.prefetch, k * max_prefetch_factor)
+        self.search_mode = search_mode
+        self.stats = RetrievalStats()
+        self._stats_lock = threading.Lock()
+        self.embedding_flight = SingleFlight("embedding")
 
-    @staticmethod
-    def _cosine_distance_to_relevance(distance: float) -> float:
+    def _filter_and_cut(self, pairs: List[Tuple[Document, float]]) -> Tuple[List[Document], np.ndarray]:
         """
-        코사인 거리 dist ∈ [0,2] → relevance ∈ [0,1]
-        sim = 1 - dist, relevance = (sim+1)/2 = 1 - dist/2
-        
-        음수 거리(내적 점수)의 경우: tanh 정규화
+        (doc, raw_score) 목록을 relevance로 변환하고 threshold/k 적용.
+        k는 부모 사연 기준: 상위 k개 사연에 속한 패시지를 relevance 순으로 모두 남긴다.
+        반환: (선택된 문서, 더미를 제외한 전체 relevance 배열)
         """
-        if distance < 0:
-            # 내적 점수일 경우 (높을수록 유사)
-            import math
-            return (math.tanh(distance) + 1) / 2
-        return max(0.0, min(1.0, 1.0 - distance / 2.0))
+        if not pairs:
+            return [], np.empty(0, dtype=np.float32)
+        docs = [d for d, _ in pairs]
+        rel = _relevance_from_scores([raw for _, raw in pairs])
+
+        # 더미 제거 + 임계값
+        keep = np.fromiter((not _is_dummy(d) for d in docs), dtype=bool, count=len(docs))
+        rel_kept = rel[keep]
+        if self.score_threshold is not None:
+            keep &= rel >= self.score_threshold
+
+        # relevance 내림차순 (동점은 원래 순서 유지), 사연 k개까지
+        idx = np.flatnonzero(keep)
+        order = idx[np.argsort(-rel[idx], kind="stable")]
+        selected, parents = [], set()
+        for i in order:
+            key = parent_key(docs[i])
+            if key not in parents:
+                if len(parents) >= self.k:
+                    continue
+                parents.add(key)
+            selected.append(docs[i])
+        return selected, rel_kept
+
+    @staticmethod
+    def _count_parents(docs: List[Document]) -> int:
+        return len({parent_key(d) for d in docs})
 
-    def _filter_and_cut(self, pairs: List[Tuple[Document, float]]) -> List[Document]:
+    def _embed_query(self, query: str) -> List[float]:
+        embed = getattr(self.vector_store, "_embed_query", None)
+        if embed is None:
+            embed = self.vector_store.embedding_function.embed_query
+        return embed(query)
+
+    def _range_radius(self) -> Optional[float]:
+        """relevance 임계값 → L2(코사인) 거리 반경. relevance = 1 - dist/2 ≥ t ⇔ dist ≤ 2(1-t)"""
+        if self.score_threshold is None:
+            return None
+        return 2.0 * (1.0 - self.score_threshold)
+
+    def _cut_at_k_stories(self, pairs) -> List[Tuple[Document, float]]:
+        """거리 오름차순 (doc, dist)에서 사연 k개를 넘어서는 후보가 나오면 중단 (더미는 세지 않음)"""
+        kept, parents = [], set()
+        for doc, dist in pairs:
+            if not _is_dummy(doc):
+                key = parent_key(doc)
+                if key not in parents and len(parents) >= self.k:
+                    break
+                parents.add(key)
+            kept.append((doc, dist))
+        return kept
+
+    def _range_search(self, embedding: List[float], radius: float) -> Optional[List[Tuple[Document, float]]]:
         """
-        (doc, raw_score) 목록을 relevance로 변환하고 threshold/k 적용.
+        반경 내 후보를 거리 오름차순으로 반환 (사연 k개를 넘어서는 후보가 나오면 중단).
+        L2 인덱스가 아니면 None (→ adaptive로 대체).
         """
-        ranked = []
-        for doc, raw in pairs:
-            # 더미 제거
-            content = getattr(doc, "page_content", "")
-            if "__DUMMY__INITIAL__ENTRY__" in content:
-                continue
-            if doc.metadata.get("is_dummy") is True:
-                continue
-            
-            rel = self._cosine_distance_to_relevance(raw)
-            print(f"📄 문서: score={rel:.3f} (raw={raw:.3f})")
-            
-            if (self.score_threshold is None) or (rel >= self.score_threshold):
-                ranked.append((doc, rel))
-
-        # relevance 내림차순 상위 k개
-        ranked.sort(key=lambda x: x[1], reverse=True)
-        filtered = [d for d, _ in ranked[: self.k]]
-        print(f"✅ 최종 선택: {len(filtered)}개 문서")
-        return filtered
+        native = getattr(self.vector_store, "range_search_by_vector", None)
+        if native is not None:
+            # numpy/sharded: 반경 내 전부를 거리 순으로 받아 FAISS 경로와 같은 기준으로 자른다
+            return self._cut_at_k_stories(native(embedding, radius))
+
+        import faiss
+
+        index = getattr(self.vector_store, "index", None)
+        if index is None or index.metric_type != faiss.METRIC_L2:
+            return None
+        vector = np.asarray([embedding], dtype=np.float32)
+        if getattr(self.vector_store, "_normalize_L2", False):
+            faiss.normalize_L2(vector)
+        # FAISS는 dist < radius만 돌려주므로 경계값 포함을 위해 약간 넓힌다
+        lims, distances, labels = index.range_search(vector, radius + 1e-6)
+        distances, labels = distances[lims[0]:lims[1]], labels[lims[0]:lims[1]]
+        order = np.argsort(distances, kind="stable")
+
+        docstore = self.vector_store.docstore
+        id_map = self.vector_store.index_to_docstore_id
+
+        def candidates():
+            # docstore 조회는 필요한 만큼만 (사연 k개가 차면 멈춘다)
+            for i in order:
+                doc = docstore.search(id_map[int(labels[i])])
+                if isinstance(doc, Document):
+                    yield doc, float(distances[i])
+        return self._cut_at_k_stories(candidates())
+
+    def _search(self, query: str) -> List[Document]:
+        """쿼리 임베딩 1회 + 모드별 검색 (동기)"""
+        return self._search_by_vector(self._embed_query(query))
+
+    def _search_by_vector(self, embedding: List[float]) -> List[Document]:
+        """모드별 검색 (동기)"""
+        mode = self.search_mode
+        rounds, fetched = 0, 0
+        docs: List[Document] = []
+
+        if mode == "range":
+            radius = self._range_radius()
+            pairs = self._range_search(embedding, radius) if radius is not None else None
+            if pairs is None:
+                mode = "adaptive"
+            else:
+                rounds, fetched = 1, len(pairs)
+                docs, _ = self._filter_and_cut(pairs)
+
+        if mode in ("fixed", "adaptive"):
+            fetch = self.prefetch
+            while True:
+                pairs = self.vector_store.similarity_search_with_score_by_vector(embedding, k=fetch)
+                rounds += 1
+                fetched += len(pairs)  # 라운드마다 처음부터 다시 조회하므로 누적
+                docs, rel = self._filter_and_cut(pairs)
+                if mode == "fixed" or self._count_parents(docs) >= self.k:
+                    break
+                # 인덱스를 다 읽었거나 상한 도달
+                if len(pairs) < fetch or fetch >= self.max_prefetch:
+                    break
+                # 가장 먼 후보가 이미 임계값 미만이면 더 가져와도 소용없음
+                if self.score_threshold is not None and rel.size and rel.min() < self.score_threshold:
+                    break
+                fetch = min(fetch * 2, self.max_prefetch)
+
+        # 패시지 → 사연별 컨텍스트 (매칭 패시지 + 이웃만)
+        docs = expand_passages(docs, getattr(self.vector_store, "docstore", None))
+
+        with self._stats_lock:
+            self.stats.record(rounds, fetched, len(docs))
+        print(f"✅ 최종 선택: {len(docs)}개 문서 (mode={mode}, 조회={fetched}, rounds={rounds})")
+        return docs
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = self.stats.as_dict()
+        stats["search_mode"] = self.search_mode
+        stats["embedding_singleflight"] = self.embedding_flight.stats()
+        return stats
 
     # 🔥 동기 메서드
     def invoke(self, query: str) -> List[Document]:
         """LangChain 표준 동기 메서드"""
         try:
-            pairs = self.vector_store.similarity_search_with_score(query, k=self.prefetch)
-            return self._filter_and_cut(pairs)
+            return self._search(query)
         except Exception as e:
             print(f"❌ 검색 오류: {e}")
             # 폴백: base retriever 사용
             try:
                 docs = self.base_retriever.invoke(query) if hasattr(self.base_retriever, 'invoke') else []
-                cleaned = [d for d in docs if "__DUMMY__INITIAL__ENTRY__" not in getattr(d, "page_content", "")]
+                cleaned = [d for d in docs if DUMMY_MARKER not in getattr(d, "page_content", "")]
                 return cleaned[: self.k]
             except:
                 return []
 
+    async def aembed_query(self, query: str) -> List[float]:
+        """쿼리 임베딩 (같은 쿼리가 동시에 들어오면 한 번만 계산)"""
+        loop = asyncio.get_event_loop()
+        return await self.embedding_flight.do(
+            normalize_key(query),
+            lambda: loop.run_in_executor(None, self._embed_query, query),
+        )
+
+    async def asearch_by_vector(self, embedding: List[float]) -> List[Document]:
+        """이미 계산한 임베딩으로 검색"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._search_by_vector, embedding)
+
     # 🔥 비동기 메서드 추가
     async def ainvoke(self, query: str) -> List[Document]:
         """LangChain 표준 비동기 메서드"""
         try:
-            # similarity_search_with_score는 동기 함수 → 스레드풀에서 실행
-            loop = asyncio.get_event_loop()
-            pairs = await loop.run_in_executor(
-                None,
-                self.vector_store.similarity_search_with_score,
-                query,
-                self.prefetch
-            )
-            return self._filter_and_cut(pairs)
+            # 임베딩/검색은 동기 함수 → 스레드풀에서 실행
+            # 같은 쿼리가 동시에 들어오면 임베딩은 한 번만 계산
+            embedding = await self.aembed_query(query)
+            return await self.asearch_by_vector(embedding)
         except Exception as e:
             print(f"❌ 비동기 검색 오류: {e}")
             # 폴백: base retriever의 비동기 호출
@@ -93,8 +271,8 @@ class ThresholdWrapperRetriever:
                     # 동기 함수를 비동기로 실행
                     loop = asyncio.get_event_loop()
                     docs = await loop.run_in_executor(None, self.base_retriever.invoke, query)
-                
-                cleaned = [d for d in docs if "__DUMMY__INITIAL__ENTRY__" not in getattr(d, "page_content", "")]
+
+                cleaned = [d for d in docs if DUMMY_MARKER not in getattr(d, "page_content", "")]
                 return cleaned[: self.k]
             except Exception as e2:
                 print(f"❌ 폴백도 실패: {e2}")
@@ -110,22 +288,29 @@ class ThresholdWrapperRetriever:
         return await self.ainvoke(query)
 
 
-def get_retriever_with_threshold(vector_store, k: int = 4, score_threshold: float = 0.7):
+def get_retriever_with_threshold(vector_store, k: int = 4, score_threshold: float = 0.7,
+                                 search_mode: Optional[str] = None):
     """
     권장: Top-k 기반 베이스 리트리버 + 임계치/정규화는 래퍼에서 처리
+    search_mode 미지정 시 RETRIEVER_SEARCH_MODE 환경 변수(기본 fixed = 기존 동작)
     """
     if vector_store is None:
         raise ValueError("Vector store must be initialized before creating a retriever")
 
+    search_mode = search_mode or os.getenv("RETRIEVER_SEARCH_MODE", "fixed")
+    max_prefetch_factor = int(os.getenv("RETRIEVER_MAX_PREFETCH_FACTOR", "16"))
+
     base = vector_store.as_retriever(
         search_type="similarity",
         search_kwargs={"k": k * 2},  # prefetch를 위해 더 많이
     )
-    print(f"🔍 Retriever 초기화 (k={k}, threshold={score_threshold})")
+    print(f"🔍 Retriever 초기화 (k={k}, threshold={score_threshold}, mode={search_mode})")
     return ThresholdWrapperRetriever(
-        base, 
-        vector_store, 
-        k=k, 
-        score_threshold=score_threshold, 
-        prefetch_factor=2
-    )
\ No newline at end of file
+        base,
+        vector_store,
+        k=k,
+        score_threshold=score_threshold,
+        prefetch_factor=2,
+        search_mode=search_mode,
+        max_prefetch_factor=max_prefetch_factor,
+    )
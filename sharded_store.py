@@ -0,0 +1,555 @@
+# sharded_store.py
+"""
+샤드 단위로 나눠 저장/검색하는 벡터 저장소 (VECTOR_BACKEND=sharded).
+
+  <버전 디렉터리>/
+    shards.json          # 분할 방식(hash|time), 샤드 수/시간 단위, 샤드별 문서 수 (사람이 보는 용도)
+    shards/<샤드>/       # 샤드마다 독립된 인덱스 (FAISS: index.<N>.faiss + docs.sqlite, numpy: vectors.<N>.npy ...)
+
+  - hash: story_id의 crc32 % SHARD_COUNT → h00 ~ h{N-1} (한 사연의 패시지는 같은 샤드)
+  - time: 메타데이터 added_at의 월/주/일 → t202510 등 (새 사연은 최신 샤드에만 쓰임)
+
+검색은 샤드마다 top-k를 스레드로 동시에 구하고 거리 순으로 합친다 (모든 샤드가 같은 코사인 거리 스케일).
+저장은 바뀐 샤드만, 샤드 압축/삭제/추가는 해당 샤드 디렉터리만 건드린다.
+
+  python sharded_store.py status
+  python sharded_store.py compact <샤드>
+  python sharded_store.py drop <샤드>
+  python sharded_store.py add <샤드> --from <저장된 인덱스 디렉터리>
+"""
+import os
+import re
+import json
+import uuid
+import zlib
+import heapq
+import shutil
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from docstore import has_sqlite_docstore, load_faiss, save_faiss, update_document
+from numpy_store import NumpyVectorStore, has_numpy_index
+
+# ---- 설정 (새로 만드는 샤드 스토어에만 적용, 기존 스토어는 shards.json 값을 따른다) ----
+SHARD_PARTITION = os.getenv("SHARD_PARTITION", "hash")      # hash | time
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "4"))             # hash 분할 샤드 수
+SHARD_TIME_BUCKET = os.getenv("SHARD_TIME_BUCKET", "month")  # time 분할 단위: month | week | day
+SHARD_BACKEND = os.getenv("SHARD_BACKEND", "faiss")          # 샤드 내부 인덱스: faiss | numpy
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", str(min(8, os.cpu_count() or 1))))
+SHARD_PARALLEL_MIN = int(os.getenv("SHARD_PARALLEL_MIN", "20000"))  # 전체 벡터가 이보다 적으면 순차 검색
+
+SHARDS_FILE = "shards.json"
+SHARDS_DIR = "shards"
+TIME_BUCKETS = {"month": "%Y%m", "week": "%Yw%W", "day": "%Y%m%d"}
+RESERVED_SHARD_NAME = re.compile(r"[ht]\d+(w\d+)?")  # 분할이 만드는 이름 (h00, t202610, t2026w42 …)
+
+_search_pool: Optional[ThreadPoolExecutor] = None
+_search_pool_lock = threading.Lock()
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    # 리트리버가 기본 실행기에서 호출하므로 같은 풀에 넣으면 서로 기다리다 멈출 수 있어 전용 풀을 쓴다
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="shard-search")
+        return _search_pool
+
+
+# ---- 샤드(하위 스토어) 공통 처리: FAISS / NumpyVectorStore ----
+def _new_child(embeddings, backend: str, dim: int):
+    if backend == "numpy":
+        return NumpyVectorStore(embeddings)
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    # 빈 인덱스로 바로 만들 수 있어 더미 문서가 필요 없다
+    return FAISS(embeddings, faiss.IndexFlatL2(dim), InMemoryDocstore(), {},
+                 distance_strategy=DistanceStrategy.COSINE)
+
+
+def _child_backend(child) -> str:
+    return "numpy" if isinstance(child, NumpyVectorStore) else "faiss"
+
+
+def _child_ids(child) -> List[str]:
+    if isinstance(child, NumpyVectorStore):
+        return list(child._ids)
+    return [child.index_to_docstore_id[i] for i in range(child.index.ntotal)]
+
+
+def _child_count(child) -> int:
+    return child.ntotal if isinstance(child, NumpyVectorStore) else int(child.index.ntotal)
+
+
+def _child_dim(child) -> Optional[int]:
+    return child.dim if isinstance(child, NumpyVectorStore) else int(child.index.d)
+
+
+def _child_vectors(child) -> Tuple[List[str], np.ndarray]:
+    if isinstance(child, NumpyVectorStore):
+        return child.stored_vectors()
+    index = child.index
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), np.float32)
+    return _child_ids(child), vectors
+
+
+def _child_range(child, embedding: List[float], radius: float) -> List[Tuple[Document, float]]:
+    if isinstance(child, NumpyVectorStore):
+        return child.range_search_by_vector(embedding, radius)
+    # FAISS는 dist < radius만 돌려주므로 경계값 포함을 위해 약간 넓힌다
+    lims, distances, labels = child.index.range_search(np.asarray([embedding], dtype=np.float32), radius + 1e-6)
+    pairs = []
+    for dist, label in zip(distances[lims[0]:lims[1]], labels[lims[0]:lims[1]]):
+        doc = child.docstore.search(child.index_to_docstore_id[int(label)])
+        if isinstance(doc, Document):
+            pairs.append((doc, float(dist)))
+    return pairs
+
+
+def _save_child(child, path: str):
+    if isinstance(child, NumpyVectorStore):
+        child.save_local(path)
+    else:
+        save_faiss(child, path)
+
+
+def _close_child(child):
+    # 교체/삭제된 샤드의 SQLite 연결 정리 (InMemoryDocstore/NumpyDocstore는 닫을 것이 없다)
+    if hasattr(child.docstore, "close"):
+        child.docstore.close()
+
+
+def _load_child(path: str, embeddings):
+    if has_numpy_index(path):
+        return NumpyVectorStore.load_local(path, embeddings)
+    if has_sqlite_docstore(path):
+        from langchain_community.vectorstores.utils import DistanceStrategy
+        return load_faiss(path, embeddings, DistanceStrategy.COSINE)
+    raise ValueError(f"샤드 인덱스를 찾을 수 없습니다: {path}")
+
+
+class ShardedDocstore:
+    """docstore ID → 소유 샤드의 docstore로 전달하는 파사드 (ID → 샤드 이름만 메모리에 둔다)"""
+    def __init__(self, store: "ShardedVectorStore"):
+        self._store = store
+
+    def search(self, doc_id: str):
+        child = self._store._child_of(doc_id)
+        if child is None:
+            return f"ID {doc_id} not found."
+        return child.docstore.search(doc_id)
+
+    def update(self, docs: Dict[str, Document]):
+        with self._store._write_lock:
+            for doc_id, doc in docs.items():
+                child = self._store._child_of(doc_id)
+                if child is not None:
+                    update_document(child.docstore, doc, doc_id)
+                    self._store._mark_dirty(self._store._owner.get(doc_id))
+
+    def items(self) -> List[Tuple[str, Document]]:
+        items = []
+        for _, child in self._store._snapshot():
+            docstore = child.docstore
+            items.extend(docstore.items() if hasattr(docstore, "items") else docstore._dict.items())
+        return items
+
+    def __len__(self) -> int:
+        return len(self._store._owner)
+
+
+class _ShardedRetriever:
+    """as_retriever()용 top-k 리트리버 (ThresholdWrapperRetriever의 폴백 경로)"""
+    def __init__(self, store: "ShardedVectorStore", k: int = 4):
+        self.store = store
+        self.k = k
+
+    def invoke(self, query: str) -> List[Document]:
+        pairs = self.store.similarity_search_with_score_by_vector(self.store._embed_query(query), k=self.k)
+        return [doc for doc, _ in pairs]
+
+
+class ShardedVectorStore:
+    """
+    FAISS 래퍼에서 이 프로젝트가 쓰는 부분을 같은 이름으로 제공하고, 샤드마다 FAISS/NumpyVectorStore를 둔다.
+    샤드 목록은 디렉터리(shards/<이름>)가 기준이고 shards.json은 설정과 통계만 담는다.
+
+    잠금은 두 단계: _write_lock은 쓰기(추가/삭제/압축/저장)끼리 순서를 맞추고,
+    _lock은 샤드/소유 맵을 읽고 바꾸는 순간에만 잡는다. 검색은 _lock만 잠깐 잡으므로 압축/저장 중에도 돈다.
+    """
+    distance = "cosine"
+
+    def __init__(self, embedding_function, partition: str = SHARD_PARTITION, shard_count: int = SHARD_COUNT,
+                 time_bucket: str = SHARD_TIME_BUCKET, shard_backend: str = SHARD_BACKEND):
+        if partition not in ("hash", "time"):
+            raise ValueError(f"지원하지 않는 SHARD_PARTITION: {partition} (가능: hash, time)")
+        if time_bucket not in TIME_BUCKETS:
+            raise ValueError(f"지원하지 않는 SHARD_TIME_BUCKET: {time_bucket} (가능: {', '.join(TIME_BUCKETS)})")
+        self.embedding_function = embedding_function
+        self.partition = partition
+        self.shard_count = max(1, shard_count)
+        self.time_bucket = time_bucket
+        self.shard_backend = shard_backend
+        self.docstore = ShardedDocstore(self)
+        self._shards: Dict[str, Any] = {}
+        self._owner: Dict[str, str] = {}  # docstore ID → 샤드 이름
+        self._dirty: set = set()
+        self._path: Optional[str] = None
+        self._lock = threading.RLock()
+        self._write_lock = threading.RLock()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _embed_query(self, text: str) -> List[float]:
+        return self.embedding_function.embed_query(text)
+
+    @property
+    def ntotal(self) -> int:
+        return sum(_child_count(c) for _, c in self._snapshot())
+
+    @property
+    def dim(self) -> Optional[int]:
+        return next((_child_dim(c) for _, c in self._snapshot() if _child_dim(c)), None)
+
+    def _snapshot(self) -> List[Tuple[str, Any]]:
+        with self._lock:
+            return list(self._shards.items())
+
+    def _child_of(self, doc_id: str):
+        with self._lock:
+            name = self._owner.get(doc_id)
+            return self._shards.get(name) if name is not None else None
+
+    def _mark_dirty(self, name: Optional[str]):
+        if name is not None:
+            with self._lock:
+                self._dirty.add(name)
+
+    # ---- 분할 ----
+    def _shard_for(self, doc_id: str, metadata: dict) -> str:
+        if self.partition == "hash":
+            key = str(metadata.get("story_id") or doc_id)
+            return f"h{zlib.crc32(key.encode('utf-8')) % self.shard_count:02d}"
+        added_at = datetime.fromisoformat(metadata["added_at"])
+        return "t" + added_at.strftime(TIME_BUCKETS[self.time_bucket])
+
+    # ---- 쓰기 ----
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]],
+                       metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None,
+                       **kwargs: Any) -> List[str]:
+        pairs = list(text_embeddings)
+        if not pairs:
+            return []
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in pairs]
+        metadatas = [dict(m) for m in metadatas] if metadatas else [{} for _ in pairs]
+        if self.partition == "time":
+            missing = sum(1 for m in metadatas if not m.get("added_at"))
+            if missing:
+                # 지금 시각으로 채우면 옛 사연이 전부 최신 샤드 하나로 몰린다
+                raise ValueError(f"time 분할에는 메타데이터 added_at이 필요합니다 (없는 문서 {missing}개)")
+
+        groups: Dict[str, List[int]] = {}
+        for i, (doc_id, m) in enumerate(zip(ids, metadatas)):
+            groups.setdefault(self._shard_for(doc_id, m), []).append(i)
+
+        with self._write_lock:
+            with self._lock:
+                duplicates = [i for i in ids if i in self._owner]
+                if duplicates:
+                    raise ValueError(f"Tried to add ids that already exist: {set(duplicates)}")
+                for name, rows in groups.items():
+                    if name not in self._shards:
+                        self._shards[name] = _new_child(self.embedding_function, self.shard_backend,
+                                                        len(pairs[rows[0]][1]))
+                children = {name: self._shards[name] for name in groups}
+            for name, rows in groups.items():
+                children[name].add_embeddings([pairs[i] for i in rows], metadatas=[metadatas[i] for i in rows],
+                                              ids=[ids[i] for i in rows])
+                with self._lock:
+                    self._owner.update((ids[i], name) for i in rows)
+                    self._dirty.add(name)
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self.embedding_function.embed_documents(texts)), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> bool:
+        with self._write_lock:
+            groups: Dict[str, List[str]] = {}
+            with self._lock:
+                for doc_id in ids or []:
+                    name = self._owner.get(doc_id)
+                    if name is not None:
+                        groups.setdefault(name, []).append(doc_id)
+                children = {name: self._shards[name] for name in groups}
+            for name, doc_ids in groups.items():
+                children[name].delete(doc_ids)
+                with self._lock:
+                    for doc_id in doc_ids:
+                        del self._owner[doc_id]
+                    self._dirty.add(name)
+        return bool(groups)
+
+    # ---- 검색 ----
+    def _fan_out(self, fn) -> List[List[Tuple[Document, float]]]:
+        shards = [(name, c) for name, c in self._snapshot() if _child_count(c)]
+        # 작은 인덱스는 스레드 전달 비용(샤드당 0.1ms 안팎)이 검색보다 커서 순차로
+        if (len(shards) > 1 and SHARD_SEARCH_WORKERS > 1
+                and sum(_child_count(c) for _, c in shards) >= SHARD_PARALLEL_MIN):
+            # FAISS/NumPy 모두 검색 중 GIL을 놓으므로 샤드별 스레드가 실제로 동시에 돈다
+            return list(_get_search_pool().map(lambda item: fn(item[1]), shards))
+        return [fn(c) for _, c in shards]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """샤드별 상위 k개를 모아 전체 상위 k개 (문서, 제곱 L2 거리) 거리 오름차순"""
+        results = self._fan_out(lambda c: c.similarity_search_with_score_by_vector(embedding, k=k))
+        return heapq.nsmallest(k, (pair for pairs in results for pair in pairs), key=lambda p: p[1])
+
+    def range_search_by_vector(self, embedding: List[float], radius: float) -> List[Tuple[Document, float]]:
+        """제곱 L2 거리 ≤ radius인 전부 (거리 오름차순)"""
+        results = self._fan_out(lambda c: _child_range(c, embedding, radius))
+        return sorted((pair for pairs in results for pair in pairs), key=lambda p: p[1])
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(self._embed_query(query), k=k)]
+
+    def as_retriever(self, search_type: str = "similarity", search_kwargs: Optional[dict] = None, **kwargs: Any):
+        return _ShardedRetriever(self, k=(search_kwargs or {}).get("k", 4))
+
+    def stored_vectors(self) -> Tuple[List[str], np.ndarray]:
+        """(docstore ID, float32 벡터) 샤드 순서대로 — 오프라인 중복 제거용"""
+        ids: List[str] = []
+        blocks = []
+        for _, child in sorted(self._snapshot()):
+            child_ids, vectors = _child_vectors(child)
+            ids.extend(child_ids)
+            blocks.append(np.asarray(vectors, dtype=np.float32))
+        if not ids:
+            return [], np.empty((0, self.dim or 0), np.float32)
+        return ids, np.vstack(blocks)
+
+    # ---- 샤드 관리 ----
+    def shard_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {"backend": _child_backend(c), "count": _child_count(c), "dim": _child_dim(c),
+                       "dirty": name in self._dirty}
+                for name, c in sorted(self._snapshot())}
+
+    def _shard_dir(self, name: str) -> str:
+        return os.path.join(self._path, SHARDS_DIR, name)
+
+    def compact_shard(self, name: str):
+        """
+        샤드 하나를 살아 있는 벡터/문서만으로 새로 써서 교체 (삭제로 남은 SQLite 빈 공간, numpy 여유 행 정리).
+        다른 샤드는 건드리지 않고, 새로 쓰는 동안 쓰기만 기다리게 한다 (검색은 교체 전까지 이전 샤드로).
+        """
+        with self._write_lock:
+            with self._lock:
+                child = self._shards.get(name)
+            if child is None:
+                raise ValueError(f"없는 샤드입니다: {name}")
+            ids, vectors = _child_vectors(child)
+            docs = [child.docstore.search(i) for i in ids]
+            fresh = _new_child(self.embedding_function, _child_backend(child), vectors.shape[1])
+            if ids:
+                fresh.add_embeddings(zip([d.page_content for d in docs], vectors.tolist()),
+                                     metadatas=[dict(d.metadata) for d in docs], ids=ids)
+            old = None
+            if self._path:
+                final = self._shard_dir(name)
+                tmp, old = final + ".compact", final + ".old"
+                shutil.rmtree(tmp, ignore_errors=True)
+                _save_child(fresh, tmp)
+                if os.path.exists(final):
+                    os.replace(final, old)
+                os.replace(tmp, final)
+                fresh = _load_child(final, self.embedding_function)  # 옮긴 디렉터리에서 다시 연다
+            with self._lock:
+                self._shards[name] = fresh
+                if self._path:
+                    self._dirty.discard(name)
+                else:
+                    self._dirty.add(name)
+            _close_child(child)
+            if old:
+                shutil.rmtree(old, ignore_errors=True)
+        print(f"🧹 샤드 압축 완료 → {name} ({len(ids)}개)")
+
+    def drop_shard(self, name: str) -> int:
+        """샤드 하나와 그 문서를 통째로 삭제 (예: 오래된 기간 샤드). 삭제한 문서 수."""
+        with self._write_lock:
+            with self._lock:
+                child = self._shards.pop(name, None)
+                if child is None:
+                    raise ValueError(f"없는 샤드입니다: {name}")
+                dropped = [k for k, v in self._owner.items() if v == name]
+                for k in dropped:
+                    del self._owner[k]
+                self._dirty.discard(name)
+            _close_child(child)
+            if self._path and os.path.exists(self._shard_dir(name)):
+                trash = self._shard_dir(name) + ".dropped"
+                os.replace(self._shard_dir(name), trash)  # 이름 변경은 원자적, 지우는 건 그다음
+                shutil.rmtree(trash, ignore_errors=True)
+                self._write_shards_file()
+        print(f"🗑️ 샤드 삭제 → {name} ({len(dropped)}개)")
+        return len(dropped)
+
+    def add_shard(self, name: str, source_path: str) -> int:
+        """
+        다른 곳에서 저장한 인덱스 디렉터리(FAISS docs.sqlite 형식 또는 numpy)를 샤드로 붙인다.
+        hash 분할이면 새 사연은 이 샤드로 가지 않고 검색만 된다. 추가한 문서 수.
+        분할이 만드는 이름(h00, t202610 …)은 새 사연이 섞여 들어가므로 쓸 수 없다.
+        """
+        if not name or "." in name or os.sep in name or RESERVED_SHARD_NAME.fullmatch(name):
+            raise ValueError(f"샤드 이름으로 쓸 수 없습니다: {name}")
+        with self._write_lock:
+            with self._lock:
+                if name in self._shards:
+                    raise ValueError(f"이미 있는 샤드입니다: {name}")
+            child = _load_child(source_path, self.embedding_function)
+            if self.dim and _child_dim(child) and _child_dim(child) != self.dim:
+                raise ValueError(f"샤드 차원({_child_dim(child)})이 스토어 차원({self.dim})과 다릅니다.")
+            ids = _child_ids(child)
+            with self._lock:
+                duplicates = [i for i in ids if i in self._owner]
+            if duplicates:
+                raise ValueError(f"이미 있는 문서 ID가 포함되어 있습니다: {len(duplicates)}개")
+            if self._path:
+                _close_child(child)
+                shutil.copytree(source_path, self._shard_dir(name))
+                child = _load_child(self._shard_dir(name), self.embedding_function)
+            with self._lock:
+                self._shards[name] = child
+                self._owner.update((i, name) for i in ids)
+                if self._path:
+                    self._write_shards_file_locked()
+                else:
+                    self._dirty.add(name)
+        print(f"➕ 샤드 추가 → {name} ({len(ids)}개)")
+        return len(ids)
+
+    # ---- 저장/로드 ----
+    def _write_shards_file(self):
+        with self._lock:
+            self._write_shards_file_locked()
+
+    def _write_shards_file_locked(self):
+        shards = self._shards
+        info = {
+            "partition": self.partition,
+            "shard_count": self.shard_count,
+            "time_bucket": self.time_bucket,
+            "shard_backend": self.shard_backend,
+            "shards": {name: {"backend": _child_backend(c), "count": _child_count(c)}
+                       for name, c in sorted(shards.items())},
+        }
+        path = os.path.join(self._path, SHARDS_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def save_local(self, folder_path: str):
+        """바뀐 샤드만 저장 (다른 위치로 처음 저장할 때는 전부). 파일 쓰는 동안 검색은 막지 않는다."""
+        with self._write_lock:
+            with self._lock:
+                relocated = not self._path or os.path.abspath(self._path) != os.path.abspath(folder_path)
+                self._path = folder_path
+                targets = dict(self._shards) if relocated else {n: self._shards[n] for n in self._dirty
+                                                                if n in self._shards}
+                self._dirty.clear()
+            try:
+                for name, child in sorted(targets.items()):
+                    _save_child(child, self._shard_dir(name))
+            except Exception:
+                with self._lock:
+                    self._dirty.update(targets)  # 다음 저장 때 다시 시도
+                raise
+            os.makedirs(os.path.join(folder_path, SHARDS_DIR), exist_ok=True)
+            with self._lock:
+                self._write_shards_file_locked()
+        if targets:
+            print(f"💾 샤드 저장: {', '.join(sorted(targets))}")
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings) -> "ShardedVectorStore":
+        with open(os.path.join(folder_path, SHARDS_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        store = cls(embeddings, partition=info.get("partition", "hash"),
+                    shard_count=info.get("shard_count", SHARD_COUNT),
+                    time_bucket=info.get("time_bucket", "month"),
+                    shard_backend=info.get("shard_backend", "faiss"))
+        store._path = folder_path
+        root = os.path.join(folder_path, SHARDS_DIR)
+        names = _recover(root)
+        # 샤드별 로드는 서로 독립이라 동시에
+        children = list(_get_search_pool().map(lambda n: _load_child(os.path.join(root, n), embeddings), names))
+        for name, child in zip(names, children):
+            store._shards[name] = child
+            store._owner.update((i, name) for i in _child_ids(child))
+        if store.partition == "hash" and store.shard_count != SHARD_COUNT:
+            print(f"⚠️ 저장된 샤드 수({store.shard_count})와 SHARD_COUNT({SHARD_COUNT})가 다릅니다. 저장된 값으로 분할합니다.")
+        return store
+
+
+def _recover(root: str) -> List[str]:
+    """중단된 압축/삭제 정리 후 샤드 이름 목록"""
+    if not os.path.isdir(root):
+        return []
+    entries = os.listdir(root)
+    for entry in entries:
+        base, _, suffix = entry.partition(".")
+        path = os.path.join(root, entry)
+        if suffix == "old" and base not in entries:
+            os.replace(path, os.path.join(root, base))  # 교체 도중 중단 → 이전 샤드 복원
+        elif suffix in ("old", "compact", "dropped"):
+            shutil.rmtree(path, ignore_errors=True)
+    return sorted(e for e in os.listdir(root) if "." not in e and os.path.isdir(os.path.join(root, e)))
+
+
+def main():
+    from vector_store import initialize_vector_store, save_vector_store
+
+    parser = argparse.ArgumentParser(description="샤드 인덱스 관리 (CURRENT 버전)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="샤드별 문서 수")
+    compact = sub.add_parser("compact", help="샤드 하나를 새로 써서 정리")
+    compact.add_argument("shard")
+    drop = sub.add_parser("drop", help="샤드 하나 삭제")
+    drop.add_argument("shard")
+    add = sub.add_parser("add", help="저장된 인덱스 디렉터리를 샤드로 추가")
+    add.add_argument("shard")
+    add.add_argument("--from", dest="source", required=True)
+    args = parser.parse_args()
+
+    vs = initialize_vector_store()
+    if not isinstance(vs, ShardedVectorStore):
+        raise SystemExit("CURRENT 인덱스가 sharded 백엔드가 아닙니다.")
+    if args.command == "compact":
+        vs.compact_shard(args.shard)
+    elif args.command == "drop":
+        vs.drop_shard(args.shard)
+    elif args.command == "add":
+        vs.add_shard(args.shard, args.source)
+    if args.command != "status":
+        save_vector_store(vs)  # 매니페스트 문서 수 갱신 (다른 샤드는 다시 쓰지 않음)
+    print(f"partition={vs.partition}, shard_backend={vs.shard_backend}")
+    for name, stats in vs.shard_stats().items():
+        print(f"  {name}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# singleflight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+def normalize_key(text: str) -> str:
+    """공백/대소문자 차이만 있는 입력은 같은 키로"""
+    return " ".join(text.split()).lower()
+
+
+class SingleFlight:
+    """
+    같은 키로 동시에 들어온 호출을 진행 중인 1회 실행에 합친다 (Go singleflight 방식).
+    실행이 끝나면 키를 지우므로 결과 캐시는 아니다.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        else:
+            self.coalesced += 1
+        # 한 요청이 취소(타임아웃 등)돼도 같은 실행을 기다리는 다른 요청은 영향 없도록 shield
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chain
+from chain import ConversationChain
+
+
+class EchoModel:
+    """질문 변환 프롬프트에 고정 문장을 돌려주는 모델"""
+    def generate_content(self, prompt):
+        return SimpleNamespace(text="헤어진 연인에게 연락해도 될까요?")
+
+
+class BrokenEmbeddingRetriever:
+    """임베딩이 실패하는 리트리버. ainvoke는 자체 폴백 결과를 돌려준다."""
+    def __init__(self, fallback_error=None):
+        self.fallback_error = fallback_error
+        self.ainvoke_calls = 0
+
+    async def aembed_query(self, query):
+        raise RuntimeError("embedding backend down")
+
+    async def asearch_by_vector(self, embedding):
+        raise AssertionError("임베딩이 실패했으므로 호출되면 안 된다")
+
+    async def ainvoke(self, query):
+        self.ainvoke_calls += 1
+        if self.fallback_error:
+            raise self.fallback_error
+        return [SimpleNamespace(page_content="폴백 문서")]
+
+
+def _chain(retriever, monkeypatch):
+    monkeypatch.setattr(chain, "SPECULATIVE_RETRIEVAL", True)
+    return ConversationChain(model=EchoModel(), retriever=retriever)
+
+
+def test_speculation_embedding_error_falls_back_to_retriever(monkeypatch):
+    retriever = BrokenEmbeddingRetriever()
+    conv = _chain(retriever, monkeypatch)
+
+    docs = asyncio.run(conv._get_relevant_documents("연락해도 돼?"))
+
+    assert docs == ["폴백 문서"]
+    assert retriever.ainvoke_calls == 1
+    assert conv.speculation["failed"] == 1
+
+
+def test_speculation_and_fallback_errors_continue_without_context(monkeypatch):
+    retriever = BrokenEmbeddingRetriever(fallback_error=RuntimeError("index gone"))
+    conv = _chain(retriever, monkeypatch)
+
+    assert asyncio.run(conv._get_relevant_documents("연락해도 돼?")) == []
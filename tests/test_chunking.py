@@ -0,0 +1,76 @@
+import os
+import sys
+
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import build_passages, expand_passages, parent_key, passage_doc_id, split_sentences
+from numpy_store import NumpyDocstore
+
+STORY = "첫째 문장입니다. 둘째 문장이에요! 셋째는 질문인가요? 넷째 문장.\n다섯째 줄"
+
+
+def _story_docs(story_id, text, window=2, stride=1):
+    """build_passages 결과를 vector_store와 같은 메타데이터로 (docstore ID → 패시지)"""
+    passages = build_passages(text, window=window, stride=stride)
+    return {
+        passage_doc_id(story_id, i): Document(page_content=p["text"], metadata={
+            "story_id": story_id, "passage_idx": i, "passage_count": len(passages),
+            "sent_start": p["sent_start"], "sent_end": p["sent_end"]})
+        for i, p in enumerate(passages)
+    }
+
+
+def test_split_sentences_on_punctuation_and_newlines():
+    assert split_sentences(STORY) == ["첫째 문장입니다.", "둘째 문장이에요!", "셋째는 질문인가요?", "넷째 문장.", "다섯째 줄"]
+    assert split_sentences("  \n ") == []
+
+
+def test_passages_are_overlapping_sentence_windows():
+    passages = build_passages(STORY, window=3, stride=2)
+    assert [(p["sent_start"], p["sent_end"]) for p in passages] == [(0, 3), (2, 5)]
+    assert passages[1]["text"] == "셋째는 질문인가요?\n넷째 문장.\n다섯째 줄"
+    # 패시지 텍스트를 다시 나누면 원래 문장 구간과 같다
+    sentences = split_sentences(STORY)
+    assert all(split_sentences(p["text"]) == sentences[p["sent_start"]:p["sent_end"]] for p in passages)
+
+
+def test_passage_windows_clamp_stride_and_cover_short_text():
+    # stride가 window보다 크면 window로 줄여 문장을 건너뛰지 않는다
+    assert [(p["sent_start"], p["sent_end"]) for p in build_passages(STORY, window=2, stride=5)] == [(0, 2), (2, 4), (4, 5)]
+    assert build_passages("문장부호 없는 한 줄") == [{"text": "문장부호 없는 한 줄", "sent_start": 0, "sent_end": 1}]
+
+
+def test_passage_ids_and_parent_key():
+    assert passage_doc_id("42", 3) == "42#p3"
+    passage = Document(page_content="x", metadata={"story_id": "42", "passage_idx": 3})
+    legacy = Document(page_content="y", metadata={})
+    assert parent_key(passage) == "42"
+    assert parent_key(legacy) == id(legacy)
+
+
+def test_expand_merges_neighbours_per_story():
+    docs = _story_docs("a", STORY)  # 패시지 (0,2) (1,3) (2,4) (3,5)
+    docstore = NumpyDocstore(dict(docs))
+    legacy = Document(page_content="예전 사연 통째", metadata={"story_id": "old"})
+    hits = [docs["a#p3"], legacy, docs["a#p0"]]
+
+    expanded = expand_passages(hits, docstore, neighbors=1)
+    assert [d.metadata["story_id"] for d in expanded] == ["a", "old"]  # 사연당 1개, relevance 순
+    story = expanded[0]
+    assert story.metadata["matched_passages"] == [0, 3]
+    assert "passage_idx" not in story.metadata
+    # 0±1, 3±1 → 패시지 0~3 전부 → 문장이 겹침 없이 한 번씩
+    assert story.page_content == " ".join(split_sentences(STORY))
+    assert expanded[1] is legacy
+
+
+def test_expand_marks_gaps_and_truncates():
+    docs = _story_docs("a", STORY, window=1, stride=1)  # 문장 하나씩
+    docstore = NumpyDocstore(dict(docs))
+    story = expand_passages([docs["a#p0"], docs["a#p4"]], docstore, neighbors=0)[0]
+    assert story.page_content == "첫째 문장입니다. … 다섯째 줄"
+    assert expand_passages([docs["a#p0"], docs["a#p4"]], docstore, neighbors=0, max_chars=5)[0].page_content == "첫째 문장…"
+    # docstore 없이도 히트한 패시지만으로 합친다
+    assert expand_passages([docs["a#p1"]], None, neighbors=1)[0].page_content == "둘째 문장이에요!"
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chain
+from chain import GENERATION_TIMEOUT_MESSAGE, ConversationChain
+from deadline import Deadline, StageBudgets
+
+
+class SlowModel:
+    """호출 순서대로 정해 둔 시간(초)만큼 걸리는 동기 모델 (체인이 스레드에서 실행)"""
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        delay = self.delays[len(self.prompts)] if len(self.prompts) < len(self.delays) else 0.0
+        self.prompts.append(prompt)
+        time.sleep(delay)
+        return SimpleNamespace(text=f"응답 {len(self.prompts)}")
+
+
+class SlowRetriever:
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def ainvoke(self, query):
+        await asyncio.sleep(self.delay)
+        return [SimpleNamespace(page_content="관련 사연")]
+
+
+def _invoke(model, retriever, monkeypatch, **budgets):
+    monkeypatch.setattr(chain, "SPECULATIVE_RETRIEVAL", False)
+    conv = ConversationChain(model=model, retriever=retriever, budgets=StageBudgets(**budgets))
+    return asyncio.run(conv.ainvoke({"input": "연락해도 될까요?"}))
+
+
+def test_budgets_from_env(monkeypatch):
+    monkeypatch.setenv("CHAIN_DEADLINE_MS", "8000")
+    monkeypatch.setenv("RETRIEVAL_BUDGET_MS", "250")
+    budgets = StageBudgets.from_env()
+    assert (budgets.total_ms, budgets.retrieval_ms) == (8000.0, 250.0)
+    assert budgets.condense_ms == StageBudgets.condense_ms
+
+
+def test_cap_is_stage_limit_or_what_is_left_after_the_reserve():
+    deadline = Deadline(1000)
+    assert deadline.cap(200) == pytest.approx(0.2)
+    assert deadline.cap(5000) == pytest.approx(1.0, abs=0.05)
+    assert deadline.cap(5000, reserve_ms=700) == pytest.approx(0.3, abs=0.05)
+    assert deadline.cap(200, reserve_ms=1000) is None
+    assert Deadline(0).cap(100) is None
+    assert Deadline(0).remaining() == 0.0
+
+
+def test_within_budget_is_not_degraded(monkeypatch):
+    result = _invoke(SlowModel(), SlowRetriever(0), monkeypatch, generation_reserve_ms=0)
+    assert result["degraded"] == []
+    assert result["source_documents"] == ["관련 사연"]
+
+
+def test_slow_condense_falls_back_to_original_question(monkeypatch):
+    model = SlowModel(0.5)
+    result = _invoke(model, SlowRetriever(0), monkeypatch, condense_ms=100, generation_reserve_ms=0)
+    assert result["degraded"] == ["condense"]
+    assert result["source_documents"] == ["관련 사연"]
+    assert result["output"] == "응답 2"
+
+
+def test_condense_is_skipped_without_generation_reserve(monkeypatch):
+    model = SlowModel()
+    result = _invoke(model, SlowRetriever(0), monkeypatch, total_ms=1000, generation_reserve_ms=5000)
+    assert result["degraded"] == ["condense"]
+    assert len(model.prompts) == 1  # 답변 생성만
+
+
+def test_slow_retrieval_continues_without_context(monkeypatch):
+    result = _invoke(SlowModel(), SlowRetriever(0.5), monkeypatch, retrieval_ms=50, generation_reserve_ms=0)
+    assert result["degraded"] == ["retrieval"]
+    assert result["source_documents"] == []
+    assert result["output"] == "응답 2"
+
+
+def test_generation_past_the_deadline(monkeypatch):
+    result = _invoke(SlowModel(0, 1.0), SlowRetriever(0), monkeypatch, total_ms=300, generation_reserve_ms=0)
+    assert result["degraded"] == ["generation"]
+    assert result["output"] == GENERATION_TIMEOUT_MESSAGE
@@ -0,0 +1,95 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import passage_doc_id
+from dedup import (DEDUP_CANDIDATES, _KeptVectors, dedupe_vector_store, find_near_duplicate, merge_duplicate,
+                   simhash, text_simhash)
+from numpy_store import NumpyVectorStore
+
+
+def _unit(v):
+    return (v / np.linalg.norm(v)).astype(np.float32)
+
+
+def test_kept_vectors_matches_brute_force_l2():
+    rng = np.random.default_rng(0)
+    rows = rng.standard_normal((50, 8)).astype(np.float32)
+    queries = rng.standard_normal((3, 8)).astype(np.float32)
+    kept = _KeptVectors(8)
+    kept.add(rows[:30])
+    kept.add(rows[30:])
+    distances, labels = kept.search(queries, 5)
+    expected = ((queries[:, None, :] - rows[None, :, :]) ** 2).sum(axis=2)
+    assert (labels == np.argsort(expected, axis=1)[:, :5]).all()
+    np.testing.assert_allclose(distances, np.sort(expected, axis=1)[:, :5], rtol=1e-4, atol=1e-4)
+
+
+def test_offline_dedup_on_numpy_store_without_faiss(monkeypatch):
+    monkeypatch.setitem(sys.modules, "faiss", None)  # import faiss → ImportError
+    rng = np.random.default_rng(1)
+    a, b = _unit(rng.standard_normal(16)), _unit(rng.standard_normal(16))
+    near_a = _unit(a + 0.01 * rng.standard_normal(16))
+    store = NumpyVectorStore(None)
+    store.add_embeddings(
+        [("첫 번째 사연", a.tolist()), ("전혀 다른 사연", b.tolist()), ("표현만 바꾼 첫 사연", near_a.tolist())],
+        metadatas=[{"story_id": "A"}, {"story_id": "B"}, {"story_id": "C"}],
+        ids=["a", "b", "c"],
+    )
+    assert dedupe_vector_store(store, threshold=0.95) == ["c"]
+    assert store.docstore.search("a").metadata["duplicate_ids"] == ["C"]
+    assert store.ntotal == 2
+
+
+def _passages(story_id, texts, vectors, simhash_hex=None):
+    """패시지로 나눈 사연 1건의 add_embeddings 인자"""
+    metadatas = [{"story_id": story_id, "passage_idx": i, "passage_count": len(texts)} for i in range(len(texts))]
+    if simhash_hex:
+        for m in metadatas:
+            m["simhash"] = simhash_hex
+    return list(zip(texts, vectors)), metadatas, [passage_doc_id(story_id, i) for i in range(len(texts))]
+
+
+def test_merge_records_link_on_every_passage_of_the_story():
+    rng = np.random.default_rng(2)
+    store = NumpyVectorStore(None)
+    pairs, metadatas, ids = _passages("A", ["첫 문장", "둘째 문장", "셋째 문장"],
+                                      [_unit(rng.standard_normal(8)).tolist() for _ in range(3)])
+    store.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+
+    merge_duplicate(store.docstore.search("A#p1"), "B", store.docstore)
+    assert [store.docstore.search(i).metadata.get("duplicate_ids") for i in ids] == [["B"]] * 3
+
+
+def test_empty_text_has_no_signature_and_is_not_a_duplicate():
+    assert text_simhash("?! ... ") is None
+    rng = np.random.default_rng(3)
+    store = NumpyVectorStore(None)
+    store.add_embeddings([("…!!", _unit(rng.standard_normal(16)).tolist())], metadatas=[{"story_id": "A"}], ids=["a"])
+    assert find_near_duplicate(store, "?!", [_unit(rng.standard_normal(16)).tolist()]) is None
+
+
+def test_simhash_match_outside_embedding_neighbours():
+    rng = np.random.default_rng(4)
+    query = _unit(rng.standard_normal(16))
+    story = "오늘 회사에서 상사에게 크게 혼나서 퇴근길 내내 마음이 무거웠어요. 내일 출근이 벌써 걱정이에요."
+    store = NumpyVectorStore(None)
+    # 질의 임베딩 바로 옆의 다른 사연들이 이웃 후보를 모두 차지한다
+    for s in range(DEDUP_CANDIDATES * 2):
+        near = _unit(query + 0.5 * rng.standard_normal(16)).tolist()  # 임베딩 기준으로는 중복이 아닐 만큼
+        store.add_embeddings([(f"다른 사연 {s}", near)], metadatas=[{"story_id": f"n{s}"}], ids=[f"n{s}"])
+    pairs, metadatas, ids = _passages("A", [story], [_unit(-query).tolist()], f"{simhash(story):016x}")
+    store.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+
+    found = find_near_duplicate(store, story.replace(".", "!"), [query.tolist()])
+    assert found is not None and found[0].metadata["story_id"] == "A"
+
+    # 다른 경로로 스토어가 바뀌면 색인을 다시 만든다
+    pairs, metadatas, ids = _passages("B", ["완전히 다른 이야기입니다 고양이가 아파요"], [_unit(-query).tolist()],
+                                      f"{simhash('완전히 다른 이야기입니다 고양이가 아파요'):016x}")
+    store.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+    found = find_near_duplicate(store, "완전히 다른 이야기입니다, 고양이가 아파요!", [query.tolist()])
+    assert found is not None and found[0].metadata["story_id"] == "B"
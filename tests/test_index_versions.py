@@ -0,0 +1,88 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import index_versions
+import vector_store
+from index_versions import (
+    LEGACY_VERSION, current_version, list_versions, read_manifest, switch_current, version_dir, write_manifest,
+)
+from numpy_store import NumpyVectorStore
+
+
+@pytest.fixture(autouse=True)
+def persist_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_versions, "PERSIST_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _save_numpy_version(version, n=3, dim=8):
+    store = vector_store._tag(NumpyVectorStore(None), version, "test-model")
+    rng = np.random.default_rng(0)
+    store.add_embeddings([(f"doc {i}", rng.standard_normal(dim).tolist()) for i in range(n)],
+                         ids=[f"d{i}" for i in range(n)])
+    vector_store.save_vector_store(store)
+    return store
+
+
+def test_no_index_means_no_current_version(persist_dir):
+    assert current_version() is None
+    assert list_versions() == []
+
+
+def test_save_writes_manifest_and_keeps_built_at():
+    _save_numpy_version("v1")
+    manifest = read_manifest("v1")
+    assert {k: manifest[k] for k in ("version", "backend", "docstore", "model", "dim", "doc_count", "distance")} == {
+        "version": "v1", "backend": "numpy", "docstore": "jsonl", "model": "test-model", "dim": 8,
+        "doc_count": 3, "distance": "cosine"}
+    rewritten = write_manifest("v1", "test-model", 8, "cosine", 4, backend="numpy")
+    assert rewritten["built_at"] == manifest["built_at"]
+    assert read_manifest("v1")["doc_count"] == 4
+    assert not os.path.exists(os.path.join(version_dir("v1"), "manifest.json.tmp"))
+
+
+def test_manifest_defaults():
+    assert read_manifest("missing") == {}
+    assert read_manifest(LEGACY_VERSION)["backend"] == "faiss"  # 매니페스트 없는 예전 인덱스
+
+
+def test_switch_current_points_at_built_version(persist_dir):
+    _save_numpy_version("v1")
+    _save_numpy_version("v2")
+    assert list_versions() == ["v1", "v2"]
+    switch_current("v1")
+    switch_current("v2")
+    assert current_version() == "v2"
+    assert (persist_dir / "CURRENT").read_text(encoding="utf-8") == "v2\n"
+    assert not (persist_dir / "CURRENT.tmp").exists()
+
+
+def test_switch_current_refuses_missing_index_and_keeps_old_pointer(persist_dir, monkeypatch):
+    _save_numpy_version("v1")
+    switch_current("v1")
+    with pytest.raises(ValueError):
+        switch_current("nope")
+    assert current_version() == "v1"
+
+    # 교체 직전에 죽으면 tmp 파일만 남고 CURRENT는 이전 버전 그대로
+    _save_numpy_version("v2")
+
+    def crash(src, dst):
+        raise OSError("crash before rename")
+
+    monkeypatch.setattr(index_versions.os, "replace", crash)
+    with pytest.raises(OSError):
+        switch_current("v2")
+    assert current_version() == "v1"
+
+
+def test_legacy_directory_without_current(persist_dir):
+    NumpyVectorStore(None).save_local(str(persist_dir))
+    assert current_version() == LEGACY_VERSION
+    assert list_versions() == [LEGACY_VERSION]
+    assert version_dir(LEGACY_VERSION) == str(persist_dir)
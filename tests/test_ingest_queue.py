@@ -0,0 +1,120 @@
+import asyncio
+import os
+import sys
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest_queue
+import vector_store
+from ingest_queue import IngestJob, IngestQueue
+from numpy_store import NumpyVectorStore
+
+
+def _fake_add(calls):
+    def add(store, stories, persist):
+        calls.append([content for content, _ in stories])
+        if any("bad" in content for content, _ in stories):
+            raise RuntimeError("embedding failed")
+        return [story_id for _, story_id in stories]
+    return add
+
+
+def test_failed_persist_backs_off_instead_of_spinning(monkeypatch):
+    saves = []
+
+    def failing_save(store):
+        saves.append(store)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ingest_queue, "add_stories_to_vector_store", _fake_add([]))
+    monkeypatch.setattr(ingest_queue, "save_vector_store", failing_save)
+
+    async def scenario():
+        queue = IngestQueue(lambda: "store", batch_wait=0, persist_interval=0.01)
+        job = queue.submit("사연")
+        await asyncio.sleep(0.3)
+        queue._worker.cancel()
+        return queue, job
+
+    queue, job = asyncio.run(scenario())
+    assert len(saves) == 1  # 첫 실패 후 최소 1초는 다시 저장하지 않는다
+    assert job.status == "searchable"
+    assert queue.stats()["persist_failures"] == 1
+
+
+def test_flush_continues_after_a_failed_batch(monkeypatch):
+    calls, saves = [], []
+    monkeypatch.setattr(ingest_queue, "add_stories_to_vector_store", _fake_add(calls))
+    monkeypatch.setattr(ingest_queue, "save_vector_store", saves.append)
+
+    async def scenario():
+        queue = IngestQueue(lambda: "store", batch_size=1)
+        bad = IngestJob("bad story")
+        good = IngestJob("good story")
+        queue._pending.extend([bad, good])
+        await queue.flush()
+        return bad, good
+
+    bad, good = asyncio.run(scenario())
+    assert bad.status == "failed"
+    assert good.status == "done"
+    assert calls == [["bad story"], ["good story"]]
+    assert saves == ["store"]
+
+
+class _HashEmbeddings:
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        return rng.standard_normal(8).tolist()
+
+
+class _FlakyStore(NumpyVectorStore):
+    """본문에 'bad'가 든 사연만 추가에 실패하는 스토어"""
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        text_embeddings = list(text_embeddings)
+        if any("bad" in text for text, _ in text_embeddings):
+            raise RuntimeError("index write failed")
+        return super().add_embeddings(text_embeddings, metadatas=metadatas, ids=ids, **kwargs)
+
+
+def test_story_failing_mid_batch_fails_only_that_job(monkeypatch):
+    store, saves = _FlakyStore(_HashEmbeddings()), []
+    monkeypatch.setattr(vector_store, "_get_embeddings", lambda model_name=None: _HashEmbeddings())
+    monkeypatch.setattr(vector_store, "DEDUP_MODE", "off")
+    monkeypatch.setattr(ingest_queue, "save_vector_store", saves.append)
+
+    async def scenario():
+        queue = IngestQueue(lambda: store, batch_size=3)
+        jobs = [IngestJob("첫 사연입니다."), IngestJob("bad 사연입니다."), IngestJob("셋째 사연입니다.")]
+        queue._pending.extend(jobs)
+        await queue.flush()
+        return jobs
+
+    first, bad, third = asyncio.run(scenario())
+    assert bad.status == "failed" and "index write failed" in bad.error
+    assert first.status == third.status == "done"  # 앞뒤 사연은 검색되고 저장까지 됨
+    assert {d.metadata["story_id"] for _, d in store.docstore.items()} == {first.story_id, third.story_id}
+    assert saves == [store]
+
+
+def test_job_history_is_capped_while_oldest_job_is_unfinished():
+    queue = IngestQueue(lambda: "store", history=3)
+    stuck = IngestJob("저장 실패로 searchable에 머무는 사연")
+    stuck.status = "searchable"
+    queue._remember(stuck)
+    for _ in range(5):
+        job = IngestJob("사연")
+        job.status = "done"
+        queue._remember(job)
+    assert len(queue._jobs) == 3
+    assert queue.get(stuck.id) is stuck  # 끝난 작업부터 지운다
+
+    for _ in range(3):
+        queue._remember(IngestJob("대기 중"))
+    assert len(queue._jobs) == 3
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_client
+from llm_client import GeminiClient, LLMError, TransientLLMError, parse_retry_after, percentile
+from llm_stub import StubModel, serve
+
+
+@pytest.fixture
+def stub():
+    """빠른 응답(1ms)의 스텁 서버와 거기에 붙은 클라이언트를 만드는 함수"""
+    servers = []
+
+    def make(faults=(), **client_kwargs):
+        model = StubModel(condense_median_ms=1, answer_median_ms=1, sigma=0, tail_prob=0, faults=list(faults))
+        server = serve("127.0.0.1", 0, model)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        client = GeminiClient("test-key", base_url=f"http://127.0.0.1:{server.server_address[1]}", **client_kwargs)
+        return model, client
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE_MS", 10.0)
+
+
+def test_percentile_and_retry_after_parsing():
+    assert percentile([], 95) == 0.0
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile(list(range(1, 21)), 95) == 19
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("soon") is None
+    assert 2.0 <= parse_retry_after(formatdate(time.time() + 3, usegmt=True)) <= 3.0
+
+
+def test_pool_reuses_connections(stub):
+    _, client = stub()
+    for _ in range(3):
+        assert client.generate_content("안녕").text
+    stats = client.stats()
+    assert stats["connections_created"] == 1
+    assert stats["connections_reused"] == 2
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_transient_status_then_succeeds(stub, status):
+    model, client = stub([{"status": status}, {"status": status}])
+    assert client.generate_content("안녕").text
+    assert model.served == 3
+    assert client.counters["retries"] == 2
+    assert client.counters["failures"] == 0
+
+
+def test_gives_up_after_max_retries(stub):
+    model, client = stub([{"status": 503}] * 5, max_retries=2)
+    with pytest.raises(TransientLLMError):
+        client.generate_content("안녕")
+    assert model.served == 3
+    assert client.counters["failures"] == 1
+
+
+@pytest.mark.parametrize("http_date", [False, True])
+def test_honours_retry_after_seconds_and_http_date(stub, http_date):
+    retry_after = formatdate(time.time() + 2, usegmt=True) if http_date else "1"
+    _, client = stub([{"status": 429, "retry_after": retry_after}])
+    start = time.monotonic()
+    client.generate_content("안녕")
+    assert time.monotonic() - start >= 0.9
+
+
+def test_blocked_candidate_is_an_error(stub):
+    _, client = stub([{"finish_reason": "SAFETY"}])
+    with pytest.raises(LLMError, match="SAFETY"):
+        client.generate_content("안녕")
+    assert client.counters["retries"] == 0
+
+
+def test_slow_primary_is_hedged(stub, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_MIN_DELAY_MS", 50.0)
+    model, client = stub([{"delay_s": 1.5}], hedge=True)
+    client._latencies.extend([0.01] * llm_client.LLM_HEDGE_MIN_SAMPLES)
+
+    start = time.monotonic()
+    response = asyncio.run(client.agenerate_content("안녕"))
+    assert response.text
+    assert time.monotonic() - start < 1.0
+    assert client.counters["hedges_sent"] == 1
+    assert client.counters["hedges_won"] == 1
+    assert model.served == 2
+
+
+def test_no_retry_past_the_deadline(stub):
+    model, client = stub([{"status": 503, "retry_after": "1"}] * 3)
+    start = time.monotonic()
+    with pytest.raises(TransientLLMError):
+        asyncio.run(client.agenerate_content("안녕", timeout=0.5))
+    assert time.monotonic() - start < 0.5
+    assert model.served == 1
+
+
+def test_cancelled_caller_stops_retries(stub):
+    model, client = stub([{"status": 503, "retry_after": "1"}] * 3)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.agenerate_content("안녕"), 0.2)
+
+    asyncio.run(scenario())
+    time.sleep(1.5)  # 취소되지 않았다면 이 사이에 재시도했을 것
+    assert model.served == 1
+    assert client.counters["failures"] == 1
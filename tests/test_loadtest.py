@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import sys
+from argparse import Namespace
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import loadtest
+from loadtest import load_arrivals
+from llm_client import percentile
+
+
+def _write_log(path, gaps):
+    """첫 요청 뒤 gaps초 간격으로 기록된 대화 로그 (순서를 섞어 저장)"""
+    t = datetime(2026, 10, 1, 12, 0, 0)
+    entries = [{"timestamp": t.isoformat(), "user_input": "q0"}]
+    for i, gap in enumerate(gaps, 1):
+        t += timedelta(seconds=gap)
+        entries.append({"timestamp": t.isoformat(), "user_input": f"q{i}"})
+    entries.append({"timestamp": t.isoformat(), "user_input": ""})  # 빈 입력은 건너뜀
+    path.write_text(json.dumps(list(reversed(entries)), ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def _args(log, **overrides):
+    args = dict(log=log, rate=1.0, max_gap=5.0, limit=0, url="", timeout=5.0, max_inflight=8,
+                stub_retriever=True, stub_error_rate=0.0, stub_condense_ms=0.0, stub_answer_ms=0.0, seed=0)
+    args.update(overrides)
+    return Namespace(**args)
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 99) == 7
+    assert percentile([3, 1, 2], 0) == 1
+
+
+def test_arrivals_keep_recorded_gaps_scaled_and_clipped(tmp_path):
+    log = _write_log(tmp_path / "chat_log.json", [1.0, 2.0, 60.0, 0.5])
+    assert [m for _, m in load_arrivals(log, rate=1.0, max_gap=5.0)] == ["q0", "q1", "q2", "q3", "q4"]
+    assert [t for t, _ in load_arrivals(log, rate=1.0, max_gap=5.0)] == [0.0, 1.0, 3.0, 8.0, 8.5]
+    assert [t for t, _ in load_arrivals(log, rate=2.0, max_gap=5.0)] == [0.0, 0.5, 1.5, 4.0, 4.25]
+
+
+def test_requests_fire_on_schedule_without_waiting_for_responses(tmp_path, monkeypatch):
+    log = _write_log(tmp_path / "chat_log.json", [0.1, 0.1, 0.1])
+    fired = []
+
+    def slow_target(args):
+        async def call(message):
+            fired.append((message, asyncio.get_running_loop().time()))
+            await asyncio.sleep(0.5)  # 응답이 도착 간격보다 느려도 다음 요청은 예정대로
+            return True
+        return call
+
+    monkeypatch.setattr(loadtest, "build_direct_target", slow_target)
+    report = asyncio.run(loadtest.run(_args(log)))
+    start = fired[0][1]
+    offsets = [t - start for _, t in fired]
+    assert [m for m, _ in fired] == ["q0", "q1", "q2", "q3"]
+    assert all(abs(o - expected) < 0.05 for o, expected in zip(offsets, [0.0, 0.1, 0.2, 0.3]))
+    assert abs(report["offered_rps"] - 10.0) < 1e-3
+    assert report["latency_ms"]["p50"] >= 500
+
+
+def test_direct_replay_does_not_block_the_event_loop(tmp_path):
+    log = _write_log(tmp_path / "chat_log.json", [0.02] * 9)
+    report = asyncio.run(loadtest.run(_args(log, stub_condense_ms=30, stub_answer_ms=80)))
+    assert report["error_rate"] == 0
+    # 스텁 응답(time.sleep)이 루프에서 돌면 지연이 수십 ms씩 튄다
+    assert report["loop_lag_ms"]["max"] < 30
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import sys
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import index_versions
+import migration
+import vector_store
+from index_versions import current_version, read_manifest, switch_current
+from migration import DualReader, MigrationJob, cutover, overlap, story_ids
+from numpy_store import NumpyVectorStore
+
+
+class _ModelEmbeddings:
+    """모델 이름마다 차원이 다른 결정적 임베딩"""
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.dim = 12 if model_name == "new-model" else 8
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(zlib.crc32(f"{self.model_name}:{text}".encode("utf-8")))
+        return rng.standard_normal(self.dim).tolist()
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """CURRENT = v1 (old-model, numpy) 인 서빙 스토어"""
+    monkeypatch.setattr(index_versions, "PERSIST_DIR", str(tmp_path))
+    fake = lambda model_name=None: _ModelEmbeddings(model_name)
+    monkeypatch.setattr(vector_store, "_get_embeddings", fake)
+    monkeypatch.setattr(migration, "_get_embeddings", fake)
+
+    store = vector_store._tag(NumpyVectorStore(_ModelEmbeddings("old-model")), "v1", "old-model")
+    texts = [f"사연 {i} 본문" for i in range(5)]
+    store.add_embeddings(list(zip(texts, store.embeddings.embed_documents(texts))),
+                         metadatas=[{"story_id": f"s{i}"} for i in range(5)], ids=[f"s{i}" for i in range(5)])
+    vector_store.save_vector_store(store)
+    switch_current("v1")
+    return store
+
+
+def _docs(store):
+    return {k: (d.page_content, d.metadata) for k, d in vector_store.iter_documents(store)}
+
+
+def test_run_rebuilds_with_new_model_without_switching(source):
+    job = MigrationJob(source, "new-model", batch_size=2, backend="numpy")
+    job.run()
+    assert job.status == "ready", job.error
+    assert (job.embedded, job.total) == (5, 5)
+    assert _docs(job.target) == _docs(source)
+    manifest = read_manifest(job.version)
+    assert (manifest["model"], manifest["dim"], manifest["backend"], manifest["doc_count"]) == ("new-model", 12, "numpy", 5)
+    assert current_version() == "v1"  # 전환은 cutover에서만
+
+
+def test_catch_up_applies_adds_deletes_and_metadata(source):
+    job = MigrationJob(source, "new-model", backend="numpy")
+    job.run()
+
+    source.add_embeddings([("새 사연", source.embeddings.embed_query("새 사연"))],
+                          metadatas=[{"story_id": "s9"}], ids=["s9"])
+    source.delete(["s0"])
+    source.docstore.search("s1").metadata["duplicate_ids"] = ["s7"]  # 병합 기록
+
+    assert job.catch_up() == 2
+    assert _docs(job.target) == _docs(source)
+    assert job.catch_up() == 0
+
+
+def test_cutover_switches_and_switch_rolls_back(source):
+    job = MigrationJob(source, "new-model", backend="numpy")
+    with pytest.raises(ValueError):
+        cutover(job)  # 빌드 전
+
+    job.run()
+    source.add_embeddings([("컷오버 직전 사연", source.embeddings.embed_query("컷오버 직전 사연"))],
+                          metadatas=[{"story_id": "s8"}], ids=["s8"])
+    target = cutover(job)
+    assert job.status == "switched"
+    assert current_version() == job.version
+    loaded = vector_store.initialize_vector_store()
+    assert (loaded.index_version, loaded.embedding_model, loaded.dim) == (job.version, "new-model", 12)
+    assert _docs(loaded) == _docs(target) == _docs(source)
+
+    switch_current("v1")  # 롤백
+    loaded = vector_store.initialize_vector_store()
+    assert (loaded.index_version, loaded.embedding_model, loaded.dim) == ("v1", "old-model", 8)
+
+
+def test_failed_build_is_reported(source, monkeypatch):
+    def broken(model_name=None):
+        raise RuntimeError("model download failed")
+
+    monkeypatch.setattr(migration, "_get_embeddings", broken)
+    job = MigrationJob(source, "new-model", backend="numpy")
+    job.start()._thread.join(5)
+    assert job.status == "failed"
+    assert "model download failed" in job.error
+    assert current_version() == "v1"
+
+
+class _FixedRetriever:
+    def __init__(self, *story_ids):
+        self.docs = [SimpleNamespace(metadata={"story_id": s}) for s in story_ids]
+
+    async def ainvoke(self, query):
+        return self.docs
+
+
+def test_overlap_and_story_ids():
+    docs = [SimpleNamespace(metadata={"story_id": s}) for s in ("a", "b", "a", "c")]
+    assert story_ids(docs) == ["a", "b", "c"]
+    assert overlap([], []) == 1.0
+    assert overlap(["a", "b"], ["b", "c", "d"]) == pytest.approx(1 / 3)
+
+
+def test_dual_reader_records_overlap():
+    reader = DualReader(_FixedRetriever("a", "b"), _FixedRetriever("b", "a"), max_samples=2)
+    assert reader.stats() == {"samples": 0}
+
+    async def scenario():
+        first = await reader.compare("q1")
+        reader.candidate = _FixedRetriever("a", "c")
+        await reader.compare("q2")
+        await reader.compare("q3")
+        return first
+
+    first = asyncio.run(scenario())
+    assert first == {"query": "q1", "primary": ["a", "b"], "candidate": ["b", "a"], "overlap": 1.0}
+    stats = reader.stats()
+    assert stats["samples"] == 2  # 최근 max_samples개만
+    assert stats["mean_overlap"] == 0.5
+    assert stats["identical_rate"] == 0.0
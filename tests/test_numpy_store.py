@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numpy_store import NumpyVectorStore
+
+
+def _store(path, n=6, dim=8):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    store = NumpyVectorStore(None)
+    store.add_embeddings([(f"doc {i}", v.tolist()) for i, v in enumerate(vectors)], ids=[f"d{i}" for i in range(n)])
+    store.save_local(str(path))
+    return store, vectors
+
+
+def _assert_paired(store, vectors):
+    """모든 ID가 자기 벡터로 검색되어야 한다 (행과 ID가 어긋나지 않음)"""
+    for doc_id in store._ids:
+        i = int(doc_id[1:])
+        doc, dist = store.similarity_search_with_score_by_vector(vectors[i].tolist(), k=1)[0]
+        assert doc.page_content == f"doc {i}"
+        assert dist < 1e-3
+
+
+def test_unsaved_delete_keeps_saved_generation_consistent(tmp_path):
+    store, vectors = _store(tmp_path)
+    store.delete(["d1"])  # persist=False 경로/저장 전 중단과 같음
+
+    reloaded = NumpyVectorStore.load_local(str(tmp_path), None)
+    assert reloaded.ntotal == 6
+    _assert_paired(reloaded, vectors)
+
+
+def test_saved_delete_commits_new_generation(tmp_path):
+    store, vectors = _store(tmp_path)
+    store.delete(["d1", "d3"])
+    store.add_embeddings([("doc 6", np.ones(8).tolist())], ids=["d6"])
+    vectors = np.vstack([vectors, np.ones((1, 8), np.float32)])
+    store.save_local(str(tmp_path))
+
+    reloaded = NumpyVectorStore.load_local(str(tmp_path), None)
+    assert reloaded._ids == ["d0", "d2", "d4", "d5", "d6"]
+    _assert_paired(reloaded, vectors)
+    assert sorted(os.listdir(tmp_path)) == ["docs.jsonl", "ids.1.npy", "vectors.1.npy"]
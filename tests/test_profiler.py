@@ -0,0 +1,77 @@
+import asyncio
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiler import SamplingProfiler, collapsed
+
+
+def _block_loop(seconds):
+    time.sleep(seconds)
+
+
+def _busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def test_collapsed_is_most_common_first():
+    assert collapsed(Counter({"event-loop;a;b": 2, "event-loop;a;c": 5})) == "event-loop;a;c 5\nevent-loop;a;b 2"
+
+
+def test_reports_effective_interval():
+    result = asyncio.run(SamplingProfiler().run(0.05, interval_ms=0.2))
+    assert result["interval_ms"] == 1.0
+
+
+def test_stall_records_blocking_stack():
+    async def scenario():
+        profiler = SamplingProfiler()
+        session = asyncio.create_task(profiler.run(0.6, interval_ms=2, stall_ms=50))
+        await asyncio.sleep(0.1)
+        _block_loop(0.25)
+        return await session
+
+    result = asyncio.run(scenario())
+    assert len(result["stalls"]) == 1
+    stall = result["stalls"][0]
+    assert 150 <= stall["duration_ms"] <= 400
+    assert any("_block_loop" in frame for frame in stall["stack"])
+    assert "_block_loop" in result["collapsed"]
+
+
+def test_request_percent_samples_only_chosen_requests():
+    async def scenario():
+        profiler = SamplingProfiler()
+        session = asyncio.create_task(profiler.run(0.8, interval_ms=2, request_percent=100))
+        await asyncio.sleep(0.1)
+        _busy(0.1)  # 골라진 요청이 없을 때 → 샘플 없음
+
+        async def chosen_request():
+            with profiler.track_request():
+                await asyncio.sleep(0)
+                _busy(0.1)
+                await asyncio.create_task(child())  # 요청이 만든 태스크도 그 요청 몫
+                await asyncio.sleep(0.2)
+
+        async def child():
+            _block_loop(0.1)
+
+        async def other_request():
+            await asyncio.sleep(0.25)
+            _busy(0.1)  # 골라진 요청이 처리 중이지만 다른 요청이 루프를 쓰는 구간
+
+        await asyncio.gather(chosen_request(), other_request())
+        return await session
+
+    result = asyncio.run(scenario())
+    assert result["samples"] > 0
+    assert "chosen_request" in result["collapsed"]
+    assert "child" in result["collapsed"]
+    assert "other_request" not in result["collapsed"]
+    assert not re.search(r"\.scenario[; ]", result["collapsed"])
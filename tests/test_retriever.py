@@ -0,0 +1,123 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numpy_store import NumpyVectorStore
+from retriever import DUMMY_MARKER, ThresholdWrapperRetriever, get_retriever_with_threshold
+
+
+def _unit(v):
+    return (v / np.linalg.norm(v)).astype(np.float32)
+
+
+def _store(n_stories=8, passages=2, dim=16, seed=0):
+    """사연마다 패시지 2개, 질의 벡터 근처에 모두 모인 스토어와 질의 벡터"""
+    rng = np.random.default_rng(seed)
+    query = _unit(rng.standard_normal(dim))
+    pairs, metadatas, ids = [], [], []
+    for s in range(n_stories):
+        for p in range(passages):
+            pairs.append((f"사연 {s} 패시지 {p}", _unit(query + 0.3 * rng.standard_normal(dim)).tolist()))
+            metadatas.append({"story_id": f"s{s}"})
+            ids.append(f"s{s}#p{p}")
+    store = NumpyVectorStore(None)
+    store.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+    return store, query
+
+
+def _parents(pairs):
+    return {doc.metadata["story_id"] for doc, _ in pairs if DUMMY_MARKER not in doc.page_content}
+
+
+def test_native_range_search_stops_after_k_stories():
+    store, query = _store()
+    # 질의와 가장 가까운 자리에 더미를 넣어도 사연 수에 세지 않는다
+    store.add_embeddings([(DUMMY_MARKER, query.tolist())], metadatas=[{"is_dummy": True}], ids=["dummy"])
+    retriever = ThresholdWrapperRetriever(None, store, k=2, score_threshold=0.1, search_mode="range")
+
+    everything = store.range_search_by_vector(query.tolist(), retriever._range_radius())
+    assert len(_parents(everything)) == 8
+    pairs = retriever._range_search(query.tolist(), retriever._range_radius())
+    assert pairs == everything[:len(pairs)]  # 거리 순 앞부분만
+    assert len(_parents(pairs)) == 2
+    assert any(DUMMY_MARKER in doc.page_content for doc, _ in pairs)
+
+    docs = retriever._search_by_vector(query.tolist())
+    assert {d.metadata["story_id"] for d in docs} == _parents(pairs)
+
+
+class _RecordingStore:
+    """거리 오름차순으로 정해 둔 (문서, 거리) 중 앞 k개를 돌려주고 요청한 k를 기록"""
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.requested = []
+        self.docstore = None
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        self.requested.append(k)
+        return self.pairs[:k]
+
+
+def _doc(story, i):
+    return Document(page_content=f"{story}-{i}", metadata={"story_id": story})
+
+
+def test_range_radius_is_two_times_one_minus_threshold():
+    assert ThresholdWrapperRetriever(None, None, score_threshold=0.7)._range_radius() == pytest.approx(0.6)
+    assert ThresholdWrapperRetriever(None, None, score_threshold=1.0)._range_radius() == 0.0
+    assert ThresholdWrapperRetriever(None, None, score_threshold=None)._range_radius() is None
+
+    store, query = _store()
+    retriever = ThresholdWrapperRetriever(None, store, k=100, score_threshold=0.8, search_mode="range")
+    pairs = retriever._range_search(query.tolist(), retriever._range_radius())
+    everything = store.similarity_search_with_score_by_vector(query.tolist(), k=store.ntotal)
+    # relevance = 1 - dist/2 ≥ 0.8 인 것과 정확히 같은 집합
+    assert {d.page_content for d, _ in pairs} == {d.page_content for d, s in everything if 1 - s / 2 >= 0.8}
+
+
+def test_default_mode_is_fixed(monkeypatch):
+    monkeypatch.delenv("RETRIEVER_SEARCH_MODE", raising=False)
+    store, _ = _store()
+    assert get_retriever_with_threshold(store).search_mode == "fixed"
+
+
+def test_fixed_mode_fetches_once():
+    store = _RecordingStore([(_doc("a", i), 0.1) for i in range(20)] + [(_doc("b", 0), 0.2)])
+    retriever = ThresholdWrapperRetriever(None, store, k=2, search_mode="fixed")
+    retriever._search_by_vector([0.0])
+    assert store.requested == [4]
+
+
+def test_adaptive_doubles_prefetch_until_k_stories():
+    # 사연 a의 패시지 20개가 앞을 차지해서 b까지 보려면 21개 이상 조회해야 한다
+    store = _RecordingStore([(_doc("a", i), 0.1) for i in range(20)] + [(_doc("b", 0), 0.2), (_doc("c", 0), 0.3)])
+    retriever = ThresholdWrapperRetriever(None, store, k=2, search_mode="adaptive")
+    docs = retriever._search_by_vector([0.0])
+    assert store.requested == [4, 8, 16, 32]
+    assert {d.metadata["story_id"] for d in docs} == {"a", "b"}
+
+
+def test_adaptive_stops_at_cap():
+    store = _RecordingStore([(_doc("a", i), 0.1) for i in range(100)] + [(_doc("b", 0), 0.2)])
+    retriever = ThresholdWrapperRetriever(None, store, k=2, search_mode="adaptive", max_prefetch_factor=4)
+    retriever._search_by_vector([0.0])
+    assert store.requested == [4, 8]
+
+
+def test_adaptive_stops_when_farthest_is_below_threshold():
+    store = _RecordingStore([(_doc("a", i), 0.1) for i in range(3)] + [(_doc("x", i), 1.5) for i in range(50)])
+    retriever = ThresholdWrapperRetriever(None, store, k=2, score_threshold=0.7, search_mode="adaptive")
+    retriever._search_by_vector([0.0])
+    assert store.requested == [4]
+
+
+def test_adaptive_stops_when_index_is_exhausted():
+    store = _RecordingStore([(_doc("a", i), 0.1) for i in range(3)])
+    retriever = ThresholdWrapperRetriever(None, store, k=2, search_mode="adaptive")
+    retriever._search_by_vector([0.0])
+    assert store.requested == [4]
@@ -0,0 +1,106 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numpy_store import NumpyVectorStore
+from sharded_store import SHARDS_DIR, ShardedVectorStore
+
+
+def _data(n=120, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    pairs = [(f"doc {i}", v.tolist()) for i, v in enumerate(vectors)]
+    metadatas = [{"story_id": f"s{i}"} for i in range(n)]
+    ids = [f"d{i}" for i in range(n)]
+    return pairs, metadatas, ids, rng
+
+
+def _stores(n=120):
+    """같은 데이터를 넣은 (샤드 스토어, 단일 numpy 스토어, 질의 벡터 생성기)"""
+    pairs, metadatas, ids, rng = _data(n)
+    sharded = ShardedVectorStore(None, partition="hash", shard_count=4, shard_backend="numpy")
+    sharded.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+    single = NumpyVectorStore(None)
+    single.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+    return sharded, single, rng
+
+
+def _ids(pairs):
+    return [doc.page_content for doc, _ in pairs]
+
+
+def test_top_k_matches_single_store():
+    sharded, single, rng = _stores()
+    assert len(sharded.shard_stats()) == 4
+    for _ in range(10):
+        q = rng.standard_normal(16).tolist()
+        got = sharded.similarity_search_with_score_by_vector(q, k=7)
+        want = single.similarity_search_with_score_by_vector(q, k=7)
+        assert _ids(got) == _ids(want)
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in want], rtol=1e-5, atol=1e-6)
+        assert [s for _, s in got] == sorted(s for _, s in got)
+
+
+def test_range_search_is_union_of_shards():
+    sharded, single, rng = _stores()
+    q = rng.standard_normal(16).tolist()
+    radius = sorted(s for _, s in single.similarity_search_with_score_by_vector(q, k=120))[30]
+    got = sharded.range_search_by_vector(q, radius)
+    want = single.range_search_by_vector(q, radius)
+    assert sorted(_ids(got)) == sorted(_ids(want))
+    assert len(got) >= 30
+    assert [s for _, s in got] == sorted(s for _, s in got)
+
+
+def test_time_partition_requires_added_at():
+    store = ShardedVectorStore(None, partition="time", time_bucket="month", shard_backend="numpy")
+    with pytest.raises(ValueError):
+        store.add_embeddings([("a", [1.0, 0.0])], metadatas=[{"story_id": "s1"}], ids=["a"])
+    store.add_embeddings([("a", [1.0, 0.0]), ("b", [0.0, 1.0])],
+                         metadatas=[{"added_at": "2025-01-03T10:00:00"}, {"added_at": "2026-10-01T09:00:00"}],
+                         ids=["a", "b"])
+    assert sorted(store.shard_stats()) == ["t202501", "t202610"]
+
+
+def test_add_shard_rejects_partition_names(tmp_path):
+    store = ShardedVectorStore(None, shard_backend="numpy")
+    for name in ("h00", "h7", "t202610", "t2026w42", "t20261018"):
+        with pytest.raises(ValueError):
+            store.add_shard(name, str(tmp_path))
+
+
+def test_compact_drop_and_recover_on_disk(tmp_path):
+    sharded, single, rng = _stores()
+    path = str(tmp_path / "idx")
+    sharded.save_local(path)
+    names = sorted(sharded.shard_stats())
+
+    removed = [f"d{i}" for i in range(0, 120, 3)]
+    sharded.delete(removed)
+    single.delete(removed)
+    sharded.compact_shard(names[0])
+    assert not sharded.shard_stats()[names[0]]["dirty"]
+    sharded.save_local(path)
+
+    reloaded = ShardedVectorStore.load_local(path, None)
+    q = rng.standard_normal(16).tolist()
+    assert (_ids(reloaded.similarity_search_with_score_by_vector(q, k=5))
+            == _ids(single.similarity_search_with_score_by_vector(q, k=5)))
+
+    dropped_count = reloaded.shard_stats()[names[1]]["count"]
+    assert reloaded.drop_shard(names[1]) == dropped_count
+    assert not os.path.exists(os.path.join(path, SHARDS_DIR, names[1]))
+    assert sorted(ShardedVectorStore.load_local(path, None).shard_stats()) == [names[0]] + names[2:]
+
+    # 압축 교체 도중 중단: 원래 디렉터리는 .old로 옮겨졌고 새로 쓰던 .compact가 남은 상태
+    root = os.path.join(path, SHARDS_DIR)
+    os.replace(os.path.join(root, names[2]), os.path.join(root, names[2] + ".old"))
+    os.makedirs(os.path.join(root, names[3] + ".compact"))
+    recovered = ShardedVectorStore.load_local(path, None)
+    assert sorted(recovered.shard_stats()) == [names[0]] + names[2:]
+    assert sorted(os.listdir(root)) == [names[0]] + names[2:]
+    assert recovered.ntotal == reloaded.ntotal
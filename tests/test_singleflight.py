@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight, normalize_key
+
+
+def test_normalize_key_ignores_spacing_and_case():
+    assert normalize_key("  Hello \n  World ") == normalize_key("hello world") == "hello world"
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        runs = []
+
+        async def fn():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return "결과"
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)), flight.do("other", fn))
+        return flight, runs, results
+
+    flight, runs, results = asyncio.run(scenario())
+    assert results == ["결과"] * 6
+    assert len(runs) == 2
+    assert flight.stats() == {"calls": 6, "executions": 2, "coalesced": 4, "inflight": 0}
+
+
+def test_finished_key_runs_again():
+    async def scenario():
+        flight = SingleFlight("test")
+        counter = iter(range(10))
+
+        async def fn():
+            return next(counter)
+
+        return [await flight.do("k", fn), await flight.do("k", fn)]
+
+    assert asyncio.run(scenario()) == [0, 1]  # 결과 캐시가 아니다
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight("test")
+        started = asyncio.Event()
+
+        async def fn():
+            started.set()
+            await asyncio.sleep(0.1)
+            return "결과"
+
+        first = asyncio.create_task(flight.do("k", fn))  # 실행을 시작한 쪽이 취소돼도
+        await started.wait()
+        second = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return flight, await second
+
+    flight, result = asyncio.run(scenario())
+    assert result == "결과"
+    assert flight.executions == 1 and flight.coalesced == 1
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fn():
+            await asyncio.sleep(0.02)
+            raise ValueError("실패")
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(3)), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) and str(r) == "실패" for r in results)
+    assert flight.executions == 1
+    assert flight.stats()["inflight"] == 0  # 실패한 실행도 키를 지워 다음 호출은 다시 실행
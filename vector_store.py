@@ -1,96 +1,280 @@
 
 import os
-from langchain_community.vectorstores import FAISS
-from langchain_community.vectorstores.utils import DistanceStrategy
-from langchain_huggingface import HuggingFaceEmbeddings
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 
+from chunking import STORY_CHUNKING, build_passages, passage_doc_id
+from dedup import DEDUP_MODE, DuplicateStoryError, find_near_duplicate, merge_duplicate, remember_story, text_simhash
+from index_versions import (
+    EMBEDDING_MODEL, LEGACY_VERSION, current_version, new_version_name, read_manifest,
+    switch_current, version_dir, write_manifest,
+)
+from numpy_store import NumpyVectorStore
+
 # ---- 설정 ----
-_embeddings = None
-PERSIST_DIR = os.getenv("FAISS_PERSIST_DIR", "data/faiss_index")  # 디스크 저장 경로
-
-def _get_embeddings():
-    global _embeddings
-    if _embeddings is None:
-        # 코사인 유사도 스케일 안정화를 위해 정규화 권장
-        _embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/distiluse-base-multilingual-cased-v2",
-            encode_kwargs={"normalize_embeddings": True},
-        )
-    return _embeddings
+# 새 인덱스를 만들 때의 백엔드: faiss | numpy | sharded (기존 인덱스는 매니페스트에 기록된 백엔드로 로드)
+# FAISS/LangChain 벡터스토어/SQLite docstore/샤드 스토어/임베딩 모델은 실제로 쓸 때 import (numpy 백엔드 CLI 시작 시간 단축)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss")
+VECTOR_BACKENDS = ("faiss", "numpy", "sharded")
+
+# 모델별 임베딩 인스턴스 (마이그레이션 중에는 두 모델이 함께 로드됨)
+_embeddings: Dict[str, Any] = {}
+_embeddings_lock = threading.Lock()
+
+def _get_embeddings(model_name: Optional[str] = None):
+    model_name = model_name or EMBEDDING_MODEL
+    with _embeddings_lock:
+        if model_name not in _embeddings:
+            from langchain_huggingface import HuggingFaceEmbeddings
+
+            # 코사인 유사도 스케일 안정화를 위해 정규화 권장
+            _embeddings[model_name] = HuggingFaceEmbeddings(
+                model_name=model_name,
+                encode_kwargs={"normalize_embeddings": True},
+            )
+        return _embeddings[model_name]
 
 def _ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
-def initialize_vector_store():
+def _is_sharded(vector_store) -> bool:
+    # sharded_store를 아직 import하지 않았다면 ShardedVectorStore일 수 없다
+    module = sys.modules.get("sharded_store")
+    return module is not None and isinstance(vector_store, module.ShardedVectorStore)
+
+def backend_of(vector_store) -> str:
+    if _is_sharded(vector_store):
+        return "sharded"
+    return "numpy" if isinstance(vector_store, NumpyVectorStore) else "faiss"
+
+def _index_info(vector_store) -> Tuple[Optional[int], int, str]:
+    """(차원, 벡터 수, 거리) — 백엔드 무관"""
+    if (isinstance(vector_store, NumpyVectorStore) or _is_sharded(vector_store)):
+        return vector_store.dim, vector_store.ntotal, vector_store.distance
+    index = vector_store.index
+    return int(index.d), int(index.ntotal), vector_store.distance_strategy.value.lower()
+
+def iter_documents(vector_store) -> List[Tuple[str, Document]]:
+    """(docstore ID, Document) 목록 복사본 — 백엔드 무관"""
+    docstore = vector_store.docstore
+    if hasattr(docstore, "items"):
+        return list(docstore.items())
+    # LangChain InMemoryDocstore는 순회 API가 없다
+    return list(docstore._dict.items())
+
+def _tag(vector_store, version: str, model_name: str):
+    """스토어가 어느 버전 디렉터리/임베딩 모델에 속하는지 기록 (저장 위치와 사연 임베딩에 사용)"""
+    vector_store.index_version = version
+    vector_store.embedding_model = model_name
+    return vector_store
+
+def create_empty_vector_store(model_name: Optional[str] = None, backend: Optional[str] = None):
+    """빈 스토어 생성. FAISS는 빈 상태로 만들 수 없어 더미 문서 1개를 넣는다 (sharded는 샤드를 첫 추가 때 만든다)."""
+    backend = backend or VECTOR_BACKEND
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"지원하지 않는 VECTOR_BACKEND: {backend} (가능: {', '.join(VECTOR_BACKENDS)})")
+    if backend == "numpy":
+        return NumpyVectorStore(_get_embeddings(model_name))
+    if backend == "sharded":
+        from sharded_store import ShardedVectorStore
+        return ShardedVectorStore(_get_embeddings(model_name))
+
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    return FAISS.from_texts(
+        ["__DUMMY__INITIAL__ENTRY__"],
+        _get_embeddings(model_name),
+        distance_strategy=DistanceStrategy.COSINE,  # 코사인 고정
+        metadatas=[{"is_dummy": True}]
+    )
+
+def _load(path: str, manifest: dict, model_name: str):
+    if manifest.get("backend", "faiss") == "numpy":
+        return NumpyVectorStore.load_local(path, _get_embeddings(model_name))
+    if manifest.get("backend") == "sharded":
+        from sharded_store import ShardedVectorStore
+        return ShardedVectorStore.load_local(path, _get_embeddings(model_name))
+
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+    from docstore import has_sqlite_docstore, load_faiss
+
+    # distance_strategy는 인덱스 파일에 저장되지 않으므로 매니페스트 값으로 복원
+    distance_strategy = DistanceStrategy(manifest.get("distance", "cosine").upper())
+    if has_sqlite_docstore(path):
+        # 문서 본문은 검색할 때 SQLite에서 읽는다 (index.pkl은 읽지 않음)
+        return load_faiss(path, _get_embeddings(model_name), distance_strategy)
+    print(f"⚠️ pickle docstore(index.pkl)를 통째로 로드합니다: {path} — 다음 저장 때 docs.sqlite로 바뀝니다 "
+          f"(바로 바꾸려면 python docstore.py migrate)")
+    return FAISS.load_local(path, _get_embeddings(model_name), allow_dangerous_deserialization=True,
+                            distance_strategy=distance_strategy)
+
+def initialize_vector_store(version: Optional[str] = None):
     """
-    디스크에서 FAISS 인덱스를 로드하고(있으면),
-    없으면 더미로 새로 만든 뒤 저장.
+    CURRENT가 가리키는 버전(또는 지정한 버전)의 인덱스를 로드하고,
+    없으면 EMBEDDING_MODEL / VECTOR_BACKEND로 새 버전을 만들어 저장한 뒤 CURRENT로 지정.
+    쿼리 임베딩은 항상 매니페스트에 기록된 모델을 쓴다 (EMBEDDING_MODEL과 다르면 경고만).
     """
-    emb = _get_embeddings()
-    if os.path.exists(PERSIST_DIR):
-        vs = FAISS.load_local(PERSIST_DIR, emb, allow_dangerous_deserialization=True)
-        print(f"FAISS 로드 완료 → {PERSIST_DIR}")
-    else:
-        _ensure_dir(PERSIST_DIR)
-        vs = FAISS.from_texts(
-            ["__DUMMY__INITIAL__ENTRY__"],
-            emb,
-            distance_strategy=DistanceStrategy.COSINE,  # 코사인 고정
-            metadatas=[{"is_dummy": True}]
-        )
-        vs.save_local(PERSIST_DIR)
-        print(f"FAISS 초기화(더미 포함) 및 저장 → {PERSIST_DIR}")
-    return vs
-
-def _remove_dummy_if_exists(vector_store: FAISS):
-    """더미 문서가 있으면 제거 (최초 1회만 필요)"""
+    version = version or current_version()
+    if version is None:
+        version = new_version_name(EMBEDDING_MODEL)
+        vs = _tag(create_empty_vector_store(EMBEDDING_MODEL), version, EMBEDDING_MODEL)
+        save_vector_store(vs)
+        switch_current(version)
+        print(f"벡터 스토어 초기화({VECTOR_BACKEND}) 및 저장 → {version_dir(version)}")
+        return vs
+
+    manifest = read_manifest(version)
+    model_name = manifest.get("model", EMBEDDING_MODEL)
+    backend = manifest.get("backend", "faiss")
+    path = version_dir(version)
+    vs = _load(path, manifest, model_name)
+    dim = _index_info(vs)[0]
+    if manifest.get("dim") and dim and manifest["dim"] != dim:
+        raise ValueError(f"인덱스 차원({dim})이 매니페스트({manifest['dim']})와 다릅니다: {path}")
+    if model_name != EMBEDDING_MODEL:
+        print(f"⚠️ 인덱스 모델({model_name})과 EMBEDDING_MODEL({EMBEDDING_MODEL})이 다릅니다. "
+              f"인덱스 모델로 검색합니다. 새 모델로 바꾸려면 마이그레이션을 실행하세요.")
+    if backend != VECTOR_BACKEND:
+        print(f"⚠️ 인덱스 백엔드({backend})와 VECTOR_BACKEND({VECTOR_BACKEND})가 다릅니다. "
+              f"인덱스 백엔드로 로드합니다. 바꾸려면 마이그레이션을 실행하세요.")
+    print(f"벡터 스토어 로드 완료 → {path} (version={version}, backend={backend}, model={model_name})")
+    return _tag(vs, version, model_name)
+
+def _remove_dummy_if_exists(vector_store):
+    """
+    더미 문서가 있으면 제거 (최초 1회만 필요).
+    더미는 FAISS 스토어를 만들 때 첫 행으로 들어가고 삭제는 행 순서를 유지하므로, 남아 있다면 항상 0번 행이다
+    → 전체 문서를 훑지 않고 0번 행 한 건만 확인하고, 확인한 스토어는 다시 보지 않는다.
+    """
+    if (isinstance(vector_store, NumpyVectorStore) or _is_sharded(vector_store)) or getattr(vector_store, "dummy_checked", False):
+        return vector_store
     try:
-        # FAISS 내부 docstore 접근 (LangChain 구조)
-        keys = list(vector_store.docstore._dict.keys())
-        to_delete = [k for k in keys
-                     if getattr(vector_store.docstore._dict[k], "metadata", {}).get("is_dummy")]
-        if to_delete:
-            for k in to_delete:
-                del vector_store.docstore._dict[k]
-            # 인덱스에서도 벡터 삭제
-            # 주의: LangChain의 FAISS는 내부적으로 index와 docstore를 따로 가집니다.
-            # 안전하게는 인덱스를 재구축하는 편이 확실합니다.
-            # 간단한 방법: 남은 문서로 재생성
-            remaining_docs = list(vector_store.docstore._dict.values())
-            texts = [d.page_content for d in remaining_docs]
-            metas = [d.metadata for d in remaining_docs]
-            emb = _get_embeddings()
-            new_vs = FAISS.from_texts(texts, emb,
-                                      distance_strategy=DistanceStrategy.COSINE,
-                                      metadatas=metas)
-            return new_vs
-    except Exception:
-        pass
+        first = vector_store.index_to_docstore_id.get(0) if vector_store.index.ntotal else None
+        doc = vector_store.docstore.search(first) if first is not None else None
+        if isinstance(doc, Document) and doc.metadata.get("is_dummy"):
+            # index/docstore/index_to_docstore_id를 함께 정리 (제자리 삭제라 호출측 참조가 그대로 유효)
+            vector_store.delete([first])
+        vector_store.dummy_checked = True
+    except Exception as e:
+        print(f"⚠️ 더미 제거 실패: {e}")
     return vector_store
 
-def save_vector_store(vector_store: FAISS):
-    _ensure_dir(PERSIST_DIR)
-    vector_store.save_local(PERSIST_DIR)
-    print(f"FAISS 저장 → {PERSIST_DIR}")
+def _docstore_kind(vector_store) -> str:
+    if _is_sharded(vector_store):
+        return "jsonl" if vector_store.shard_backend == "numpy" else "sqlite"
+    return "jsonl" if isinstance(vector_store, NumpyVectorStore) else "sqlite"
 
-def add_story_to_vector_store(vector_store: FAISS, story_content: str, story_id: str, persist: bool = True):
+def save_vector_store(vector_store):
+    """스토어가 속한 버전 디렉터리에 저장하고 매니페스트 갱신"""
+    version = getattr(vector_store, "index_version", None) or current_version() or LEGACY_VERSION
+    path = version_dir(version)
+    _ensure_dir(path)
+    if (isinstance(vector_store, NumpyVectorStore) or _is_sharded(vector_store)):
+        vector_store.save_local(path)  # sharded: 바뀐 샤드만
+    else:
+        from docstore import save_faiss
+        save_faiss(vector_store, path)  # index.<N>.faiss + docs.sqlite (pickle 없음)
+    dim, count, distance = _index_info(vector_store)
+    write_manifest(
+        version,
+        model=getattr(vector_store, "embedding_model", None) or read_manifest(version).get("model", EMBEDDING_MODEL),
+        dim=dim,
+        distance=distance,
+        doc_count=count,
+        backend=backend_of(vector_store),
+        docstore=_docstore_kind(vector_store),
+    )
+    print(f"벡터 스토어 저장 → {path}")
+
+def _story_passages(story_content: str, story_id: str):
+    """사연 → (texts, metadatas, ids). STORY_CHUNKING이면 문장 윈도우 패시지 (story_id로 부모 사연 연결)."""
+    sig = text_simhash(story_content)
+    added_at = datetime.now().isoformat(timespec="seconds")  # SHARD_PARTITION=time의 기간 샤드 기준
+    if STORY_CHUNKING:
+        passages = build_passages(story_content)
+        texts = [p["text"] for p in passages]
+        metadatas = [{"story_id": story_id, "added_at": added_at, "passage_idx": i,
+                      "passage_count": len(passages), "sent_start": p["sent_start"], "sent_end": p["sent_end"]}
+                     for i, p in enumerate(passages)]
+        ids = [passage_doc_id(story_id, i) for i in range(len(passages))]
+    else:
+        texts = [story_content]
+        metadatas = [{"story_id": story_id, "added_at": added_at}]
+        ids = None
+    if sig is not None:  # 빈 텍스트는 서명 없이 (모두 같은 서명이 되어 서로 중복으로 잡히지 않게)
+        for m in metadatas:
+            m["simhash"] = f"{sig:016x}"
+    return texts, metadatas, ids
+
+def _insert_story(vector_store, story_content: str, story_id: str, passages, embeddings) -> str:
+    """임베딩된 사연 1건을 중복 확인 후 추가(또는 병합). 중복 거절이면 DuplicateStoryError."""
+    texts, metadatas, ids = passages
+    if DEDUP_MODE != "off":
+        dup = find_near_duplicate(vector_store, story_content, embeddings)
+        if dup is not None:
+            existing, similarity = dup
+            existing_id = existing.metadata.get("story_id", "")
+            if DEDUP_MODE == "reject":
+                print(f"🔁 중복 사연 거절 (ID: {story_id} ≈ {existing_id}, similarity={similarity:.3f})")
+                raise DuplicateStoryError(existing_id, similarity)
+            merge_duplicate(existing, story_id, vector_store.docstore)
+            print(f"🔁 중복 사연 병합 (ID: {story_id} → {existing_id}, similarity={similarity:.3f})")
+            return existing_id
+
+    added = vector_store.add_embeddings(list(zip(texts, embeddings)), metadatas=metadatas, ids=ids)
+    remember_story(vector_store, added[0], metadatas[0], len(added))
+    print(f"사연 (ID: {story_id})이 벡터 스토어에 추가되었습니다. (패시지 {len(texts)}개)")
+    return story_id
+
+def add_stories_to_vector_store(vector_store, stories: List[Tuple[str, str]],
+                                persist: bool = True) -> List[Union[str, Exception]]:
     """
-    사연을 벡터 스토어에 추가하고, persist=True면 즉시 디스크에도 저장.
+    여러 사연 (본문, story_id)을 한 번의 임베딩 호출로 추가하고, persist=True면 마지막에 한 번만 저장.
+    중복 확인은 사연 순서대로 하므로 같은 배치 안의 중복도 걸러진다.
+    반환: 사연별 저장된 story_id (병합 시 기존 사연의 ID), 중복 거절이면 DuplicateStoryError,
+    추가 중 오류면 그 예외 (한 사연이 실패해도 앞뒤 사연은 그대로 추가된다)
     """
-    document = Document(page_content=story_content, metadata={"story_id": story_id})
-    vector_store.add_documents([document])
+    prepared = [_story_passages(content, story_id) for content, story_id in stories]
+    # 스토어를 만든 모델로 임베딩 (EMBEDDING_MODEL이 바뀌어도 섞이지 않게)
+    all_texts = [t for texts, _, _ in prepared for t in texts]
+    vectors = _get_embeddings(getattr(vector_store, "embedding_model", None)).embed_documents(all_texts)
 
-    new_vs = _remove_dummy_if_exists(vector_store)
+    results: List[Union[str, Exception]] = []
+    offset = 0
+    for (content, story_id), passages in zip(stories, prepared):
+        embeddings = vectors[offset:offset + len(passages[0])]
+        offset += len(passages[0])
+        try:
+            results.append(_insert_story(vector_store, content, story_id, passages, embeddings))
+        except DuplicateStoryError as e:
+            results.append(e)
+        except Exception as e:
+            print(f"⚠️ 사연 추가 실패 (ID: {story_id}): {e}")
+            results.append(e)
 
-    if new_vs is not vector_store:
-        vector_store = new_vs  # 호출측이 참조를 유지한다면 반환값으로 돌려주는 것도 방법
+    if any(isinstance(r, str) for r in results):
+        _remove_dummy_if_exists(vector_store)
+        if persist:
+            save_vector_store(vector_store)
+    return results
 
-    if persist:
-        save_vector_store(vector_store)
-    print(f"사연 (ID: {story_id})이 벡터 스토어에 추가되었습니다. (persist={persist})")
+def add_story_to_vector_store(vector_store, story_content: str, story_id: str, persist: bool = True):
+    """
+    사연 1건 추가 (add_stories_to_vector_store 참고). persist=True면 즉시 디스크에도 저장.
+    기존 사연과 거의 같으면 DEDUP_MODE에 따라 거절(DuplicateStoryError)하거나 기존 사연에 병합.
+    반환: 사연이 저장된 story_id (병합 시 기존 사연의 ID)
+    """
+    result = add_stories_to_vector_store(vector_store, [(story_content, story_id)], persist=persist)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
 
-def get_retriever(vector_store: FAISS, k: int = 4, score_threshold: float = 0.7):
+def get_retriever(vector_store, k: int = 4, score_threshold: float = 0.7):
     """
     유사도 임계값 기반 리트리버 반환.
     """
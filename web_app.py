@@ -1,30 +1,72 @@
 # web_app.py
 import os
+import hmac
 import json
-import uuid
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from typing import List, Optional
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from vector_store import initialize_vector_store, add_story_to_vector_store
+from vector_store import VECTOR_BACKEND, VECTOR_BACKENDS, initialize_vector_store, save_vector_store
+from sharded_store import ShardedVectorStore
+from admission import AdmissionController, AdmissionRejected
+from ingest_queue import IngestQueue
+from profiler import PROFILE_FORMATS, PROFILER_MAX_SECONDS, SamplingProfiler
 from chain import get_conversational_chain
+from retriever import get_retriever_with_threshold
+from index_versions import EMBEDDING_MODEL, current_version, list_versions, read_manifest, switch_current
+from migration import INDEX_DUAL_READ, DualReader, MigrationJob, cutover, recent_queries
 
 # ===== 환경 변수 로드 =====
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("🚀 서버 시작 완료! 벡터 스토어와 체인은 첫 사용 시 자동으로 로드됩니다.")
+    yield
+    # 종료 전: 접수된 사연을 마저 적재하고 저장
+    await ingest_queue.flush()
+
+
 # ===== FastAPI 앱 =====
-app = FastAPI(title="연애 상담 챗봇")
+app = FastAPI(title="연애 상담 챗봇", lifespan=lifespan)
 
 # ===== 전역 인스턴스 =====
 vector_store = None
 conversation_chain = None
+migration_job = None
+dual_reader = None
+_background_tasks = set()
+_init_lock = threading.Lock()
+
+# ===== 관리자 =====
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # 비어 있으면 /admin/* 비활성화
+
+# ===== 부하 제어 =====
+chat_admission = AdmissionController(
+    "chat",
+    initial_limit=int(os.getenv("CHAT_MAX_CONCURRENCY", "16")),
+    max_limit=int(os.getenv("CHAT_MAX_CONCURRENCY_CAP", "64")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "10")),
+    target_latency=float(os.getenv("CHAT_TARGET_LATENCY", "8")),
+)
+# 사연 추가는 요청에서 바로 돌려주고 워커 하나가 배치로 적재 (대기열이 가득 차면 429)
+ingest_queue = IngestQueue(lambda: vector_store)
+
+# ===== 프로파일러 (/admin/profile) =====
+profiler = SamplingProfiler()
 
 # ===== 경로/로그 =====
 LOG_DIR = "logs"
 CHAT_LOG_FILE = os.path.join(LOG_DIR, "chat_log.json")
 os.makedirs(LOG_DIR, exist_ok=True)
+_chat_log_lock = threading.Lock()
 
 
 # ===== 요청 모델 =====
@@ -36,14 +78,78 @@ class StoryRequest(BaseModel):
     content: str
 
 
+class MigrateRequest(BaseModel):
+    model: Optional[str] = None
+    backend: Optional[str] = None
+
+
+class CompareRequest(BaseModel):
+    queries: List[str] = []
+    limit: int = 20
+
+
+class SwitchRequest(BaseModel):
+    version: Optional[str] = None
+
+
+class ProfileRequest(BaseModel):
+    seconds: float = 10.0
+    request_percent: Optional[float] = None  # 지정하면 /chat 요청 중 이 비율만 골라 처리 중일 때만 샘플링
+    interval_ms: float = 5.0
+    stall_ms: float = 100.0                  # 이벤트 루프가 이만큼 멈추면 막고 있는 스택 기록
+    include_idle: bool = False
+    format: str = "json"                     # json | collapsed (flamegraph 입력 그대로)
+
+
 # ===== 유틸: 체인/벡터스토어 지연 초기화 =====
 def ensure_initialized():
     """vector_store / conversation_chain을 최초 사용 시 초기화"""
     global vector_store, conversation_chain
-    if vector_store is None:
-        vector_store = initialize_vector_store()
-    if conversation_chain is None:
-        conversation_chain = get_conversational_chain(vector_store)
+    with _init_lock:
+        if vector_store is None:
+            vector_store = initialize_vector_store()
+        if conversation_chain is None:
+            conversation_chain = get_conversational_chain(vector_store)
+
+
+async def ensure_initialized_async():
+    """첫 요청의 인덱스 로드/체인 생성은 블로킹이라 스레드에서 (그동안 다른 요청은 계속 처리)"""
+    if vector_store is None or conversation_chain is None:
+        await asyncio.get_running_loop().run_in_executor(None, ensure_initialized)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """X-Admin-Token 헤더 확인 (ADMIN_TOKEN 미설정 시 관리자 기능 자체를 숨김)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="관리자 토큰이 올바르지 않습니다.")
+
+
+def get_dual_reader():
+    """새 버전 빌드가 끝났고 아직 전환 전이면 서빙/후보 인덱스 비교기 반환"""
+    global dual_reader
+    if migration_job is None or migration_job.status != "ready":
+        return None
+    if dual_reader is None or dual_reader.candidate.vector_store is not migration_job.target:
+        dual_reader = DualReader(conversation_chain.retriever, get_retriever_with_threshold(migration_job.target))
+    return dual_reader
+
+
+async def shadow_compare(message: str):
+    """응답과 무관하게 후보 인덱스로도 검색해 겹침 기록 (실패해도 무시)"""
+    try:
+        await dual_reader.compare(message)
+    except Exception as e:
+        print(f"⚠️ dual-read 비교 실패: {e}")
+
+
+def use_vector_store(new_store):
+    """서빙 스토어 교체. 진행 중인 요청은 이전 리트리버로 끝까지 처리된다."""
+    global vector_store, dual_reader
+    vector_store = new_store
+    conversation_chain.retriever = get_retriever_with_threshold(new_store)
+    dual_reader = None
 
 
 def serialize_sources(source_documents):
@@ -67,8 +173,14 @@ def serialize_sources(source_documents):
     return safe
 
 
+def rejected_response(e: AdmissionRejected, payload: dict) -> JSONResponse:
+    """포화 시 429/503 + Retry-After"""
+    print(f"⛔ {e.reason} (status={e.status_code}, retry_after={e.retry_after}s)")
+    return JSONResponse(payload, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+
+
 def log_interaction(user_input: str, ai_response: str, retrieved_sources: list = None):
-    """대화/응답/출처 로그 저장(JSON)"""
+    """대화/응답/출처 로그 저장(JSON). 파일 전체를 다시 쓰므로 이벤트 루프가 아닌 실행기에서 호출."""
     entry = {
         "timestamp": datetime.now().isoformat(),
         "user_input": user_input,
@@ -81,8 +193,8 @@ def log_interaction(user_input: str, ai_response: str, retrieved_sources: list =
         with open(CHAT_LOG_FILE, "w", encoding="utf-8") as f:
             json.dump([], f, ensure_ascii=False)
 
-    # 안전하게 읽고 덮어쓰기
-    with open(CHAT_LOG_FILE, "r+", encoding="utf-8") as f:
+    # 안전하게 읽고 덮어쓰기 (동시에 여러 스레드가 쓰지 않도록 잠금)
+    with _chat_log_lock, open(CHAT_LOG_FILE, "r+", encoding="utf-8") as f:
         try:
             content = f.read()
             logs = json.loads(content) if content else []
@@ -94,12 +206,6 @@ def log_interaction(user_input: str, ai_response: str, retrieved_sources: list =
         f.truncate()
 
 
-# ===== 서버 시작 메시지 =====
-@app.on_event("startup")
-async def startup_event():
-    print("🚀 서버 시작 완료! 벡터 스토어와 체인은 첫 사용 시 자동으로 로드됩니다.")
-
-
 # ===== HTML =====
 @app.get("/", response_class=HTMLResponse)
 async def get_home():
@@ -315,7 +421,11 @@ async function sendMessage(){
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify(payload)
         });
-        const data = await res.json();
+        let data = await res.json();
+
+        if(isStoryMode && res.status === 202 && data.job_id){
+            data = await waitForJob(data);
+        }
         removeTypingIndicator(typingId);
 
         if(isStoryMode){
@@ -332,6 +442,18 @@ async function sendMessage(){
     }
 }
 
+// 사연 적재는 백그라운드에서 진행되므로 검색에 반영될 때까지(최대 약 30초) 상태를 확인
+async function waitForJob(job){
+    for(let i = 0; i < 60; i++){
+        if(!['queued', 'embedding'].includes(job.status)) return job;
+        await new Promise(r => setTimeout(r, 500));
+        const res = await fetch(`/jobs/${job.job_id}`);
+        if(!res.ok) return job;
+        job = await res.json();
+    }
+    return job;
+}
+
 async function clearMemory(){
     if(!confirm('대화 기록을 초기화하시겠습니까?')) return;
     try{
@@ -361,18 +483,34 @@ async function clearMemory(){
 async def chat(request: ChatRequest):
     """채팅 메시지 처리"""
     try:
-        ensure_initialized()
-        response = await conversation_chain.ainvoke({"input": request.message})
-
-        # 체인 구현에 따라 키가 다를 수 있어 대비
-        ai_message = response.get("output", "") or response.get("answer", "") or ""
-        source_documents = response.get("source_documents", [])
-        sources_text = serialize_sources(source_documents)
-
-        # 로그 (문자열만)
-        log_interaction(request.message, ai_message, sources_text)
-
-        return JSONResponse({"response": ai_message, "sources": sources_text})
+        # 초기화는 동시 실행 슬롯을 잡기 전에 (첫 로드가 슬롯을 붙잡고 있지 않도록)
+        await ensure_initialized_async()
+        async with chat_admission.slot():
+            with profiler.track_request():
+                response = await conversation_chain.ainvoke({"input": request.message})
+
+            # 체인 구현에 따라 키가 다를 수 있어 대비
+            ai_message = response.get("output", "") or response.get("answer", "") or ""
+            source_documents = response.get("source_documents", [])
+            sources_text = serialize_sources(source_documents)
+            degraded = response.get("degraded", [])
+
+            # 로그 (문자열만). 슬롯 안에서 루프를 막으면 동시 실행 한도가 제 역할을 못 하므로 스레드에서
+            await asyncio.get_running_loop().run_in_executor(
+                None, log_interaction, request.message, ai_message, sources_text)
+
+            # 컷오버 전 비교: 같은 질문을 후보 인덱스로도 검색 (응답 경로 밖)
+            if INDEX_DUAL_READ and get_dual_reader() is not None:
+                task = asyncio.create_task(shadow_compare(request.message))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+
+            return JSONResponse({"response": ai_message, "sources": sources_text, "degraded": degraded})
+    except AdmissionRejected as e:
+        return rejected_response(e, {
+            "response": "지금 상담 요청이 많아 잠시 후 다시 시도해 주세요. 🙏",
+            "sources": []
+        })
     except Exception as e:
         print(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -380,21 +518,179 @@ async def chat(request: ChatRequest):
 
 @app.post("/add-story")
 async def add_story(request: StoryRequest):
-    """사연 추가"""
+    """사연 접수 (202). 임베딩/중복 확인/저장은 대기열 워커가 하고, 결과는 /jobs/{job_id}로 확인"""
     try:
-        ensure_initialized()
-        story_id = str(uuid.uuid4())
-        add_story_to_vector_store(vector_store, request.content, story_id, persist=True)
-        
-        return JSONResponse({
-            "message": f"사연이 성공적으로 추가되었습니다! 🎉\n(ID: {story_id[:8]}...)",
-            "story_id": story_id
-        })
+        await ensure_initialized_async()
+        job = ingest_queue.submit(request.content)
+        return JSONResponse(job.to_dict(), status_code=202)
+    except AdmissionRejected as e:
+        return rejected_response(e, {"message": "지금 사연 등록이 몰려 있어요. 잠시 후 다시 시도해 주세요. 🙏"})
     except Exception as e:
         print(f"Add story error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """사연 적재 상태: queued → embedding → searchable → done (또는 duplicate / failed)"""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return JSONResponse({"message": "없거나 오래되어 정리된 작업입니다."}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+@app.get("/stats")
+async def stats():
+    """부하 제어/사연 적재/검색/single-flight 통계"""
+    admission = {"chat": chat_admission.stats()}
+    ingest = ingest_queue.stats()
+    if conversation_chain is None:
+        return JSONResponse({"initialized": False, "admission": admission, "ingest": ingest})
+    return JSONResponse({"initialized": True, "admission": admission, "ingest": ingest,
+                         **conversation_chain.get_stats()})
+
+
+@app.get("/admin/index", dependencies=[Depends(require_admin)])
+async def index_status():
+    """인덱스 버전/매니페스트, 마이그레이션 진행 상황, dual-read 비교 결과"""
+    reader = get_dual_reader() if conversation_chain is not None else None
+    return JSONResponse({
+        "current": current_version(),
+        "embedding_model": EMBEDDING_MODEL,
+        "versions": [read_manifest(v) for v in list_versions()],
+        "migration": migration_job.progress() if migration_job else None,
+        "dual_read": reader.stats() if reader else None,
+    })
+
+
+@app.post("/admin/index/migrate", dependencies=[Depends(require_admin)])
+async def start_migration(request: MigrateRequest):
+    """현재 인덱스를 새 임베딩 모델(/백엔드)로 백그라운드 재빌드 (서빙은 기존 인덱스 유지)"""
+    global migration_job
+    ensure_initialized()
+    if migration_job is not None and migration_job.status in ("pending", "building"):
+        return JSONResponse({"message": "이미 진행 중인 마이그레이션이 있습니다.",
+                             "migration": migration_job.progress()}, status_code=409)
+    if request.backend and request.backend not in VECTOR_BACKENDS:
+        return JSONResponse({"message": f"지원하지 않는 백엔드입니다: {request.backend}"}, status_code=400)
+    migration_job = MigrationJob(vector_store, request.model or EMBEDDING_MODEL,
+                                 backend=request.backend or VECTOR_BACKEND).start()
+    return JSONResponse({"message": "마이그레이션을 시작했습니다.", "migration": migration_job.progress()},
+                        status_code=202)
+
+
+@app.post("/admin/index/compare", dependencies=[Depends(require_admin)])
+async def compare_indexes(request: CompareRequest):
+    """주어진 질문(없으면 최근 대화 로그)으로 서빙/후보 인덱스 검색 결과 비교"""
+    ensure_initialized()
+    reader = get_dual_reader()
+    if reader is None:
+        return JSONResponse({"message": "비교할 후보 인덱스가 없습니다."}, status_code=409)
+    queries = request.queries or recent_queries(request.limit)
+    results = [await reader.compare(q) for q in queries]
+    return JSONResponse({"results": results, "summary": {k: v for k, v in reader.stats().items() if k != "recent"}})
+
+
+@app.post("/admin/index/switch", dependencies=[Depends(require_admin)])
+async def switch_index(request: SwitchRequest):
+    """
+    version 미지정: 빌드된 새 버전으로 컷오버.
+    version 지정: 해당 버전으로 전환 (롤백). 전환 이후 추가된 사연은 이전 버전에 없다.
+    """
+    ensure_initialized()
+    if request.version is None and migration_job is None:
+        return JSONResponse({"message": "전환할 마이그레이션이 없습니다."}, status_code=409)
+    if request.version is not None and request.version not in list_versions():
+        return JSONResponse({"message": f"없는 버전입니다: {request.version}"}, status_code=404)
+
+    def switch():
+        # 사연 적재 워커와 겹치지 않게 write_lock 안에서 마지막 차이 반영 + 서빙 스토어 교체까지 끝낸다
+        if request.version is None:
+            new_store = cutover(migration_job)
+        else:
+            new_store = initialize_vector_store(request.version)
+            switch_current(request.version)
+        use_vector_store(new_store)
+
+    try:
+        await ingest_queue.run_exclusive(switch)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=409)
+    return JSONResponse({"message": "인덱스를 전환했습니다.", "current": current_version(),
+                         "manifest": read_manifest(current_version())})
+
+
+def _sharded_store() -> ShardedVectorStore:
+    ensure_initialized()
+    if not isinstance(vector_store, ShardedVectorStore):
+        raise HTTPException(status_code=409, detail="현재 인덱스가 sharded 백엔드가 아닙니다.")
+    return vector_store
+
+
+@app.get("/admin/index/shards", dependencies=[Depends(require_admin)])
+async def shard_status():
+    """샤드별 백엔드/문서 수/미저장 여부"""
+    store = _sharded_store()
+    return JSONResponse({"partition": store.partition, "shard_backend": store.shard_backend,
+                         "shards": store.shard_stats()})
+
+
+@app.post("/admin/index/shards/{name}/compact", dependencies=[Depends(require_admin)])
+async def compact_shard(name: str):
+    """샤드 하나만 새로 써서 삭제 흔적 정리 (다른 샤드는 그대로)"""
+    store = _sharded_store()
+
+    def compact():
+        store.compact_shard(name)
+        save_vector_store(store)
+
+    try:
+        await ingest_queue.run_exclusive(compact)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=404)
+    return JSONResponse({"message": "샤드를 압축했습니다.", "shards": store.shard_stats()})
+
+
+@app.delete("/admin/index/shards/{name}", dependencies=[Depends(require_admin)])
+async def drop_shard(name: str):
+    """샤드 하나와 그 사연을 삭제 (예: 보관 기간이 지난 time 샤드)"""
+    store = _sharded_store()
+
+    def drop():
+        dropped = store.drop_shard(name)
+        save_vector_store(store)
+        return dropped
+
+    try:
+        dropped = await ingest_queue.run_exclusive(drop)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=404)
+    return JSONResponse({"message": f"샤드를 삭제했습니다. (문서 {dropped}개)", "shards": store.shard_stats()})
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(request: ProfileRequest):
+    """
+    샘플링 프로파일러를 seconds초 동안 실행하고 collapsed 스택과 이벤트 루프 정지 목록을 반환.
+    format=collapsed면 flamegraph.pl / speedscope에 바로 넣을 수 있는 텍스트만 반환.
+    """
+    if profiler.running:
+        return JSONResponse({"message": "이미 프로파일링 중입니다."}, status_code=409)
+    if not 0 < request.seconds <= PROFILER_MAX_SECONDS:
+        return JSONResponse({"message": f"seconds는 0 초과 {PROFILER_MAX_SECONDS:g} 이하여야 합니다."}, status_code=400)
+    if request.request_percent is not None and not 0 < request.request_percent <= 100:
+        return JSONResponse({"message": "request_percent는 0 초과 100 이하여야 합니다."}, status_code=400)
+    if request.interval_ms <= 0 or request.stall_ms <= 0:
+        return JSONResponse({"message": "interval_ms와 stall_ms는 0보다 커야 합니다."}, status_code=400)
+    if request.format not in PROFILE_FORMATS:
+        return JSONResponse({"message": f"format은 {' | '.join(PROFILE_FORMATS)} 중 하나여야 합니다."}, status_code=400)
+    result = await profiler.run(request.seconds, interval_ms=request.interval_ms, stall_ms=request.stall_ms,
+                                request_percent=request.request_percent, include_idle=request.include_idle)
+    if request.format == "collapsed":
+        return PlainTextResponse(result["collapsed"] + "\n")
+    return JSONResponse(result)
+
+
 @app.post("/clear")
 async def clear_memory():
     """메모리 초기화"""